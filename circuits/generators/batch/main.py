@@ -0,0 +1,164 @@
+from typing import Dict, FrozenSet, List, Tuple
+import argparse
+import heapq
+import itertools
+import json
+import os
+import sys
+
+from generators.utils.cost import CostWeights, dispatch_constraints, load_weights
+from generators.utils.opcodes_gen import SIZES_LOG, load_sizes
+
+DEFAULT_BATCH_PATH = "./target/batch_sizes.json"
+
+# (spends indices, union of their size sets)
+Group = Tuple[List[int], FrozenSet[tuple]]
+
+
+def _group_seconds(group: Group, steps: int, compile_seconds: float,
+                   weights: CostWeights) -> float:
+    # one compile and the dispatch of the union at every step of every spend
+    spends, sizes = group
+    return compile_seconds + len(spends) * steps * \
+        weights.prove_seconds[1] * dispatch_constraints(sizes, weights)
+
+
+def plan_groups(spends: List[Dict], steps: int, compile_seconds: float,
+                weights: CostWeights) -> List[Group]:
+    """
+    Greedily merges the spends with the same size set and then the pair of
+    groups whose union saves the most compile plus prove time, as long as
+    a merge saves time. The savings of every pair are computed once and
+    kept in a heap, a merge only adds the pairs of the new group.
+    """
+    by_sizes: Dict[FrozenSet[tuple], List[int]] = {}
+    for i, spend in enumerate(spends):
+        by_sizes.setdefault(frozenset(map(tuple, spend["sizes"])), []).append(i)
+    # live groups and their seconds by id, merged groups get new ids
+    groups: Dict[int, Tuple[Group, float]] = {}
+    ids = itertools.count()
+    heap = []
+
+    def add(group: Group):
+        group_id = next(ids)
+        seconds = _group_seconds(group, steps, compile_seconds, weights)
+        for other_id, (other, other_seconds) in groups.items():
+            merged = (group[0] + other[0], group[1] | other[1])
+            merged_seconds = _group_seconds(merged, steps, compile_seconds,
+                                            weights)
+            saved = seconds + other_seconds - merged_seconds
+            if saved > 0:
+                heapq.heappush(heap, (-saved, other_id, group_id))
+        groups[group_id] = (group, seconds)
+
+    for sizes, indices in by_sizes.items():
+        add((indices, sizes))
+
+    while heap:
+        _, a, b = heapq.heappop(heap)
+        if a not in groups or b not in groups:
+            # one of the pair was merged already
+            continue
+        (a_spends, a_sizes), _ = groups.pop(a)
+        (b_spends, b_sizes), _ = groups.pop(b)
+        add((sorted(a_spends + b_spends), a_sizes | b_sizes))
+    return sorted((group for group, _ in groups.values()),
+                  key=lambda group: group[0][0])
+
+
+def report(spends: List[Dict], steps: int,
+           compile_seconds: float) -> List[str]:
+    weights = load_weights()
+    slope = weights.prove_seconds[1]
+    union = frozenset(tuple(e) for spend in spends for e in spend["sizes"])
+    union_dispatch = dispatch_constraints(union, weights)
+    own = [dispatch_constraints(map(tuple, spend["sizes"]), weights)
+           for spend in spends]
+    distinct = {frozenset(map(tuple, spend["sizes"])) for spend in spends}
+
+    per_spend = len(distinct) * compile_seconds + \
+        sum(own) * steps * slope
+    batch = compile_seconds + len(spends) * union_dispatch * steps * slope
+    mean_own = sum(own) / len(own)
+    lines = [
+        f"{len(spends)} spends, {len(distinct)} distinct size sets, "
+        f"{len(union)} sizes in the union",
+        f"Dispatch per step: ~{mean_own:.0f} constraints per spend on "
+        f"average, ~{union_dispatch} for the union "
+        f"({union_dispatch / max(mean_own, 1):.2f}x)",
+        f"Per-spend generation: {len(distinct)} compiles, "
+        f"~{per_spend:.0f}s of compile and dispatch proving",
+        f"Union generation: 1 compile, ~{batch:.0f}s of compile and "
+        f"dispatch proving",
+    ]
+
+    groups = plan_groups(spends, steps, compile_seconds, weights)
+    planned = sum(_group_seconds(group, steps, compile_seconds, weights)
+                  for group in groups)
+    lines.append(f"Suggested grouping: {len(groups)} batches, "
+                 f"~{planned:.0f}s")
+    for indices, sizes in groups:
+        lines.append(f"  spends {indices}: {len(sizes)} sizes, "
+                     f"~{dispatch_constraints(sizes, weights)} constraints "
+                     f"per step")
+    return lines
+
+
+def taproot_path(output: str) -> str:
+    """
+    Where the union of the taproot spends goes next to the other one
+    """
+    root, ext = os.path.splitext(output)
+    return f"{root}_taproot{ext}"
+
+
+def write_union(spends: List[Dict], taproot: bool, output: str):
+    union = sorted({tuple(e) for spend in spends for e in spend["sizes"]})
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"taproot": taproot, "spends": len(spends),
+                   "sizes": union}, f)
+    print(f"Size set of {len(spends)} spends written to {output}, "
+          f"set {output} as GENERATORS_BATCH_SIZES to generate with it")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="One generated.nr for a batch of spends")
+    parser.add_argument("command", choices=["union", "report"],
+                        help="union: write the size set covering the "
+                        "spends, report: growth of the union against "
+                        "per-spend generation")
+    parser.add_argument("--sizes", type=str, default=SIZES_LOG,
+                        help="size sets recorded by the generators")
+    parser.add_argument("--last", type=int, default=0,
+                        help="only the last N recorded spends")
+    parser.add_argument("--output", type=str, default=DEFAULT_BATCH_PATH,
+                        help="size set of the non-taproot spends, the "
+                        "taproot one gets a _taproot suffix")
+    parser.add_argument("--steps", type=int, default=16,
+                        help="execution loop steps of a spend")
+    parser.add_argument("--compile-seconds", type=float, default=60.0,
+                        help="time of one nargo compile and bb write_vk")
+    args = parser.parse_args()
+
+    spends = load_sizes(args.sizes)[-args.last:]
+    if not spends:
+        print(f"No spends recorded in {args.sizes}")
+        sys.exit(1)
+    # taproot and non-taproot spends can not share a generated.nr
+    by_kind: Dict[bool, List[Dict]] = {}
+    for spend in spends:
+        by_kind.setdefault(spend["taproot"], []).append(spend)
+
+    for taproot, kind in sorted(by_kind.items()):
+        if args.command == "union":
+            write_union(kind, taproot, taproot_path(args.output)
+                        if taproot else args.output)
+        else:
+            print(f"{'Taproot' if taproot else 'Non-taproot'} spends:")
+            print("\n".join(report(kind, args.steps, args.compile_seconds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+from collections import namedtuple
+from random import Random
+from typing import Dict, List
+import hashlib
+import json
+
+from generators.utils.tx import Transaction
+from generators.utils.tx_stream import record_to_bytes
+
+CORPUS_SEED = 20250101
+
+# generators that run without network access
+GENERATOR_TYPES = ["p2pk", "p2pkh", "p2ms", "p2sh", "p2sh_p2wpkh", "p2sh_p2wsh"]
+
+# transactions taken from the committed generator configs
+CONFIG_TRANSACTIONS = {
+    "legacy": "p2pk",
+    "segwit": "p2pkh",
+    "multisig": "p2ms",
+    "nested_segwit": "p2sh_p2wpkh",
+    "taproot_keypath": "p2tr",
+    "taproot_scriptpath": "p2tr_script",
+}
+
+HUGE_WITNESS_ITEMS = 400
+HUGE_WITNESS_ITEM_SIZE = 520
+
+BLOCK_HEADERS_COUNT = 1025
+
+OP_1 = 81
+OP_DROP = 117
+OP_SHA256 = 168
+
+ScriptCase = namedtuple(
+    'ScriptCase', ['script', 'tx', 'input_to_sign', 'stack', 'taproot'])
+
+
+def get_config(spend_type: str) -> Dict:
+    with open(f"./generators/{spend_type}/config.json", "r") as f:
+        return json.load(f)
+
+
+def build_transactions(seed: int = CORPUS_SEED) -> Dict[str, str]:
+    """
+    Returns hex encoded transactions by kind, the same seed always gives
+    the same corpus
+    """
+    txs = {kind: get_config(spend_type)["current_tx"]
+           for kind, spend_type in CONFIG_TRANSACTIONS.items()}
+    txs["huge_witness"] = _huge_witness_tx(Random(seed)).hex()
+    return txs
+
+
+def _huge_witness_tx(rng: Random) -> bytearray:
+    """
+    P2WSH spend that hashes every item of a HUGE_WITNESS_ITEMS deep
+    witness stack
+    """
+    items = [rng.randbytes(HUGE_WITNESS_ITEM_SIZE).hex()
+             for _ in range(HUGE_WITNESS_ITEMS)]
+    witness_script = _huge_witness_script()
+    return record_to_bytes({
+        "version": 2,
+        "locktime": 0,
+        "inputs": [{
+            "txid": rng.randbytes(32).hex(),
+            "output": 0,
+            "sigscript": "",
+            "sequence": 0xffffffff,
+            "witness": items + [witness_script.hex()],
+        }],
+        "outputs": [{
+            "value": rng.randrange(1, 21 * 10 ** 14),
+            "pkscript": "0020" + hashlib.sha256(witness_script).hexdigest(),
+        }],
+    })
+
+
+def _huge_witness_script() -> bytes:
+    return bytes([OP_SHA256, OP_DROP] * HUGE_WITNESS_ITEMS + [OP_1])
+
+
+def build_scripts(txs: Dict[str, str]) -> Dict[str, ScriptCase]:
+    """
+    Script analysis inputs mirroring the ones built by the generators
+    """
+    cases = {}
+
+    for name, spend_type in (("p2pk", "p2pk"), ("multisig", "p2ms")):
+        config = get_config(spend_type)
+        current_tx = Transaction(config["current_tx"])
+        current_tx.cut_script_sigs()
+        prev_tx = Transaction(config["prev_tx"])
+        vout = current_tx.inputs[config["input_to_sign"]].vout
+        script_pub_key = bytes(prev_tx.outputs[vout].script_pub_key)
+        cases[name] = ScriptCase(
+            config["script_sig"] + script_pub_key.hex(),
+            current_tx, config["input_to_sign"], [], False)
+
+    config = get_config("p2sh")
+    current_tx = Transaction(config["current_tx"])
+    current_tx.cut_script_sigs()
+    cases["p2wsh"] = ScriptCase(
+        current_tx.witness_to_hex_script(config["input_to_sign"]),
+        current_tx, config["input_to_sign"], [], False)
+
+    current_tx = Transaction(txs["taproot_scriptpath"])
+    current_tx.cut_script_sigs()
+    stack_items = current_tx.witness[0].stack_items
+    cases["tapscript"] = ScriptCase(
+        bytes(stack_items[-2].item).hex(), current_tx, 0,
+        [bytes(elem.item) for elem in stack_items[:-2]], True)
+
+    current_tx = Transaction(txs["huge_witness"])
+    stack_items = current_tx.witness[0].stack_items
+    cases["huge_witness"] = ScriptCase(
+        bytes(stack_items[-1].item).hex(), current_tx, 0,
+        [bytes(elem.item) for elem in stack_items[:-1]], False)
+
+    return cases
+
+
+def build_block_headers(count: int = BLOCK_HEADERS_COUNT,
+                        seed: int = CORPUS_SEED) -> List[str]:
+    """
+    Chain of random headers, every header links to the hash of the
+    previous one
+    """
+    rng = Random(seed)
+    headers = []
+    prev_hash = bytes(32)
+    timestamp = 1231006505
+    for _ in range(count):
+        header = (2).to_bytes(4, byteorder='little') + prev_hash + \
+            rng.randbytes(32) + timestamp.to_bytes(4, byteorder='little') + \
+            bytes.fromhex("ffff001d") + rng.randbytes(4)
+        headers.append(header.hex())
+        prev_hash = hashlib.sha256(hashlib.sha256(header).digest()).digest()
+        timestamp += 600
+    return headers
+
+
+def corpus_digest(txs: Dict[str, str], headers: List[str]) -> str:
+    """
+    Identifies the corpus in reports, results are only comparable when
+    the digests match
+    """
+    h = hashlib.sha256()
+    for kind in sorted(txs):
+        h.update(kind.encode())
+        h.update(bytes.fromhex(txs[kind]))
+    for header in headers:
+        h.update(bytes.fromhex(header))
+    return h.hexdigest()
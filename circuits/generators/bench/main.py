@@ -0,0 +1,303 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List
+import argparse
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from generators.bench import corpus
+from generators.blocks.block import Block, create_nargo_toml
+from generators.utils import opcodes_gen
+from generators.utils.analysis_store import STORE_ENV
+from generators.utils.artifacts import ARTIFACT_STORE_ENV
+from generators.utils.script import (
+    ANALYSIS_CACHE, Script, clear_caches, get_hashed_data_sizes)
+from generators.utils.tx import Transaction
+
+DEFAULT_OUTPUT_PATH = "./target/bench/results.json"
+DEFAULT_MIN_TIME = 0.2
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.1
+
+# setup() runs once in the measuring process and returns the measured call
+Benchmark = namedtuple('Benchmark', ['name', 'setup'])
+
+
+def get_benchmarks(workspace: str) -> List[Benchmark]:
+    """
+    workspace: scratch copy of the files the generators read and write,
+        so the benchmarks never touch the checked out circuits
+    """
+    txs = corpus.build_transactions()
+    scripts = corpus.build_scripts(txs)
+    headers = corpus.build_block_headers()
+
+    benchmarks = []
+    for kind, tx_hex in txs.items():
+        benchmarks += [
+            Benchmark(f"tx.parse_hex/{kind}",
+                      lambda tx_hex=tx_hex: lambda: Transaction(tx_hex)),
+            Benchmark(f"tx.parse_bytes/{kind}",
+                      lambda tx_hex=tx_hex: _parse_bytes(tx_hex)),
+            Benchmark(f"tx.to_hex/{kind}",
+                      lambda tx_hex=tx_hex: Transaction(tx_hex).to_hex),
+        ]
+
+    for name, case in scripts.items():
+        benchmarks += [
+            Benchmark(f"script.analyze/{name}",
+                      lambda case=case: lambda: Script(
+                          case.script, case.tx, case.input_to_sign,
+                          list(case.stack), cache=None)),
+            Benchmark(f"script.analyze_cached/{name}",
+                      lambda case=case: lambda: Script(
+                          case.script, case.tx, case.input_to_sign,
+                          list(case.stack))),
+            Benchmark(f"script.get_hashed_data_sizes/{name}",
+                      lambda case=case: _hashed_data_sizes(case)),
+            Benchmark(f"opcodes_gen.generate/{name}",
+                      lambda case=case: _generate(workspace, case)),
+        ]
+
+    benchmarks += [
+        Benchmark("block.get_block_hash",
+                  lambda: Block(headers[0]).get_block_hash),
+        Benchmark("block.create_nargo_toml",
+                  lambda: _create_nargo_toml(headers)),
+    ]
+
+    for spend_type in corpus.GENERATOR_TYPES:
+        benchmarks.append(Benchmark(
+            f"generator/{spend_type}",
+            lambda spend_type=spend_type: _generator(workspace, spend_type)))
+
+    return benchmarks
+
+
+def _parse_bytes(tx_hex: str) -> Callable:
+    raw = bytes.fromhex(tx_hex)
+    return lambda: Transaction(raw)
+
+
+def _hashed_data_sizes(case: corpus.ScriptCase) -> Callable:
+    script = bytes.fromhex(case.script)
+    return lambda: get_hashed_data_sizes(script, list(case.stack))
+
+
+def _generate(workspace: str, case: corpus.ScriptCase) -> Callable:
+    sizes = Script(case.script, case.tx, case.input_to_sign,
+                   list(case.stack)).sizes
+    return _in_workspace(workspace, lambda: opcodes_gen.generate(
+        sizes, case.taproot))
+
+
+def _create_nargo_toml(headers: List[str]) -> Callable:
+    blocks = [Block(header) for header in headers]
+    return lambda: create_nargo_toml(blocks, "blocks")
+
+
+def _generator(workspace: str, spend_type: str) -> Callable:
+    module = importlib.import_module(f"generators.{spend_type}.main")
+
+    def run():
+        # every run is measured as a fresh job
+        clear_caches()
+        module.main()
+    return _in_workspace(workspace, run)
+
+
+def _in_workspace(workspace: str, func: Callable) -> Callable:
+    def run():
+        cwd = os.getcwd()
+        os.chdir(workspace)
+        try:
+            with redirect_stdout(io.StringIO()):
+                func()
+        finally:
+            os.chdir(cwd)
+    return run
+
+
+def create_workspace(path: str):
+    """
+    Copies the templates and configs used by the offline generators
+    """
+    os.makedirs(os.path.join(path, "crates/script/src"), exist_ok=True)
+    shutil.copy("crates/script/src/generated.nr.template",
+                os.path.join(path, "crates/script/src/"))
+    for spend_type in corpus.GENERATOR_TYPES:
+        os.makedirs(os.path.join(path, f"app/{spend_type}/src"),
+                    exist_ok=True)
+        os.makedirs(os.path.join(path, f"generators/{spend_type}"),
+                    exist_ok=True)
+        shutil.copy(f"app/{spend_type}/Prover.toml.template",
+                    os.path.join(path, f"app/{spend_type}/"))
+        shutil.copy(f"app/{spend_type}/src/constants.nr.template",
+                    os.path.join(path, f"app/{spend_type}/src/"))
+        shutil.copy(f"generators/{spend_type}/config.json",
+                    os.path.join(path, f"generators/{spend_type}/"))
+
+
+def run_benchmark(name: str, workspace: str, min_time: float,
+                  repeat: int) -> Dict:
+    """
+    Times one benchmark, then runs it once more under tracemalloc to
+    count its allocations (tracing is too slow to be timed)
+    """
+    benchmarks = {b.name: b for b in get_benchmarks(workspace)}
+    func = benchmarks[name].setup()
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+    tracemalloc.start()
+    start_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func()
+    end_size, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "iterations": number,
+        "repeat": repeat,
+        "ops_per_sec": 1 / min(times),
+        "best_sec": min(times),
+        "median_sec": statistics.median(times),
+        "alloc_peak_bytes": peak_size - start_size,
+        "alloc_retained_bytes": end_size - start_size,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_isolated(name: str, workspace: str, min_time: float,
+                 repeat: int) -> Dict:
+    """
+    Each benchmark gets a fresh interpreter so that peak RSS (a process
+    high-water mark) belongs to that benchmark only
+    """
+    with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(
+            run_benchmark, name, workspace, min_time, repeat).result()
+
+
+def get_metadata() -> Dict:
+    txs = corpus.build_transactions()
+    headers = corpus.build_block_headers()
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "corpus_seed": corpus.CORPUS_SEED,
+        "corpus_digest": corpus.corpus_digest(txs, headers),
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """
+    Prints the ops/sec change of every benchmark and returns False if
+    any of them got slower than the threshold
+    """
+    if results["meta"]["corpus_digest"] != baseline["meta"]["corpus_digest"]:
+        print("Warning: baseline was measured on a different corpus")
+
+    baseline_results = {r["name"]: r for r in baseline["results"]}
+    ok = True
+    for result in results["results"]:
+        base = baseline_results.get(result["name"])
+        if base is None:
+            continue
+        change = result["ops_per_sec"] / base["ops_per_sec"] - 1
+        regression = change < -threshold
+        ok = ok and not regression
+        print(f"{result['name']:<50} {change:+8.1%}"
+              f"{'  REGRESSION' if regression else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the generator hot paths")
+    parser.add_argument("--output", type=str, default=DEFAULT_OUTPUT_PATH,
+                        help="JSON report path")
+    parser.add_argument("--filter", type=str, action="append", default=[],
+                        help="run only benchmarks containing this substring")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+                        help="minimal duration of one timed round, seconds")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="number of timed rounds")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="run every benchmark in this process")
+    parser.add_argument("--compare", type=str, required=False,
+                        help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="ops/sec drop reported as a regression")
+    parser.add_argument("--list", action="store_true",
+                        help="print benchmark names and exit")
+    args = parser.parse_args()
+
+    # stored analyses would make every generator run a warm job and the
+    # artifact store is not part of the generator hot path, the isolated
+    # benchmark processes inherit the environment
+    os.environ[STORE_ENV] = "0"
+    os.environ[ARTIFACT_STORE_ENV] = "0"
+    ANALYSIS_CACHE.store = None
+
+    with tempfile.TemporaryDirectory() as workspace:
+        create_workspace(workspace)
+        names = [b.name for b in get_benchmarks(workspace)
+                 if not args.filter or any(f in b.name for f in args.filter)]
+        if args.list:
+            print("\n".join(names))
+            return
+
+        run = run_benchmark if args.no_isolate else run_isolated
+        results = []
+        for name in names:
+            result = run(name, workspace, args.min_time, args.repeat)
+            print(f"{name:<50} {result['ops_per_sec']:>12.1f} ops/sec "
+                  f"{result['alloc_peak_bytes'] / 1024:>10.1f} KiB peak alloc "
+                  f"{result['peak_rss_kib'] / 1024:>8.1f} MiB RSS")
+            results.append(result)
+
+    report = {"meta": get_metadata(), "results": results}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
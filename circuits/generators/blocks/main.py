@@ -2,6 +2,7 @@ import json
 from typing import Dict
 from generators.blocks.pullers import BlockHeaderPuller
 from generators.blocks.block import Block, create_nargo_toml
+from generators.utils.profiling import Profiler
 import logging
 import sys
 import subprocess
@@ -65,9 +66,13 @@ def save_batch_info(batch_idx: int, is_start: bool):
 
 def main():
     setup_logging()
+    profiler = Profiler.from_env("blocks")
+    profiler.stage("config")
 
     parser = argparse.ArgumentParser(description="Prove the validity of the Bitcoin block header chain")
     parser.add_argument("--config", type=str, required=False, help="config file path", default="generators/blocks/config.json")
+    parser.add_argument("--profile", action="store_true", help="write a stage timing report to " + OUTPUT_DATA_PATH)
+    parser.add_argument("--cprofile", action="store_true", help="also dump cProfile stats")
     args = parser.parse_args()
 
     config = get_config(args.config if args.config is not None else DEFAULT_CONFIG_PATH)
@@ -83,6 +88,7 @@ def main():
 
     merkle_root_state_len = math.ceil(math.log(blocks_amount / 1024, 2)) + 1
 
+    profiler.stage("write")
     with open(RECURSIVE_BASE_APP_PATH + "src/constants.nr", "w") as f:
         f.write(f"pub global MERKLE_ROOT_ARRAY_LEN: u32 = {merkle_root_state_len};")
 
@@ -95,17 +101,21 @@ pub global PUBLIC_INPUTS: u32 = {47 + 32 * merkle_root_state_len};
 pub global MERKLE_ROOT_ARRAY_LEN: u32 = {merkle_root_state_len};
 """)
 
+    profiler.stage("fetch")
     puller = BlockHeaderPuller(config["gateway"])
     hex_headers = puller.pull_block_headers(
         config["blocks"]["start"], config["blocks"]["count"])
+    profiler.stage("parse")
     blocks = [Block(header) for header in hex_headers]
     b = Block("0" * 160)
     blocks.append(b)
 
     if not checkpoint:
+        profiler.stage("render")
         nargo_toml = create_nargo_toml(blocks[index:1025], "blocks")
         index += 1024
 
+        profiler.stage("write")
         with open(RECURSIVE_BASE_APP_PATH + "Prover.toml", "w") as f:
             f.write(
                 f"last_block_hash = [{', '.join(
@@ -113,6 +123,7 @@ pub global MERKLE_ROOT_ARRAY_LEN: u32 = {merkle_root_state_len};
                 )}]\n\n")
             f.write(nargo_toml)
 
+        profiler.stage("prove")
         logging.debug("nargo execute (base)")
         subprocess.run(['nargo', 'execute', '--package', 'recursive_base'], check=True)
 
@@ -210,9 +221,11 @@ pub global MERKLE_ROOT_ARRAY_LEN: u32 = {merkle_root_state_len};
             logging.debug("You can use checkpoint from this moment...")
 
         logging.debug(f"Prooving blocks from {index} to {index + 1024}")
+        profiler.stage("render")
         nargo_toml = create_nargo_toml(blocks[index:(index + 1025)], "blocks")
         index += 1024
 
+        profiler.stage("write")
         with open(RECURSIVE_APP_PATH + "Prover.toml", "w") as f:
             f.write(f"last_block_hash = [{', '.join(
                 f'"{elem}"' for elem in bytes.fromhex(
@@ -232,6 +245,7 @@ pub global MERKLE_ROOT_ARRAY_LEN: u32 = {merkle_root_state_len};
                 pi_array[-(1 + 32 * merkle_root_state_len):-1])}\n\n")
             f.write(nargo_toml)
 
+        profiler.stage("prove")
         logging.debug("nargo execute (recursive)")
         subprocess.run(['nargo', 'execute', '--package', 'recursive'], check=True)
 
@@ -300,6 +314,7 @@ pub global MERKLE_ROOT_ARRAY_LEN: u32 = {merkle_root_state_len};
                     '-o', RECURSIVE_OUTPUT_PATH + 'Verifier.sol'],
                    check=True)
 
+    profiler.finish(OUTPUT_DATA_PATH)
     print("Recursive proof was created successfully")
 
 
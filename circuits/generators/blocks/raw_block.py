@@ -0,0 +1,63 @@
+from collections import namedtuple
+from typing import Iterator
+import mmap
+
+from generators.blocks.block import Block, BLOCK_HEADER_SIZE
+from generators.utils.tx import BytesLike, Transaction, _read_compact_size
+
+BlockTransaction = namedtuple(
+    'BlockTransaction', ['index', 'offset', 'size', 'txid', 'tx'])
+
+
+class RawBlockReader:
+    """
+    Iterates over the transactions of a raw serialized block.
+
+    Transactions are parsed one by one as zero-copy views into the block
+    buffer, nothing is hex-decoded and only the transaction that is being
+    yielded is kept alive by the reader.
+    """
+
+    def __init__(self, data: BytesLike):
+        self._mmap = data if isinstance(data, mmap.mmap) else None
+        self._view = memoryview(data)
+        self._raw = self._view.cast('B')
+        self.header = Block(self._raw[:BLOCK_HEADER_SIZE].hex())
+        self.tx_count, self._first_tx_pos = _read_compact_size(
+            self._raw, BLOCK_HEADER_SIZE)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RawBlockReader':
+        """
+        path: file with the raw (binary) block, it is mapped into memory
+        """
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self) -> int:
+        return self.tx_count
+
+    def __iter__(self) -> Iterator[BlockTransaction]:
+        cur_pos = self._first_tx_pos
+        for index in range(self.tx_count):
+            tx = Transaction(self._raw[cur_pos:])
+            size = tx.layout.size
+            yield BlockTransaction(index, cur_pos, size, tx.txid, tx)
+            cur_pos += size
+
+    def close(self):
+        """
+        Releases the block buffer, all yielded transactions must be
+        released before closing a file-backed reader
+        """
+        self._raw.release()
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> 'RawBlockReader':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
@@ -0,0 +1,153 @@
+from collections import defaultdict
+from typing import Dict, List
+import argparse
+import json
+import os
+import sys
+
+from generators.utils.buckets import (
+    BUCKETED, DEFAULT_CLASSES_PATH, DEFAULT_SHAPES_PATH, Buckets, load_shapes)
+from generators.utils.cost import load_weights
+
+OPCODE_COUNTS = ("opcodesCount", "redeemOpcodesCount",
+                 "redeemScriptOpcodesCount", "scriptOpcodesCount")
+WITNESS_STACKS = ("currentTxMaxWitnessStackSize", "prevTxMaxWitnessStackSize")
+
+
+def learn(shapes: List[Dict], classes: int) -> Dict[str, List[int]]:
+    """
+    Size classes of every bounded constant at the quantiles of the
+    recorded values, so each class holds about the same number of jobs
+    """
+    values = defaultdict(list)
+    for job in shapes:
+        for name, value in job["constants"].items():
+            if name in BUCKETED and value > 0:
+                values[name].append(value)
+    learned = {}
+    for name, seen in sorted(values.items()):
+        seen.sort()
+        bounds = {seen[-(-i * len(seen) // classes) - 1]
+                  for i in range(1, classes + 1)}
+        learned[name] = sorted(bounds)
+    return learned
+
+
+def padding_constraints(exact: Dict[str, int], padded: Dict[str, int],
+                        weights: Dict[str, float]) -> float:
+    """
+    Constraints the rounded bounds add: one execution step per extra
+    opcode or witness stack iteration and one stack byte per extra cell
+    of the stack array
+    """
+    steps = sum(padded.get(name, 0) - exact.get(name, 0)
+                for name in OPCODE_COUNTS + WITNESS_STACKS)
+    cells = (padded.get("stackSize", 0) * padded.get("maxStackElementSize", 0)
+             - exact.get("stackSize", 0) * exact.get("maxStackElementSize", 0))
+    return steps * weights.get("step", 0) + cells * weights.get("push_byte", 0)
+
+
+def _key(job: Dict, constants: Dict[str, int]):
+    return job.get("generated"), tuple(sorted(constants.items()))
+
+
+def _bounds_key(job: Dict, constants: Dict[str, int]):
+    # the shape if the transaction layout sizes were bucketed too
+    return _key(job, {name: value for name, value in constants.items()
+                      if name in BUCKETED})
+
+
+def report(shapes: List[Dict], buckets: Buckets,
+           compile_seconds: float) -> List[str]:
+    weights = load_weights()
+    slope = weights.prove_seconds[1]
+    lines = []
+    total_saved = total_overhead = 0.0
+    packages = defaultdict(list)
+    for job in shapes:
+        packages[job["package"]].append(job)
+
+    for package, jobs in sorted(packages.items()):
+        exact_shapes, bucketed_shapes, bounds_shapes = set(), set(), set()
+        padding = defaultdict(int)
+        extra = 0.0
+        for job in jobs:
+            constants = job["constants"]
+            padded = buckets.apply(constants)
+            exact_shapes.add(_key(job, constants))
+            bucketed_shapes.add(_key(job, padded))
+            bounds_shapes.add(_bounds_key(job, padded))
+            for name in BUCKETED & constants.keys():
+                padding[name] += padded[name] - constants[name]
+            extra += padding_constraints(constants, padded,
+                                         weights.constraints)
+        saved = (len(exact_shapes) - len(bucketed_shapes)) * compile_seconds
+        overhead = extra * slope
+        total_saved += saved
+        total_overhead += overhead
+        lines.append(
+            f"{package}: {len(jobs)} jobs, {len(exact_shapes)} exact shapes, "
+            f"{len(bucketed_shapes)} bucketed; ~{saved:.0f}s of compiles "
+            f"saved, ~{extra / len(jobs):.0f} constraints of padding per job "
+            f"(~{overhead:.1f}s of proving in total)")
+        if len(bounds_shapes) < len(bucketed_shapes):
+            lines.append(
+                f"  {len(bucketed_shapes)} bucketed shapes differ in the "
+                f"transaction layout, {len(bounds_shapes)} would remain if "
+                f"only the bounds differed")
+        for name, total in sorted(padding.items()):
+            if total:
+                lines.append(f"  {name}: +{total / len(jobs):.1f} per job")
+    lines.append("Only the bounds are bucketed, the transaction layout "
+                 "sizes stay exact: jobs whose transactions differ in "
+                 "layout never share a circuit")
+    lines.append(f"Total: ~{total_saved:.0f}s of compiles saved, "
+                 f"~{total_overhead:.1f}s of proving added, net "
+                 f"{round(total_saved - total_overhead):+d}s")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Size classes of the bounded circuit constants")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    learn_parser = commands.add_parser(
+        "learn", help="learn size classes from the recorded shapes")
+    learn_parser.add_argument("--shapes", type=str,
+                              default=DEFAULT_SHAPES_PATH)
+    learn_parser.add_argument("--classes", type=int, default=4,
+                              help="size classes per constant")
+    learn_parser.add_argument("--output", type=str,
+                              default=DEFAULT_CLASSES_PATH)
+
+    report_parser = commands.add_parser(
+        "report", help="padding overhead against compile time saved")
+    report_parser.add_argument("--shapes", type=str,
+                               default=DEFAULT_SHAPES_PATH)
+    report_parser.add_argument("--mode", type=str, default="pow2",
+                               help="pow2 or the path of learned classes")
+    report_parser.add_argument("--compile-seconds", type=float, default=60.0,
+                               help="time of one nargo compile and "
+                               "bb write_vk")
+    args = parser.parse_args()
+
+    shapes = load_shapes(args.shapes)
+    if not shapes:
+        print(f"No shapes recorded in {args.shapes}")
+        sys.exit(1)
+
+    if args.command == "learn":
+        classes = learn(shapes, args.classes)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"classes": classes, "jobs": len(shapes)}, f, indent=2)
+        print(f"Size classes learned from {len(shapes)} jobs written to "
+              f"{args.output}")
+    else:
+        buckets = Buckets.from_mode(args.mode)
+        print("\n".join(report(shapes, buckets, args.compile_seconds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from generators.cost.main import circuit_gates
+from generators.utils.straight_line import CODEGEN_ENV, CODEGEN_MODES
+
+DEFAULT_RESULTS_PATH = "./target/codegen_bench.jsonl"
+
+
+def _run(command: List[str], env: Dict[str, str]) -> bool:
+    try:
+        return subprocess.run(command, env=env).returncode == 0
+    except OSError as e:
+        print(f"{command[0]}: {e}", file=sys.stderr)
+        return False
+
+
+def bench_mode(package: str, mode: str) -> Optional[Dict]:
+    """
+    Generates the inputs of the package with the codegen mode, compiles and
+    executes the circuit and proves it, None if a step fails
+    """
+    env = dict(os.environ, **{CODEGEN_ENV: mode})
+    if not _run([sys.executable, "-m", f"generators.{package}.main"], env) \
+            or not _run(["nargo", "execute", "--package", package], env):
+        return None
+    os.makedirs(f"./target/{package}", exist_ok=True)
+    start = time.perf_counter()
+    if not _run(["bb", "prove", "-b", f"./target/{package}.json",
+                 "-w", f"./target/{package}.gz",
+                 "-o", f"./target/{package}"], env):
+        return None
+    return {
+        "package": package,
+        "mode": mode,
+        "recorded_at": time.time(),
+        "gates": circuit_gates(package),
+        "prove_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Straight-line code against the interpreter")
+    parser.add_argument("command", choices=["bench"],
+                        help="bench: gate count and proving time of the "
+                        "package in every codegen mode")
+    parser.add_argument("--package", type=str, required=True)
+    parser.add_argument("--output", type=str, default=DEFAULT_RESULTS_PATH)
+    args = parser.parse_args()
+
+    # the interpreter last, so the sources are left in the default mode
+    results = []
+    for mode in sorted(CODEGEN_MODES, key=lambda mode: mode == "interpreter"):
+        result = bench_mode(args.package, mode)
+        if result is None:
+            print(f"Benchmark of {args.package} in {mode} mode failed")
+            sys.exit(1)
+        results.append(result)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "a") as f:
+        for result in results:
+            f.write(json.dumps(result, sort_keys=True) + "\n")
+    by_mode = {result["mode"]: result for result in results}
+    for mode, result in by_mode.items():
+        print(f"{args.package} {mode}: {result['gates']} gates, "
+              f"{result['prove_seconds']}s")
+    interpreter, straight = by_mode["interpreter"], by_mode["straight_line"]
+    if interpreter["gates"] and straight["gates"]:
+        print(f"Straight-line code: "
+              f"{straight['gates'] / interpreter['gates']:.2f}x the gates, "
+              f"{straight['prove_seconds'] / interpreter['prove_seconds']:.2f}"
+              f"x the proving time")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,4 +2,9 @@ CONSTANTS_TEMPLATE = "/src/constants.nr.template"
 CONSTANTS_NR = "/src/constants.nr"
 
 PROVER_TEMPLATE = "/Prover.toml.template"
-PROVER_TOML = "/Prover.toml"
\ No newline at end of file
+PROVER_TOML = "/Prover.toml"
+
+PROFILE_JSON = "/profile.json"
+PROFILE_STATS = "/profile.prof"
+
+COST_JSON = "/cost.json"
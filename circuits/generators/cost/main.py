@@ -0,0 +1,117 @@
+from typing import List, Optional
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from generators.utils.cost import (
+    DEFAULT_RUNS_PATH, DEFAULT_WEIGHTS_PATH, CostVector, calibrate, estimate,
+    load_runs, load_weights, read_cost, record_run, save_weights)
+
+
+def circuit_gates(package: str) -> Optional[int]:
+    """
+    Gate count of the compiled circuit reported by `bb gates`, None if it
+    can not be read
+    """
+    try:
+        result = subprocess.run(
+            ["bb", "gates", "-b", f"./target/{package}.json"],
+            capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout)
+        return sum(function["circuit_size"]
+                   for function in report["functions"])
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError):
+        return None
+
+
+def record(package: str, command: List[str], runs_path: str) -> int:
+    """
+    Runs the proving command and records its wall time, peak memory and the
+    circuit gate count with the cost vector of the generated inputs. Nothing
+    is recorded if the generator wrote no cost.json (GENERATORS_COST unset).
+    """
+    start = time.perf_counter()
+    returncode = subprocess.run(command).returncode
+    seconds = time.perf_counter() - start
+    # kilobytes on Linux, the peak of the largest child so far
+    memory_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    if returncode != 0:
+        return returncode
+    cost = read_cost(f"app/{package}")
+    if cost is None:
+        return 0
+
+    run = {
+        "package": package,
+        "recorded_at": time.time(),
+        "features": cost.features,
+        "constraints": circuit_gates(package),
+        "prove_seconds": round(seconds, 3),
+        "memory_mb": round(memory_mb, 1),
+    }
+    record_run(run, runs_path)
+    predicted = estimate(cost)
+    print(f"Recorded {package}: {run['constraints']} gates (estimated "
+          f"{predicted.constraints}), {run['prove_seconds']}s (estimated "
+          f"{predicted.prove_seconds}s), {run['memory_mb']} MB (estimated "
+          f"{predicted.memory_mb} MB)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Proving cost estimates of the spend circuits")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser(
+        "record", help="run a proving command and record its cost")
+    record_parser.add_argument("--package", type=str, required=True)
+    record_parser.add_argument("--runs", type=str, default=DEFAULT_RUNS_PATH)
+    record_parser.add_argument("prove", nargs=argparse.REMAINDER,
+                               help="-- followed by the proving command")
+
+    calibrate_parser = commands.add_parser(
+        "calibrate", help="fit the weights to the recorded runs")
+    calibrate_parser.add_argument("--runs", type=str,
+                                  default=DEFAULT_RUNS_PATH)
+    calibrate_parser.add_argument("--output", type=str,
+                                  default=DEFAULT_WEIGHTS_PATH)
+
+    estimate_parser = commands.add_parser(
+        "estimate", help="estimate the cost of the generated inputs")
+    estimate_parser.add_argument("--package", type=str, required=True)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        command = args.prove[1:] if args.prove[:1] == ["--"] else args.prove
+        if not command:
+            parser.error("record: missing the proving command")
+        sys.exit(record(args.package, command, args.runs))
+    elif args.command == "calibrate":
+        runs = load_runs(args.runs)
+        if not runs:
+            print(f"No runs recorded in {args.runs}")
+            sys.exit(1)
+        weights = calibrate(runs)
+        save_weights(weights, args.output)
+        for run in runs:
+            if run.get("constraints"):
+                predicted = estimate(
+                    CostVector({}, run["features"]), weights)
+                print(f"{run['package']}: {run['constraints']} gates, "
+                      f"estimated {predicted.constraints}")
+        print(f"Weights fitted to {len(runs)} runs written to {args.output}")
+    else:
+        cost = read_cost(f"app/{args.package}")
+        if cost is None:
+            print(f"No cost.json in app/{args.package}, generate the inputs "
+                  f"with GENERATORS_COST=1")
+            sys.exit(1)
+        print(json.dumps(estimate(cost, load_weights())._asdict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
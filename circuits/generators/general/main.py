@@ -1,10 +1,14 @@
 import json
+import os
 import requests
 import sys
 import subprocess
 
 from typing import Dict
 from generators.utils.tx import Transaction
+from generators.utils.profiling import Profiler
+from generators.utils.preflight import PREFLIGHT_ENV, preflight, preflight_enabled
+from generators.utils.taproot_utils import get_outputs_from_inputs, get_spent_outputs
 from enum import Enum
 
 
@@ -25,14 +29,18 @@ def get_config(path: str = "./generators/general/config.json") -> Dict:
 
 
 def main():
+    profiler = Profiler.from_env("general")
+    profiler.stage("config")
     config = get_config()
 
+    profiler.stage("parse")
     currentTx = Transaction(config["tx"])
     input_to_sign = config["input_to_sign"]
 
     prevTxid = currentTx.inputs[input_to_sign].txid[::-1].hex()
     vout = currentTx.inputs[input_to_sign].vout
 
+    profiler.stage("fetch")
     response = requests.get(f"https://blockstream.info/api/tx/{prevTxid}/hex")
 
     if response.status_code == 200:
@@ -41,6 +49,7 @@ def main():
         print(f"Error: {response.status_code}")
         sys.exit()
 
+    profiler.stage("classify")
     script_pub_key = prevTx.outputs[vout].script_pub_key
 
     # Define spending type
@@ -100,6 +109,7 @@ def main():
                 case SpendType.P2TR_SCRIPT:
                     path = "p2tr_script"
 
+    profiler.stage("render")
     with open("generators/general/jsons_templates/" + json_name, "r") as file:
         templateJson = file.read()
 
@@ -111,10 +121,24 @@ def main():
         inputToSign=input_to_sign,
     )
 
+    env = None
+    if preflight_enabled():
+        profiler.stage("preflight")
+        prevouts = None
+        if json_name == "p2tr.template":
+            prevouts = get_spent_outputs(*get_outputs_from_inputs(currentTx))
+        preflight(json.loads(jsonFile), prevouts)
+        # already verified, the spend generator does not repeat it
+        env = dict(os.environ, **{PREFLIGHT_ENV: "0"})
+
+    profiler.stage("write")
     with open("generators/" + path + "/config.json", "w") as file:
         file.write(jsonFile)
 
-    subprocess.run(["bash", "scripts/" + path + ".sh"])
+    profiler.stage("prove")
+    subprocess.run(["bash", "scripts/" + path + ".sh"], env=env)
+
+    profiler.finish("generators/general")
 
 
 if __name__ == "__main__":
@@ -4,7 +4,8 @@ from bitcoin.core import CScript
 from generators.utils.tx import Transaction
 from generators.utils.script import Script
 from generators.utils.opcodes_gen import generate
-from generators.constants import CONSTANTS_TEMPLATE, CONSTANTS_NR, PROVER_TEMPLATE, PROVER_TOML
+from generators.utils.profiling import Profiler
+from generators.utils.spend import write_spend
 
 
 def get_config(path: str = "./generators/p2pk/config.json") -> Dict:
@@ -13,34 +14,28 @@ def get_config(path: str = "./generators/p2pk/config.json") -> Dict:
 
 
 def main():
+    profiler = Profiler.from_env("p2pk")
+    profiler.stage("config")
     config = get_config()
 
+    profiler.stage("parse")
     currentTx = Transaction(config["current_tx"])
     currentTx.cut_script_sigs()
 
     prevTx = Transaction(config["prev_tx"])
     prevTx.cut_script_sigs()
 
-    with open(config["file_path"] + CONSTANTS_TEMPLATE, "r") as file:
-        templateOpcodes = file.read()
-
-    CURRENT_TX_INP_COUNT_SIZE = currentTx._get_compact_size_size(currentTx.input_count)
-    CURRENT_TX_INP_SIZE = sum(currentTx._get_input_size(inp)
-                            for inp in currentTx.inputs) + CURRENT_TX_INP_COUNT_SIZE
-    CURRENT_TX_OUT_COUNT_SIZE = currentTx._get_compact_size_size(currentTx.output_count)
-    CURRENT_TX_OUT_SIZE = sum(currentTx._get_output_size(out)
-                            for out in currentTx.outputs) + CURRENT_TX_OUT_COUNT_SIZE
-
-    PREV_TX_INP_COUNT_SIZE = prevTx._get_compact_size_size(prevTx.input_count)
-    PREV_TX_INP_SIZE = sum(prevTx._get_input_size(inp)
-                            for inp in prevTx.inputs) + PREV_TX_INP_COUNT_SIZE
-    PREV_TX_OUT_COUNT_SIZE = prevTx._get_compact_size_size(prevTx.output_count)
-    PREV_TX_OUT_SIZE = sum(prevTx._get_output_size(out)
-                            for out in prevTx.outputs) + PREV_TX_OUT_COUNT_SIZE
-    PREV_TX_MAX_WITNESS_STACK_SIZE = 0 if prevTx.witness is None else max(
-        len(w.stack_items) for w in prevTx.witness)
-    PREV_TX_WITNESS_SIZE = 0 if prevTx.witness is None else sum(
-        prevTx._get_witness_size(wit) for wit in prevTx.witness)
+    CURRENT_TX_INP_COUNT_SIZE = currentTx.layout.input_count_size
+    CURRENT_TX_INP_SIZE = currentTx.layout.input_size
+    CURRENT_TX_OUT_COUNT_SIZE = currentTx.layout.output_count_size
+    CURRENT_TX_OUT_SIZE = currentTx.layout.output_size
+
+    PREV_TX_INP_COUNT_SIZE = prevTx.layout.input_count_size
+    PREV_TX_INP_SIZE = prevTx.layout.input_size
+    PREV_TX_OUT_COUNT_SIZE = prevTx.layout.output_count_size
+    PREV_TX_OUT_SIZE = prevTx.layout.output_size
+    PREV_TX_MAX_WITNESS_STACK_SIZE = prevTx.layout.max_witness_stack_size
+    PREV_TX_WITNESS_SIZE = prevTx.layout.witness_size
 
     vout = currentTx.inputs[config["input_to_sign"]].vout
     script_pub_key = bytearray(prevTx.outputs[vout].script_pub_key)
@@ -50,12 +45,13 @@ def main():
     script_sig = config["script_sig"]
     full_script = bytes.fromhex(script_sig) + script_pub_key
 
+    profiler.stage("script")
     script = Script(full_script.hex(), currentTx, config["input_to_sign"])
-    generate(script.sizes)
 
     INPUT_TO_SIGN = config["input_to_sign"]
 
-    opcodesFile = templateOpcodes.format(
+    profiler.stage("render")
+    constants = dict(
         currentTx=currentTx,
         prevTx=prevTx,
         currentTxInCountSize=CURRENT_TX_INP_COUNT_SIZE,
@@ -69,34 +65,30 @@ def main():
         prevTxMaxWitnessStackSize=PREV_TX_MAX_WITNESS_STACK_SIZE,
         prevTxWitnessSize=PREV_TX_WITNESS_SIZE,
         isPrevSegwit=str(PREV_TX_WITNESS_SIZE != 0).lower(),
-        currentTxSize=currentTx._get_transaction_size() * 2,
-        prevTxSize=prevTx._get_transaction_size() * 2,
+        currentTxSize=currentTx.layout.size * 2,
+        prevTxSize=prevTx.layout.size * 2,
         scriptSigSize=len(config["script_sig"]),
-        nOutputSize=currentTx._get_output_size(currentTx.outputs[INPUT_TO_SIGN]),
+        nOutputSize=currentTx.layout.outputs[INPUT_TO_SIGN].size,
         inputToSign=INPUT_TO_SIGN,
         inputToSignSize=currentTx._get_compact_size_size(INPUT_TO_SIGN),
-        nInputSize=currentTx._get_input_size(currentTx.inputs[INPUT_TO_SIGN]),
+        nInputSize=currentTx.layout.inputs[INPUT_TO_SIGN].size,
         scriptPubKeySize=len(script_pub_key),
     )
 
-    with open(config["file_path"] + CONSTANTS_NR, "w") as file:
-        file.write(opcodesFile)
-
-    with open(config["file_path"] + PROVER_TEMPLATE, "r") as file:
-        templateProver = file.read()
-
     currentTxData = currentTx.to_hex()
     prevTxData = prevTx.to_hex()
 
-    proverFile = templateProver.format(
+    prover = dict(
         currentTxData=currentTxData,
         prevTxData=prevTxData,
         scriptSig=config["script_sig"],
-        inputToSign=INPUT_TO_SIGN
+        inputToSign=INPUT_TO_SIGN,
     )
 
-    with open(config["file_path"] + PROVER_TOML, "w") as file:
-        file.write(proverFile)
+    write_spend(profiler, config, constants, prover,
+                scripts=[script],
+                codegen=lambda: generate(script.sizes, scripts=[script]),
+                tx_size=currentTx.layout.size + prevTx.layout.size)
 
 
 if __name__ == "__main__":
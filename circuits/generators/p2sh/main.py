@@ -3,7 +3,8 @@ from typing import Dict
 from generators.utils.tx import Transaction
 from generators.utils.script import Script
 from generators.utils.opcodes_gen import generate
-from generators.constants import CONSTANTS_TEMPLATE, CONSTANTS_NR, PROVER_TEMPLATE, PROVER_TOML
+from generators.utils.profiling import Profiler
+from generators.utils.spend import write_spend
 
 
 def get_config(path: str = "./generators/p2sh/config.json") -> Dict:
@@ -12,8 +13,11 @@ def get_config(path: str = "./generators/p2sh/config.json") -> Dict:
 
 
 def main():
+    profiler = Profiler.from_env("p2sh")
+    profiler.stage("config")
     config = get_config()
 
+    profiler.stage("parse")
     currentTx = Transaction(config["current_tx"])
     currentTx.cut_script_sigs()
 
@@ -24,27 +28,19 @@ def main():
 
     INPUT_TO_SIGN = config["input_to_sign"]
 
-    CURRENT_TX_INP_COUNT_SIZE = currentTx._get_compact_size_size(currentTx.input_count)
-    CURRENT_TX_INP_SIZE = sum(currentTx._get_input_size(inp)
-                            for inp in currentTx.inputs) + CURRENT_TX_INP_COUNT_SIZE
-    CURRENT_TX_OUT_COUNT_SIZE = currentTx._get_compact_size_size(currentTx.output_count)
-    CURRENT_TX_OUT_SIZE = sum(currentTx._get_output_size(out)
-                            for out in currentTx.outputs) + CURRENT_TX_OUT_COUNT_SIZE
-    CURRENT_TX_MAX_WITNESS_STACK_SIZE = 0 if currentTx.witness is None else max(
-        len(w.stack_items) for w in currentTx.witness)
-    CURRENT_TX_WITNESS_SIZE = 0 if currentTx.witness is None else sum(
-        currentTx._get_witness_size(wit) for wit in currentTx.witness)
-
-    PREV_TX_INP_COUNT_SIZE = prevTx._get_compact_size_size(prevTx.input_count)
-    PREV_TX_INP_SIZE = sum(prevTx._get_input_size(inp)
-                            for inp in prevTx.inputs) + PREV_TX_INP_COUNT_SIZE
-    PREV_TX_OUT_COUNT_SIZE = prevTx._get_compact_size_size(prevTx.output_count)
-    PREV_TX_OUT_SIZE = sum(prevTx._get_output_size(out)
-                            for out in prevTx.outputs) + PREV_TX_OUT_COUNT_SIZE
-    PREV_TX_MAX_WITNESS_STACK_SIZE = 0 if prevTx.witness is None else max(
-        len(w.stack_items) for w in prevTx.witness)
-    PREV_TX_WITNESS_SIZE = 0 if prevTx.witness is None else sum(
-        prevTx._get_witness_size(wit) for wit in prevTx.witness)
+    CURRENT_TX_INP_COUNT_SIZE = currentTx.layout.input_count_size
+    CURRENT_TX_INP_SIZE = currentTx.layout.input_size
+    CURRENT_TX_OUT_COUNT_SIZE = currentTx.layout.output_count_size
+    CURRENT_TX_OUT_SIZE = currentTx.layout.output_size
+    CURRENT_TX_MAX_WITNESS_STACK_SIZE = currentTx.layout.max_witness_stack_size
+    CURRENT_TX_WITNESS_SIZE = currentTx.layout.witness_size
+
+    PREV_TX_INP_COUNT_SIZE = prevTx.layout.input_count_size
+    PREV_TX_INP_SIZE = prevTx.layout.input_size
+    PREV_TX_OUT_COUNT_SIZE = prevTx.layout.output_count_size
+    PREV_TX_OUT_SIZE = prevTx.layout.output_size
+    PREV_TX_MAX_WITNESS_STACK_SIZE = prevTx.layout.max_witness_stack_size
+    PREV_TX_WITNESS_SIZE = prevTx.layout.witness_size
 
     script_pub_key = prevTx.outputs[vout].script_pub_key
 
@@ -60,6 +56,7 @@ def main():
     else:
         print("Spending type: p2sh")
 
+    profiler.stage("script")
     script = Script(
         script_sig, 
         currentTx, 
@@ -77,7 +74,6 @@ def main():
         config["input_to_sign"],
         [script.script_elements[-1]])
     sizes = sizes | redeem_script.sizes | spk_script.sizes
-    generate(sizes)
 
     require_stack_size = max(
         script.require_stack_size +
@@ -88,10 +84,8 @@ def main():
         redeem_script.max_element_size,
         spk_script.max_element_size)
 
-    with open(config["file_path"] + CONSTANTS_TEMPLATE, "r") as file:
-        templateOpcodes = file.read()
-
-    opcodesFile = templateOpcodes.format(
+    profiler.stage("render")
+    constants = dict(
         currentTx=currentTx,
         prevTx=prevTx,
         currentTxInCountSize=CURRENT_TX_INP_COUNT_SIZE,
@@ -109,45 +103,40 @@ def main():
         prevTxWitnessSize=PREV_TX_WITNESS_SIZE,
         isPrevSegwit=str(PREV_TX_WITNESS_SIZE != 0).lower(),
         opcodesCount=0 if CURRENT_TX_WITNESS_SIZE != 0 else script.opcodes,
-        currentTxSize=currentTx._get_transaction_size() * 2,
-        prevTxSize=prevTx._get_transaction_size() * 2,
+        currentTxSize=currentTx.layout.size * 2,
+        prevTxSize=prevTx.layout.size * 2,
         signSize=1 if CURRENT_TX_WITNESS_SIZE != 0 else len(script_sig),
         scriptPubKeySize=len(script_pub_key),
-        inputWitnessSize=currentTx._get_witness_size(
-            currentTx.witness[INPUT_TO_SIGN]) - 1 if currentTx.witness is not None else 0,
-        redeemScriptSize=len(script.script_elements[-1]) // 2,
+        inputWitnessSize=currentTx.layout.witnesses[INPUT_TO_SIGN].size - 1 if currentTx.witness is not None else 0,
+        redeemScriptSize=len(script.script_elements[-1]),
         codeseparatorRedeemScriptSize=redeem_script.script_len_codeseparator,
         codeseparatorRedeemScriptSizeSize=currentTx._get_compact_size_size(
             redeem_script.script_len_codeseparator),
         redeemOpcodesCount=redeem_script.opcodes,
         stackSize=require_stack_size,
         maxStackElementSize=max_element_size,
-        nOutputSize=currentTx._get_output_size(
-            currentTx.outputs[INPUT_TO_SIGN]) if len(
+        nOutputSize=currentTx.layout.outputs[INPUT_TO_SIGN].size if len(
             currentTx.outputs) > INPUT_TO_SIGN else 0,
         inputToSign=INPUT_TO_SIGN,
         inputToSignSize=currentTx._get_compact_size_size(INPUT_TO_SIGN),
-        nInputSize=currentTx._get_input_size(currentTx.inputs[INPUT_TO_SIGN]),
+        nInputSize=currentTx.layout.inputs[INPUT_TO_SIGN].size,
     )
 
-    with open(config["file_path"] + CONSTANTS_NR, "w") as file:
-        file.write(opcodesFile)
-
-    with open(config["file_path"] + PROVER_TEMPLATE, "r") as file:
-        templateProver = file.read()
-
     currentTxData = currentTx.to_hex()
     prevTxData = prevTx.to_hex()
 
-    proverFile = templateProver.format(
+    prover = dict(
         currentTxData=currentTxData,
         prevTxData=prevTxData,
         scriptSig="-" if CURRENT_TX_WITNESS_SIZE != 0 else script_sig,
-        inputToSign=INPUT_TO_SIGN
+        inputToSign=INPUT_TO_SIGN,
     )
 
-    with open(config["file_path"] + PROVER_TOML, "w") as file:
-        file.write(proverFile)
+    write_spend(profiler, config, constants, prover,
+                scripts=[script, redeem_script, spk_script],
+                codegen=lambda: generate(
+                    sizes, scripts=[script, redeem_script, spk_script]),
+                tx_size=currentTx.layout.size + prevTx.layout.size)
 
 
 if __name__ == "__main__":
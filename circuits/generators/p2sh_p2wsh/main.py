@@ -3,7 +3,8 @@ from typing import Dict
 from generators.utils.tx import Transaction
 from generators.utils.script import Script
 from generators.utils.opcodes_gen import generate
-from generators.constants import CONSTANTS_TEMPLATE, CONSTANTS_NR, PROVER_TEMPLATE, PROVER_TOML
+from generators.utils.profiling import Profiler
+from generators.utils.spend import write_spend
 
 
 def get_config(path: str = "./generators/p2sh_p2wsh/config.json") -> Dict:
@@ -12,9 +13,12 @@ def get_config(path: str = "./generators/p2sh_p2wsh/config.json") -> Dict:
 
 
 def main():
+    profiler = Profiler.from_env("p2sh_p2wsh")
+    profiler.stage("config")
     print("Spending type: p2sh-p2wsh")
     config = get_config()
 
+    profiler.stage("parse")
     currentTx = Transaction(config["current_tx"])
     currentTx.cut_script_sigs()
 
@@ -23,27 +27,19 @@ def main():
     prevTx = Transaction(config["prev_tx"])
     prevTx.cut_script_sigs()
 
-    CURRENT_TX_INP_COUNT_SIZE = currentTx._get_compact_size_size(currentTx.input_count)
-    CURRENT_TX_INP_SIZE = sum(currentTx._get_input_size(inp)
-                            for inp in currentTx.inputs) + CURRENT_TX_INP_COUNT_SIZE
-    CURRENT_TX_OUT_COUNT_SIZE = currentTx._get_compact_size_size(currentTx.output_count)
-    CURRENT_TX_OUT_SIZE = sum(currentTx._get_output_size(out)
-                            for out in currentTx.outputs) + CURRENT_TX_OUT_COUNT_SIZE
-    CURRENT_TX_MAX_WITNESS_STACK_SIZE = 0 if currentTx.witness is None else max(
-        len(w.stack_items) for w in currentTx.witness)
-    CURRENT_TX_WITNESS_SIZE = sum(
-        currentTx._get_witness_size(wit) for wit in currentTx.witness)
-
-    PREV_TX_INP_COUNT_SIZE = prevTx._get_compact_size_size(prevTx.input_count)
-    PREV_TX_INP_SIZE = sum(prevTx._get_input_size(inp)
-                            for inp in prevTx.inputs) + PREV_TX_INP_COUNT_SIZE
-    PREV_TX_OUT_COUNT_SIZE = prevTx._get_compact_size_size(prevTx.output_count)
-    PREV_TX_OUT_SIZE = sum(prevTx._get_output_size(out)
-                            for out in prevTx.outputs) + PREV_TX_OUT_COUNT_SIZE
-    PREV_TX_MAX_WITNESS_STACK_SIZE = 0 if prevTx.witness is None else max(
-        len(w.stack_items) for w in prevTx.witness)
-    PREV_TX_WITNESS_SIZE = 0 if prevTx.witness is None else sum(
-        prevTx._get_witness_size(wit) for wit in prevTx.witness)
+    CURRENT_TX_INP_COUNT_SIZE = currentTx.layout.input_count_size
+    CURRENT_TX_INP_SIZE = currentTx.layout.input_size
+    CURRENT_TX_OUT_COUNT_SIZE = currentTx.layout.output_count_size
+    CURRENT_TX_OUT_SIZE = currentTx.layout.output_size
+    CURRENT_TX_MAX_WITNESS_STACK_SIZE = currentTx.layout.max_witness_stack_size
+    CURRENT_TX_WITNESS_SIZE = currentTx.layout.witness_size
+
+    PREV_TX_INP_COUNT_SIZE = prevTx.layout.input_count_size
+    PREV_TX_INP_SIZE = prevTx.layout.input_size
+    PREV_TX_OUT_COUNT_SIZE = prevTx.layout.output_count_size
+    PREV_TX_OUT_SIZE = prevTx.layout.output_size
+    PREV_TX_MAX_WITNESS_STACK_SIZE = prevTx.layout.max_witness_stack_size
+    PREV_TX_WITNESS_SIZE = prevTx.layout.witness_size
 
     INPUT_TO_SIGN = config["input_to_sign"]
 
@@ -51,8 +47,9 @@ def main():
     script_pub_key_size = prevTx.outputs[vout].script_pub_key_size
 
     script_sig = config["script_sig"]
-    witness = currentTx.witness_to_hex_script(INPUT_TO_SIGN)
+    witness = currentTx.witness_to_script(INPUT_TO_SIGN)
 
+    profiler.stage("script")
     script = Script(
         script_sig +
         bytearray(script_pub_key).hex(),
@@ -60,12 +57,9 @@ def main():
         config["input_to_sign"])
     sizes = script.sizes
 
-    full_script_sig = bytearray.fromhex(script.script_elements[-4])
-    full_script_sig.pop(0)
-    full_ss = [168]
-    full_ss.extend(list(full_script_sig))
-    full_ss.extend([135])
-    full_script_sig = bytes(full_ss).hex()
+    # OP_0 <32> becomes OP_SHA256 <32> OP_EQUAL
+    full_script_sig = bytes([168]) + script.script_elements[-4].data[1:] + \
+        bytes([135])
 
     parsed_script_sig = Script(
         witness +
@@ -75,14 +69,13 @@ def main():
         [])
     sizes = sizes | parsed_script_sig.sizes
 
-    rds = bytearray.fromhex(parsed_script_sig.script_elements[-4]).hex()
+    rds = parsed_script_sig.script_elements[-4]
 
     redeem_script = Script(rds,
         currentTx,
         config["input_to_sign"],
         parsed_script_sig.script_elements[0:-4])
     sizes = sizes | redeem_script.sizes
-    generate(sizes)
 
     require_stack_size = max(
         script.require_stack_size,
@@ -93,10 +86,8 @@ def main():
         parsed_script_sig.max_element_size,
         redeem_script.max_element_size)
 
-    with open(config["file_path"] + CONSTANTS_TEMPLATE, "r") as file:
-        templateOpcodes = file.read()
-
-    opcodesFile = templateOpcodes.format(
+    profiler.stage("render")
+    constants = dict(
         currentTx=currentTx,
         prevTx=prevTx,
         currentTxInCountSize=CURRENT_TX_INP_COUNT_SIZE,
@@ -112,47 +103,43 @@ def main():
         prevTxMaxWitnessStackSize=PREV_TX_MAX_WITNESS_STACK_SIZE,
         prevTxWitnessSize=PREV_TX_WITNESS_SIZE,
         isPrevSegwit=str(PREV_TX_WITNESS_SIZE != 0).lower(),
-        currentTxSize=currentTx._get_transaction_size() * 2,
-        prevTxSize=prevTx._get_transaction_size() * 2,
+        currentTxSize=currentTx.layout.size * 2,
+        prevTxSize=prevTx.layout.size * 2,
         signSize=len(script_sig),
         scriptPubKeySize=len(script_pub_key),
         scriptPubKeySizeSize=currentTx._get_compact_size_size(script_pub_key_size),
-        redeemScriptSize=len(rds) // 2,
+        redeemScriptSize=len(rds),
         codesepRedeemScriptSize=redeem_script.script_len_codeseparator,
         codesepRedeemScriptSizeSize=currentTx._get_compact_size_size(
             redeem_script.script_len_codeseparator),
-        witnessFieldSize=len(witness),
+        witnessFieldSize=len(witness) * 2,
         redeemScriptOpcodesCount=redeem_script.opcodes,
         stackSize=require_stack_size,
         maxStackElementSize=max_element_size,
-        nOutputSize=currentTx._get_output_size(
-            currentTx.outputs[INPUT_TO_SIGN]) if len(
+        nOutputSize=currentTx.layout.outputs[INPUT_TO_SIGN].size if len(
             currentTx.outputs) > INPUT_TO_SIGN else 0,
         inputToSign=INPUT_TO_SIGN,
         inputToSignSize=currentTx._get_compact_size_size(INPUT_TO_SIGN),
-        nInputSize=currentTx._get_input_size(currentTx.inputs[INPUT_TO_SIGN]),
+        nInputSize=currentTx.layout.inputs[INPUT_TO_SIGN].size,
         opcodesCount=parsed_script_sig.opcodes
     )
 
-    with open(config["file_path"] + CONSTANTS_NR, "w") as file:
-        file.write(opcodesFile)
-
-    with open(config["file_path"] + PROVER_TEMPLATE, "r") as file:
-        templateProver = file.read()
-
     currentTxData = currentTx.to_hex()
     prevTxData = prevTx.to_hex()
 
-    proverFile = templateProver.format(
+    prover = dict(
         currentTxData=currentTxData,
         prevTxData=prevTxData,
         scriptSig=script_sig,
-        witnessScript=witness,
-        inputToSign=INPUT_TO_SIGN
+        witnessScript=witness.hex(),
+        inputToSign=INPUT_TO_SIGN,
     )
 
-    with open(config["file_path"] + PROVER_TOML, "w") as file:
-        file.write(proverFile)
+    write_spend(profiler, config, constants, prover,
+                scripts=[script, parsed_script_sig, redeem_script],
+                codegen=lambda: generate(
+                    sizes, scripts=[script, parsed_script_sig, redeem_script]),
+                tx_size=currentTx.layout.size + prevTx.layout.size)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+from typing import Optional
+import os
+import sqlite3
+
+DEFAULT_STORE_PATH = "./target/analysis_cache.sqlite"
+
+# off (unset or 0), 1 for DEFAULT_STORE_PATH or the path of the store file
+STORE_ENV = "GENERATORS_ANALYSIS_CACHE"
+
+# how long a writer waits for another process holding the database lock
+BUSY_TIMEOUT_SEC = 5.0
+
+
+class AnalysisStore:
+    """
+    SQLite file mapping analysis keys to serialized analyses, shared by
+    the generator processes.
+
+    Rows are keyed by the analysis key and the version of the analysis
+    that produced them, so checkouts with different analysis versions
+    share the file without dropping each other's rows. The database is
+    opened lazily in WAL mode so concurrent jobs read while one of them
+    writes. Errors (a locked or read-only file) never fail a job, the
+    lookup is just a miss.
+    """
+
+    def __init__(self, path: str, version: int):
+        self.path = path
+        self.version = version
+        self._connection: Optional[sqlite3.Connection] = None
+        self._failed = False
+
+    @classmethod
+    def from_env(cls, version: int) -> Optional['AnalysisStore']:
+        path = os.environ.get(STORE_ENV, "0")
+        if path.lower() in ("", "0", "false", "off"):
+            return None
+        if path.lower() in ("1", "true", "on"):
+            path = DEFAULT_STORE_PATH
+        return cls(path, version)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._connection is not None or self._failed:
+            return self._connection
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS script_analyses ("
+                "key BLOB NOT NULL, version INTEGER NOT NULL, "
+                "analysis TEXT NOT NULL, PRIMARY KEY (key, version))")
+        except (OSError, sqlite3.Error):
+            self._failed = True
+            return None
+        self._connection = connection
+        return connection
+
+    def get(self, key: bytes) -> Optional[str]:
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                "SELECT analysis FROM script_analyses "
+                "WHERE key = ? AND version = ?",
+                (key, self.version)).fetchone()
+        except sqlite3.Error:
+            return None
+        return None if row is None else row[0]
+
+    def put(self, key: bytes, analysis: str):
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            # the same key always maps to the same analysis, so racing
+            # writers may overwrite each other
+            connection.execute(
+                "INSERT OR REPLACE INTO script_analyses "
+                "(key, version, analysis) "
+                "VALUES (?, ?, ?)", (key, self.version, analysis))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        """
+        Drops the rows of this analysis version
+        """
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            connection.execute(
+                "DELETE FROM script_analyses WHERE version = ?",
+                (self.version,))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,223 @@
+from typing import Dict, List, Optional
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from generators.utils.sources import (
+    ARTIFACT, VK, WORKSPACE_MANIFEST, recompile_needed, recompile_report,
+    sources_fingerprint, stamp, toolchain_version)
+
+# directory of the store, 0 disables it
+ARTIFACT_STORE_ENV = "GENERATORS_ARTIFACT_STORE"
+DEFAULT_ARTIFACT_STORE = "./target/artifacts"
+# size bound of the store in megabytes
+ARTIFACT_STORE_MB_ENV = "GENERATORS_ARTIFACT_STORE_MB"
+DEFAULT_ARTIFACT_STORE_MB = 2048
+
+MANIFEST = "manifest.json"
+# stored file name -> path template of the artifact in target/
+FILES = {
+    "program.json": ARTIFACT,
+    "vk": VK,
+}
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def artifact_key(package: str) -> str:
+    h = hashlib.sha256()
+    h.update(package.encode() + b"\0")
+    h.update(sources_fingerprint(package).encode() + b"\0")
+    h.update(toolchain_version().encode())
+    return h.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Compiled circuits and VKs by the hash of their sources and toolchain.
+    Every entry is a directory with a manifest of the sha256 of its files,
+    checked on restore; the least recently used entries are evicted once
+    the store grows past its size bound.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls) -> Optional["ArtifactStore"]:
+        path = os.environ.get(ARTIFACT_STORE_ENV, DEFAULT_ARTIFACT_STORE)
+        if path in ("", "0"):
+            return None
+        max_mb = int(os.environ.get(ARTIFACT_STORE_MB_ENV,
+                                    DEFAULT_ARTIFACT_STORE_MB))
+        return cls(path, max_mb * 1024 * 1024)
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def _manifest(self, key: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self._entry(key), MANIFEST), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def contains(self, key: str) -> bool:
+        return self._manifest(key) is not None
+
+    def restore(self, package: str) -> bool:
+        """
+        Copies the stored artifacts of the current sources to target/,
+        False if there are none or they fail the integrity check
+        """
+        key = artifact_key(package)
+        manifest = self._manifest(key)
+        if manifest is None:
+            return False
+        entry = self._entry(key)
+        # a partial or older manifest may lack some of the hashes
+        hashes = manifest.get("files", {})
+        for name in FILES:
+            path = os.path.join(entry, name)
+            if not os.path.exists(path) or \
+                    _sha256_file(path) != hashes.get(name):
+                print(f"Stored artifacts of {package} are corrupted, "
+                      f"dropping them", file=sys.stderr)
+                shutil.rmtree(entry, ignore_errors=True)
+                return False
+        for name, template in FILES.items():
+            target = template.format(package=package)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(entry, name), target)
+        os.utime(os.path.join(entry, MANIFEST))
+        stamp(package)
+        return True
+
+    def save(self, package: str) -> bool:
+        """
+        Stores the compiled circuit and VK of the current sources, they
+        must be the ones in target/ (see sources.recompile_needed)
+        """
+        if recompile_needed(package):
+            return False
+        key = artifact_key(package)
+        if self.contains(key):
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.path, prefix=".tmp-")
+        try:
+            files = {}
+            for name, template in FILES.items():
+                path = os.path.join(staging, name)
+                shutil.copyfile(template.format(package=package), path)
+                files[name] = _sha256_file(path)
+            with open(os.path.join(staging, MANIFEST), "w") as f:
+                json.dump({
+                    "package": package,
+                    "toolchain": toolchain_version(),
+                    "stored_at": time.time(),
+                    "files": files,
+                }, f, indent=2)
+            os.replace(staging, self._entry(key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # another job stored the same key first
+            if not self.contains(key):
+                raise
+            return False
+        self.evict()
+        return True
+
+    def entries(self) -> List[Dict]:
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for key in os.listdir(self.path):
+            manifest_path = os.path.join(self._entry(key), MANIFEST)
+            if key.startswith(".") or not os.path.exists(manifest_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(self._entry(key), name))
+                       for name in os.listdir(self._entry(key)))
+            entries.append({"key": key, "size": size,
+                            "used_at": os.path.getmtime(manifest_path)})
+        return entries
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used entries until the store fits its
+        size bound, returns the number of removed entries
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry["used_at"])
+        total = sum(entry["size"] for entry in entries)
+        removed = 0
+        while entries and total > self.max_bytes:
+            entry = entries.pop(0)
+            shutil.rmtree(self._entry(entry["key"]), ignore_errors=True)
+            total -= entry["size"]
+            removed += 1
+        return removed
+
+
+def restore_report(app_path: str) -> str:
+    """
+    Restores the compiled circuit and VK of the generated sources from the
+    store when they are not the ones in target/, then reports whether a
+    recompile is still needed
+    """
+    package = os.path.basename(app_path.rstrip("/"))
+    if not os.path.exists(WORKSPACE_MANIFEST):
+        return (f"No Noir workspace in {os.getcwd()}, recompile check of "
+                f"{package} skipped")
+    store = ArtifactStore.from_env()
+    if store is not None and recompile_needed(package) and \
+            store.restore(package):
+        return (f"Circuit sources of {package} restored from the artifact "
+                f"store, no recompile needed")
+    return recompile_report(app_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Store of compiled circuits and VKs")
+    parser.add_argument("command", choices=["restore", "save", "evict",
+                                            "stats"],
+                        help="restore: exit 1 if nothing is stored for the "
+                        "current sources, save: store the artifacts in "
+                        "target/")
+    parser.add_argument("--package", type=str)
+    args = parser.parse_args()
+
+    store = ArtifactStore.from_env()
+    if store is None:
+        sys.exit(1 if args.command == "restore" else 0)
+    if args.command in ("restore", "save") and not args.package:
+        parser.error(f"{args.command}: --package is required")
+
+    if args.command == "restore":
+        sys.exit(0 if store.restore(args.package) else 1)
+    elif args.command == "save":
+        if store.save(args.package):
+            print(f"Stored the artifacts of {args.package}")
+    elif args.command == "evict":
+        print(f"Evicted {store.evict()} entries")
+    else:
+        entries = store.entries()
+        size = sum(entry["size"] for entry in entries)
+        print(f"{len(entries)} entries, {size / 1024 / 1024:.1f} of "
+              f"{store.max_bytes / 1024 / 1024:.0f} MB in {store.path}")
+
+
+if __name__ == "__main__":
+    main()
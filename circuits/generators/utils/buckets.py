@@ -0,0 +1,139 @@
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import time
+
+# off (unset or 0), record (log the shapes without rounding), pow2 or the
+# path of the size classes learned by `python -m generators.buckets.main
+# learn`
+BUCKETS_ENV = "GENERATORS_BUCKETS"
+RECORD_MODE = "record"
+DEFAULT_SHAPES_PATH = "./target/shapes.jsonl"
+DEFAULT_CLASSES_PATH = "./target/buckets.json"
+GENERATED_NR = "./crates/script/src/generated.nr"
+
+# Constants the circuits only use as upper bounds: loop counts guarded by
+# the actual size and BoundedVec capacities. The transaction layout sizes
+# are asserted exactly by Transaction::new and size the sighash
+# preimages, they are never rounded.
+BUCKETED = frozenset([
+    "stackSize",
+    "maxStackElementSize",
+    "opcodesCount",
+    "redeemOpcodesCount",
+    "redeemScriptOpcodesCount",
+    "scriptOpcodesCount",
+    "currentTxMaxWitnessStackSize",
+    "prevTxMaxWitnessStackSize",
+])
+
+
+def next_power_of_two(value: int) -> int:
+    # 0 stays 0, a non-segwit transaction asserts MAX_WITNESS_STACK_SIZE == 0
+    return 0 if value <= 0 else 1 << (value - 1).bit_length()
+
+
+class Buckets:
+    """
+    Rounds the bounded constants up to their size class: the smallest
+    learned boundary not below the value, the next power of two without
+    learned classes or above the largest one
+    """
+
+    def __init__(self, classes: Optional[Dict[str, List[int]]] = None):
+        self.classes = {name: sorted(bounds)
+                        for name, bounds in (classes or {}).items()}
+
+    @classmethod
+    def from_env(cls) -> Optional["Buckets"]:
+        mode = os.environ.get(BUCKETS_ENV, "0")
+        if mode in ("", "0", RECORD_MODE):
+            return None
+        return cls.from_mode(mode)
+
+    @classmethod
+    def from_mode(cls, mode: str) -> "Buckets":
+        if mode == "pow2":
+            return cls()
+        with open(mode, "r") as f:
+            return cls(json.load(f)["classes"])
+
+    def round(self, name: str, value: int) -> int:
+        if name not in BUCKETED or value <= 0:
+            return value
+        for bound in self.classes.get(name, []):
+            if bound >= value:
+                return bound
+        return next_power_of_two(value)
+
+    def apply(self, constants: Dict) -> Dict:
+        return {name: self.round(name, value) if isinstance(value, int)
+                else value for name, value in constants.items()}
+
+
+def shape(constants: Dict) -> Dict[str, int]:
+    """
+    The integer values a constants.nr is rendered from, the transactions
+    by their input and output counts
+    """
+    values = {}
+    for name, value in constants.items():
+        if hasattr(value, "input_count"):
+            values[name + ".input_count"] = value.input_count
+            values[name + ".output_count"] = value.output_count
+        elif isinstance(value, int) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def _generated_fingerprint() -> Optional[str]:
+    try:
+        with open(GENERATED_NR, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except FileNotFoundError:
+        return None
+
+
+def record_shape(package: str, constants: Dict,
+                 path: str = DEFAULT_SHAPES_PATH):
+    """
+    Appends the exact constants of a job to the shape log, the corpus the
+    size classes are learned from and the bucketing report is run on
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps({
+            "package": package,
+            "recorded_at": time.time(),
+            "generated": _generated_fingerprint(),
+            "constants": shape(constants),
+        }, sort_keys=True) + "\n")
+
+
+def load_shapes(path: str = DEFAULT_SHAPES_PATH) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def shapes_enabled() -> bool:
+    return os.environ.get(BUCKETS_ENV, "0") not in ("", "0")
+
+
+def apply_buckets(app_path: str, constants: Dict) -> Dict:
+    """
+    Returns the constants rounded to their size classes when bucketing is
+    enabled, and then records the exact constants of the job. The witness
+    needs no padding: the rounded constants are only bounds the circuit
+    checks the actual sizes against.
+    """
+    if not shapes_enabled():
+        return constants
+    package = os.path.basename(app_path.rstrip("/"))
+    record_shape(package, constants)
+    buckets = Buckets.from_env()
+    if buckets is None:
+        return constants
+    return buckets.apply(constants)
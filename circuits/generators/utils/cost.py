@@ -0,0 +1,370 @@
+from collections import Counter, namedtuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+
+from generators.constants import COST_JSON
+from generators.utils.hints import SighashHint, hash_opcode_blocks
+from generators.utils.interpreter import (
+    HASH_FUNCTIONS, OP_16, OP_CHECKMULTISIG,
+    OP_CHECKMULTISIGVERIFY, OP_CHECKSIG, OP_CHECKSIGADD, OP_CHECKSIGVERIFY,
+    OP_RIPEMD160, OP_SHA1, OP_SHA256, OP_HASH160, OP_HASH256)
+from generators.utils.script import Script
+
+OP_RESERVED = 0x50
+
+# writes and prints the cost estimate of every generated spend
+COST_ENV = "GENERATORS_COST"
+# path of the weights fitted by `python -m generators.cost.main calibrate`
+COST_WEIGHTS_ENV = "GENERATORS_COST_WEIGHTS"
+DEFAULT_WEIGHTS_PATH = "./target/cost_weights.json"
+DEFAULT_RUNS_PATH = "./target/cost_runs.jsonl"
+
+# (class, operand size) -> count of the executed opcodes of a spend, the
+# features are the units the weights apply to (see spend_cost)
+CostVector = namedtuple('CostVector', ['entries', 'features'])
+CostEstimate = namedtuple('CostEstimate', [
+    'constraints', 'circuit_size', 'prove_seconds', 'memory_mb'])
+# constraints: feature -> constraints per unit, prove_seconds and
+# memory_mb: (intercept, slope) over the circuit size
+CostWeights = namedtuple('CostWeights', [
+    'constraints', 'prove_seconds', 'memory_mb', 'runs'])
+
+HASH_CLASSES = {
+    OP_RIPEMD160: "ripemd160",
+    OP_SHA1: "sha1",
+    OP_SHA256: "sha256",
+    OP_HASH160: "hash160",
+    OP_HASH256: "hash256",
+}
+
+# OP_NOP..OP_RETURN, OP_CODESEPARATOR and the NOPs
+FLOW_OPCODES = frozenset([*range(0x61, 0x6b), 0xab, *range(0xb0, 0xba)])
+# OP_TOALTSTACK..OP_TUCK, OP_SIZE
+STACK_OPCODES = frozenset([*range(0x6b, 0x7e), 0x82])
+# OP_EQUAL, OP_EQUALVERIFY
+COMPARISON_OPCODES = frozenset([0x87, 0x88])
+# OP_1ADD..OP_WITHIN
+ARITHMETIC_OPCODES = frozenset(range(0x8b, 0xa6))
+
+# rough figures for UltraHonk, to be replaced by calibrated weights: the
+# hash classes are per compression, checkmultisig per key, sighash per
+# compression of the signature hashes, step per script element walked by
+# the execution loop and tx_byte per byte of the transactions
+DEFAULT_WEIGHTS = CostWeights({
+    "base": 50000,
+    "tx_byte": 150,
+    "step": 3000,
+    "push": 200,
+    "push_byte": 100,
+    "stack": 200,
+    "comparison": 400,
+    "arithmetic": 300,
+    "flow": 300,
+    "other": 300,
+    "sha256": 8000,
+    "ripemd160": 30000,
+    "sha1": 20000,
+    "hash160": 20000,
+    "hash256": 8000,
+    "checksig": 40000,
+    "checkmultisig": 40000,
+    "sighash": 8000,
+}, (0.5, 4e-6), (100.0, 1e-3), 0)
+
+# weight of the default weights in the calibration, relative to the
+# recorded runs
+CALIBRATION_PRIOR = 0.01
+CALIBRATION_SWEEPS = 500
+
+
+def opcode_class(opcode: int) -> str:
+    if opcode <= OP_16 and opcode != OP_RESERVED:
+        return "push"
+    if opcode in HASH_CLASSES:
+        return HASH_CLASSES[opcode]
+    if opcode in (OP_CHECKSIG, OP_CHECKSIGVERIFY, OP_CHECKSIGADD):
+        return "checksig"
+    if opcode in (OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY):
+        return "checkmultisig"
+    if opcode in STACK_OPCODES:
+        return "stack"
+    if opcode in COMPARISON_OPCODES:
+        return "comparison"
+    if opcode in ARITHMETIC_OPCODES:
+        return "arithmetic"
+    if opcode in FLOW_OPCODES:
+        return "flow"
+    return "other"
+
+
+def _units(opcode: int, size: int) -> int:
+    if opcode in HASH_FUNCTIONS:
+        return hash_opcode_blocks(opcode, size)
+    if opcode in (OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY):
+        return size
+    return 1
+
+
+def cost_enabled() -> bool:
+    return os.environ.get(COST_ENV, "0") not in ("", "0")
+
+
+def spend_cost(scripts: Sequence[Script],
+               sighashes: Sequence[SighashHint] = (),
+               tx_size: int = 0, signatures: int = 0) -> CostVector:
+    """
+    Cost vector of a spend: the executed opcodes of the circuit scripts by
+    class and operand size (the data size for pushes, the hashed size for
+    hashes, the keys count for checkmultisig) and the features the
+    constraints are estimated from.
+
+    scripts: the scripts executed by the circuit
+    sighashes: signature hashes of the spend, their compressions are
+        counted
+    tx_size: bytes of the transactions passed to the circuit
+    signatures: signature checks outside the scripts (taproot key path)
+    """
+    entries = Counter()
+    features = Counter(base=1, tx_byte=tx_size)
+    if signatures:
+        entries[("checksig", 0)] += signatures
+        features["checksig"] += signatures
+    for script in scripts:
+        features["step"] += script.opcodes
+        for (opcode, size), count in script.costs.items():
+            name = opcode_class(opcode)
+            entries[(name, size)] += count
+            features[name] += count * _units(opcode, size)
+            if name == "push":
+                features["push_byte"] += count * size
+    for sighash in sighashes:
+        entries[("sighash", sighash.compressions)] += 1
+        features["sighash"] += sighash.compressions
+    return CostVector(dict(entries), dict(features))
+
+
+def dispatch_constraints(sizes: Iterable[Tuple[int, int, int, int]],
+                         weights: Optional[CostWeights] = None) -> int:
+    """
+    Constraints of the size branches generated.nr emits for a size set
+    (see opcodes_gen.generate), paid at every step of the execution loop
+    whichever branch is taken
+    """
+    if weights is None:
+        weights = load_weights()
+    units = Counter()
+    checksig = False
+    for opcode, size, keys, _ in sizes:
+        name = opcode_class(opcode)
+        if name == "push":
+            units["push_byte"] += opcode if opcode <= 75 else size
+        elif name == "checkmultisig":
+            units[name] += keys
+        elif name == "checksig":
+            # a single branch serves every signature check
+            checksig = True
+        else:
+            units[name] += _units(opcode, size)
+    units["checksig"] += checksig
+    return int(sum(weights.constraints.get(name, 0) * count
+                   for name, count in units.items()))
+
+
+def circuit_size(constraints: float) -> int:
+    """
+    Dyadic size of the proving key, the next power of two
+    """
+    return 1 << max(int(constraints) - 1, 0).bit_length()
+
+
+def estimate(cost: CostVector,
+             weights: Optional[CostWeights] = None) -> CostEstimate:
+    if weights is None:
+        weights = load_weights()
+    constraints = int(sum(weights.constraints.get(name, 0) * units
+                          for name, units in cost.features.items()))
+    size = circuit_size(constraints)
+    seconds = weights.prove_seconds[0] + weights.prove_seconds[1] * size
+    memory = weights.memory_mb[0] + weights.memory_mb[1] * size
+    return CostEstimate(constraints, size, round(seconds, 3), round(memory, 1))
+
+
+def load_weights(path: Optional[str] = None) -> CostWeights:
+    """
+    Weights from the GENERATORS_COST_WEIGHTS path or target/cost_weights.json,
+    the defaults if neither exists
+    """
+    if path is None:
+        path = os.environ.get(COST_WEIGHTS_ENV, DEFAULT_WEIGHTS_PATH)
+    if not os.path.exists(path):
+        return DEFAULT_WEIGHTS
+    with open(path, "r") as f:
+        data = json.load(f)
+    return CostWeights(
+        dict(DEFAULT_WEIGHTS.constraints, **data["constraints"]),
+        tuple(data["prove_seconds"]), tuple(data["memory_mb"]), data["runs"])
+
+
+def save_weights(weights: CostWeights, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(weights._asdict(), f, indent=2)
+
+
+def _fit_nonnegative(rows: List[Dict[str, float]], targets: List[float],
+                     prior: Dict[str, float]) -> Dict[str, float]:
+    """
+    Non-negative least squares by coordinate descent, every weight is
+    pulled towards its prior by CALIBRATION_PRIOR (scaled by the energy
+    of its feature) so that features a few runs cannot tell apart keep
+    their relative defaults
+    """
+    names = sorted({name for row in rows for name in row} | set(prior))
+    weights = {name: float(prior.get(name, 0)) for name in names}
+    energy = {name: sum(row.get(name, 0) ** 2 for row in rows)
+              for name in names}
+    residuals = [target - sum(weights[name] * units
+                              for name, units in row.items())
+                 for row, target in zip(rows, targets)]
+
+    for _ in range(CALIBRATION_SWEEPS):
+        change = 0.0
+        for name in names:
+            if not energy[name]:
+                continue
+            old = weights[name]
+            correlation = sum(row.get(name, 0) * (r + row.get(name, 0) * old)
+                              for row, r in zip(rows, residuals))
+            new = max(0.0, (correlation + CALIBRATION_PRIOR * energy[name] *
+                            prior.get(name, 0)) /
+                      ((1 + CALIBRATION_PRIOR) * energy[name]))
+            if new != old:
+                for i, row in enumerate(rows):
+                    residuals[i] -= row.get(name, 0) * (new - old)
+                weights[name] = new
+                change = max(change, abs(new - old) / max(old, 1.0))
+        if change < 1e-9:
+            break
+    return weights
+
+
+def _fit_line(xs: List[float], ys: List[float],
+              default: Tuple[float, float]) -> Tuple[float, float]:
+    if not xs:
+        return default
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        # one circuit size, keep the default intercept if it fits
+        intercept = min(default[0], mean_y)
+        return intercept, (mean_y - intercept) / mean_x
+    slope = sum((x - mean_x) * (y - mean_y)
+                for x, y in zip(xs, ys)) / variance
+    return mean_y - slope * mean_x, slope
+
+
+def calibrate(runs: List[Dict],
+              prior: CostWeights = DEFAULT_WEIGHTS) -> CostWeights:
+    """
+    Fits the weights to recorded proving runs
+
+    runs: {"features", "constraints", "prove_seconds", "memory_mb"} as
+        written by record_run, a missing measurement is null
+    """
+    measured = [run for run in runs if run.get("constraints")]
+    constraints = prior.constraints
+    if measured:
+        constraints = _fit_nonnegative(
+            [run["features"] for run in measured],
+            [run["constraints"] for run in measured], prior.constraints)
+    constraints = {name: round(weight, 3)
+                   for name, weight in constraints.items()}
+    fitted = prior._replace(constraints=constraints)
+
+    def sizes(key: str) -> Tuple[List[float], List[float]]:
+        # runs without a gate count are placed by the fitted weights
+        points = [(circuit_size(run["constraints"]) if run.get("constraints")
+                   else estimate(CostVector({}, run["features"]),
+                                 fitted).circuit_size, run[key])
+                  for run in runs if run.get(key) is not None]
+        return [x for x, _ in points], [y for _, y in points]
+
+    return CostWeights(
+        constraints,
+        _fit_line(*sizes("prove_seconds"), prior.prove_seconds),
+        _fit_line(*sizes("memory_mb"), prior.memory_mb),
+        len(runs))
+
+
+def load_runs(path: str = DEFAULT_RUNS_PATH) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_run(run: Dict, path: str = DEFAULT_RUNS_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(run, sort_keys=True) + "\n")
+
+
+def write_cost(output_dir: str, cost: CostVector,
+               weights: Optional[CostWeights] = None) -> CostEstimate:
+    """
+    Writes cost.json next to the generated Prover.toml, read back when
+    the proving run is recorded
+    """
+    result = estimate(cost, weights)
+    with open(output_dir.rstrip("/") + COST_JSON, "w") as f:
+        json.dump({
+            "entries": sorted([name, size, count]
+                              for (name, size), count in cost.entries.items()),
+            "features": cost.features,
+            "estimate": result._asdict(),
+        }, f, indent=2)
+    return result
+
+
+def remove_cost(output_dir: str):
+    """
+    Drops the cost.json of an earlier spend, so that a proving run is not
+    recorded with the cost of other inputs
+    """
+    path = output_dir.rstrip("/") + COST_JSON
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def read_cost(output_dir: str) -> Optional[CostVector]:
+    """
+    The cost.json of the generated inputs, None if the generator did not
+    write one
+    """
+    path = output_dir.rstrip("/") + COST_JSON
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        data = json.load(f)
+    return CostVector({(name, size): count
+                       for name, size, count in data["entries"]},
+                      data["features"])
+
+
+def cost_report(cost: CostVector, result: CostEstimate,
+                weights: Optional[CostWeights] = None) -> str:
+    """
+    One line summary: the estimate and the classes by their share of it
+    """
+    if weights is None:
+        weights = load_weights()
+    shares = sorted(((weights.constraints.get(name, 0) * units, name)
+                     for name, units in cost.features.items()),
+                    reverse=True)
+    top = ", ".join(f"{name} {constraints / max(result.constraints, 1):.0%}"
+                    for constraints, name in shares[:4] if constraints)
+    return (f"Cost: ~{result.constraints} constraints (circuit size "
+            f"{result.circuit_size}), ~{result.prove_seconds}s and "
+            f"~{result.memory_mb} MB to prove; {top}")
@@ -0,0 +1,195 @@
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import os
+import sys
+
+from generators.utils.interpreter import (
+    ScriptObserver, OP_HASH160, OP_HASH256, SIGVERSION_TAPSCRIPT)
+from generators.utils.preflight import InputVerifier, PreflightError
+from generators.utils.script import PushData, Script
+from generators.utils.tx import Transaction
+
+# hints of one executed signature check, compressions counts the SHA-256
+# blocks the circuit hashes to get the digest
+SighashHint = namedtuple(
+    'SighashHint', ['hash_type', 'digest', 'compressions'])
+# hints of one executed hash opcode
+HashHint = namedtuple('HashHint', ['opcode', 'digest', 'compressions'])
+# sighashes and hashes in execution order, push_offsets holds
+# (script index, data offset) of every push of the circuit scripts
+SpendHints = namedtuple(
+    'SpendHints', ['sighashes', 'hashes', 'push_offsets'])
+
+HINTS_ENV = "GENERATORS_HINTS"
+
+SHA256_BLOCK_SIZE = 64
+# 0x80 terminator and the 64-bit message length
+SHA256_PADDING = 9
+
+
+def hash_blocks(size: int) -> int:
+    """
+    Compression function calls of SHA-256 (and RIPEMD-160 or SHA-1, which
+    pad the same way) for a message of the given size
+    """
+    return (size + SHA256_PADDING + SHA256_BLOCK_SIZE - 1) // \
+        SHA256_BLOCK_SIZE
+
+
+def hash_opcode_blocks(opcode: int, size: int) -> int:
+    if opcode in (OP_HASH160, OP_HASH256):
+        # second hash of the 32 byte digest
+        return hash_blocks(size) + 1
+    return hash_blocks(size)
+
+
+class HintObserver(ScriptObserver):
+    """
+    Records the digest of every executed hash opcode
+    """
+
+    def __init__(self):
+        self.hashes: List[HashHint] = []
+        self._size = 0
+
+    def on_hash(self, opcode: int, size: int):
+        self._size = size
+
+    def on_hash_result(self, opcode: int, digest: bytes):
+        self.hashes.append(HashHint(
+            opcode, bytes(digest), hash_opcode_blocks(opcode, self._size)))
+
+
+def _sighash_blocks(sigversion: int, preimage: Optional[bytes]) -> int:
+    if preimage is None:
+        return 0
+    if sigversion == SIGVERSION_TAPSCRIPT:
+        # the two tag hashes fill the first block
+        return hash_blocks(SHA256_BLOCK_SIZE + len(preimage))
+    return hash_blocks(len(preimage)) + 1
+
+
+def push_offsets(scripts: Sequence[Script]) -> List[Tuple[int, int]]:
+    return [(index, element.offset)
+            for index, script in enumerate(scripts)
+            for element in script.script_elements
+            if isinstance(element, PushData)]
+
+
+def collect_hints(config: Dict, scripts: Sequence[Script] = (),
+                  prevouts: Optional[Sequence[Tuple[int, bytes]]] = None
+                  ) -> SpendHints:
+    """
+    Precomputes the values the circuit derives while executing the spend
+    of a generator config: the signature hash of every executed signature
+    check, the output of every executed hash opcode and the data offsets
+    of the pushes of the circuit scripts.
+
+    Signatures are not verified (every non-empty one is assumed valid, as
+    in the script analysis). If the scripts fail, only the push offsets
+    are returned.
+
+    scripts: the scripts executed by the circuit, in its order
+    prevouts: (amount, script_pub_key) of every input, needed by taproot
+        signature hashes of multi-input transactions
+    """
+    tx = Transaction(config["current_tx"])
+    prev_tx = Transaction(config["prev_tx"])
+    input_index = config["input_to_sign"]
+    output = prev_tx.outputs[tx.inputs[input_index].vout]
+    if prevouts is None and tx.input_count == 1:
+        prevouts = [(output.value, bytes(output.script_pub_key))]
+
+    observer = HintObserver()
+    sighashes = []
+
+    def on_sighash(sigversion: int, hash_type: int,
+                   preimage: Optional[bytes], digest: bytes):
+        sighashes.append(SighashHint(
+            hash_type, digest, _sighash_blocks(sigversion, preimage)))
+
+    witness = []
+    if tx.witness is not None:
+        witness = [item.item for item in tx.witness[input_index].stack_items]
+    verifier = InputVerifier(tx, input_index, output.value, prevouts,
+                             observer, on_sighash, verify_signatures=False)
+    try:
+        verifier.verify(bytes.fromhex(config.get("script_sig", "")),
+                        bytes(output.script_pub_key), witness)
+    except PreflightError as e:
+        print("Hints: the spend does not execute,", e.message)
+        return SpendHints([], [], push_offsets(scripts))
+    return SpendHints(sighashes, observer.hashes, push_offsets(scripts))
+
+
+def spend_sighashes(config: Dict,
+                    prevouts: Optional[Sequence[Tuple[int, bytes]]] = None,
+                    hints: Optional[SpendHints] = None) -> List[SighashHint]:
+    """
+    Signature hashes of the spend, taken from the hints when they were
+    collected and computed otherwise
+    """
+    if hints is None:
+        hints = collect_hints(config, (), prevouts)
+    return hints.sighashes
+
+
+def hints_enabled(argv: Optional[List[str]] = None) -> bool:
+    """
+    Enabled by the GENERATORS_HINTS environment variable or by the --hints
+    flag
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--hints", action="store_true")
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    mode = os.environ.get(HINTS_ENV, "").lower()
+    return args.hints or mode not in ("", "0", "false", "off")
+
+
+def spend_hints(config: Dict, scripts: Sequence[Script] = (),
+                prevouts: Optional[Sequence[Tuple[int, bytes]]] = None
+                ) -> Optional[SpendHints]:
+    """
+    Hints of the spend when they are enabled, None otherwise
+    """
+    if not hints_enabled():
+        return None
+    hints = collect_hints(config, scripts, prevouts)
+    print(hints_report(hints))
+    return hints
+
+
+def hints_to_toml(hints: Optional[SpendHints]) -> str:
+    """
+    [hints] table appended to Prover.toml, digests are hex strings like the
+    other byte inputs. Empty when no hints were collected.
+    """
+    if hints is None:
+        return ""
+
+    def array(values) -> str:
+        return "[" + ", ".join(values) + "]"
+
+    return f"""
+[hints]
+sighash_types = {array(str(h.hash_type) for h in hints.sighashes)}
+sighash_digests = {array(f'"{h.digest.hex()}"' for h in hints.sighashes)}
+hash_opcodes = {array(str(h.opcode) for h in hints.hashes)}
+hash_digests = {array(f'"{h.digest.hex()}"' for h in hints.hashes)}
+push_scripts = {array(str(index) for index, _ in hints.push_offsets)}
+push_offsets = {array(str(offset) for _, offset in hints.push_offsets)}
+"""
+
+
+def hints_report(hints: SpendHints) -> str:
+    """
+    One line summary: how many values were precomputed and how many hash
+    compressions the circuit spends on them
+    """
+    sighash_blocks = sum(h.compressions for h in hints.sighashes)
+    other_blocks = sum(h.compressions for h in hints.hashes)
+    return (f"Hints: {len(hints.sighashes)} signature hashes "
+            f"({sighash_blocks} compressions), {len(hints.hashes)} hash "
+            f"outputs ({other_blocks} compressions), "
+            f"{len(hints.push_offsets)} push offsets")
@@ -0,0 +1,612 @@
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+import hashlib
+
+from bitcoin.core.contrib.ripemd160 import ripemd160
+
+MAX_SCRIPT_ELEMENT_SIZE = 520
+MAX_SCRIPT_OPCODES = 201
+MAX_STACK_ITEMS = 1000
+MAX_PUBKEYS_PER_MULTISIG = 20
+MAX_NUM_SIZE = 4
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1NEGATE = 0x4f
+OP_1 = 0x51
+OP_16 = 0x60
+OP_IF = 0x63
+OP_NOTIF = 0x64
+OP_VERIF = 0x65
+OP_VERNOTIF = 0x66
+OP_ELSE = 0x67
+OP_ENDIF = 0x68
+OP_RIPEMD160 = 0xa6
+OP_SHA1 = 0xa7
+OP_SHA256 = 0xa8
+OP_HASH160 = 0xa9
+OP_HASH256 = 0xaa
+OP_CODESEPARATOR = 0xab
+OP_CHECKSIG = 0xac
+OP_CHECKSIGVERIFY = 0xad
+OP_CHECKMULTISIG = 0xae
+OP_CHECKMULTISIGVERIFY = 0xaf
+OP_CHECKSIGADD = 0xba
+
+# OP_CAT, OP_SUBSTR, OP_LEFT, OP_RIGHT, OP_INVERT, OP_AND, OP_OR, OP_XOR,
+# OP_2MUL, OP_2DIV, OP_MUL, OP_DIV, OP_MOD, OP_LSHIFT, OP_RSHIFT
+DISABLED_OPCODES = frozenset([
+    0x7e, 0x7f, 0x80, 0x81, 0x83, 0x84, 0x85, 0x86,
+    0x8d, 0x8e, 0x95, 0x96, 0x97, 0x98, 0x99])
+
+HASH_FUNCTIONS: Dict[int, Callable[[bytes], bytes]] = {
+    OP_RIPEMD160: lambda data: ripemd160(bytes(data)),
+    OP_SHA1: lambda data: hashlib.sha1(data).digest(),
+    OP_SHA256: lambda data: hashlib.sha256(data).digest(),
+    OP_HASH160: lambda data: ripemd160(hashlib.sha256(data).digest()),
+    OP_HASH256: lambda data: hashlib.sha256(
+        hashlib.sha256(data).digest()).digest(),
+}
+
+# opcodes whose cost depends on an operand, reported by their own
+# observer events
+SIZED_OPCODES = frozenset([
+    *HASH_FUNCTIONS, OP_CHECKSIG, OP_CHECKSIGVERIFY, OP_CHECKMULTISIG,
+    OP_CHECKMULTISIGVERIFY, OP_CHECKSIGADD])
+
+# consensus rules to enforce, None only runs the script (any opcode of
+# any version is accepted)
+SIGVERSION_BASE = 0
+SIGVERSION_WITNESS_V0 = 1
+SIGVERSION_TAPSCRIPT = 3
+
+# sig, pubkey, script code (from the last executed OP_CODESEPARATOR),
+# opcode index of that OP_CODESEPARATOR (0xffffffff if none). Returns
+# False for a wrong signature, raises ScriptEvalError when the failure
+# must abort the script.
+SignatureChecker = Callable[[bytes, bytes, bytes, int], bool]
+
+
+class ScriptEvalError(Exception):
+    pass
+
+
+class ScriptObserver:
+    """
+    Receives the events of one ScriptInterpreter run, every method but
+    on_hash_result and on_stack is called before the opcode changes the
+    stack
+    """
+
+    def on_opcode(self, pos: int, opcode: int, executed: bool):
+        pass
+
+    def on_hash(self, opcode: int, size: int):
+        pass
+
+    def on_hash_result(self, opcode: int, digest: bytes):
+        pass
+
+    def on_checksig(self, opcode: int, sig_size: int, pubkey_size: int):
+        pass
+
+    def on_checkmultisig(self, opcode: int, keys_count: int,
+                         sigs_count: int):
+        pass
+
+    def on_stack(self, stack_size: int, alt_stack_size: int):
+        """
+        Called with the initial depths and after every executed opcode
+        """
+        pass
+
+
+class HashSizeObserver(ScriptObserver):
+    """
+    Collects (opcode, operand size, 0, 0) for every executed hash opcode
+    """
+
+    def __init__(self):
+        self.sizes = set()
+
+    def on_hash(self, opcode: int, size: int):
+        self.sizes.add((opcode, size, 0, 0))
+
+
+class ExecutionPathObserver(HashSizeObserver):
+    """
+    Follows the branch taken by the given stack: counts the executed
+    opcodes, records the stack and alt stack peaks (relative to the
+    initial depth) and the sizes of the executed hash and signature
+    opcodes. Elements of skipped branches are not reported.
+
+    costs counts the executed opcodes above OP_16 by (opcode, operand
+    size): the hashed size for hash opcodes, the keys count for
+    OP_CHECKMULTISIG(VERIFY) and 0 for the others
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.executed_opcodes = 0
+        self.initial_stack_size = None
+        self.stack_peak = 0
+        self.alt_stack_peak = 0
+        self.costs = Counter()
+
+    def on_opcode(self, pos: int, opcode: int, executed: bool):
+        if executed:
+            self.executed_opcodes += 1
+            if opcode > OP_16 and opcode not in SIZED_OPCODES:
+                self.costs[(opcode, 0)] += 1
+
+    def on_hash(self, opcode: int, size: int):
+        super().on_hash(opcode, size)
+        self.costs[(opcode, size)] += 1
+
+    def on_checksig(self, opcode: int, sig_size: int, pubkey_size: int):
+        self.sizes.add((opcode, 0, 0, 0))
+        self.costs[(opcode, 0)] += 1
+
+    def on_checkmultisig(self, opcode: int, keys_count: int,
+                         sigs_count: int):
+        self.sizes.add((opcode, 0, keys_count, sigs_count))
+        self.costs[(opcode, keys_count)] += 1
+
+    def on_stack(self, stack_size: int, alt_stack_size: int):
+        if self.initial_stack_size is None:
+            self.initial_stack_size = stack_size
+        stack_size -= self.initial_stack_size
+        if stack_size > self.stack_peak:
+            self.stack_peak = stack_size
+        if alt_stack_size > self.alt_stack_peak:
+            self.alt_stack_peak = alt_stack_size
+
+
+def decode_num(data: bytes, max_size: int = MAX_NUM_SIZE) -> int:
+    if len(data) > max_size:
+        raise ScriptEvalError("Script number overflow")
+    if not data:
+        return 0
+    value = int.from_bytes(data, byteorder='little')
+    if data[-1] & 0x80:
+        return -(value & ~(0x80 << (8 * (len(data) - 1))))
+    return value
+
+
+def encode_num(value: int) -> bytes:
+    if value == 0:
+        return b""
+    negative = value < 0
+    data = bytearray(abs(value).to_bytes(
+        (abs(value).bit_length() + 7) // 8, byteorder='little'))
+    if data[-1] & 0x80:
+        data.append(0x80 if negative else 0x00)
+    elif negative:
+        data[-1] |= 0x80
+    return bytes(data)
+
+
+def cast_to_bool(data: bytes) -> bool:
+    for i, byte in enumerate(data):
+        if byte != 0:
+            return not (i == len(data) - 1 and byte == 0x80)
+    return False
+
+
+class ScriptInterpreter:
+    """
+    Evaluates a script in a single pass and reports hash and signature
+    operands to an observer as they are executed.
+
+    Without a signature checker every non-empty signature is treated as
+    valid, which is all the size analysis needs. max_ops=None lifts the
+    legacy opcode limit (tapscript has none). sigversion enables the
+    version specific rules (OP_CHECKSIGADD, NULLDUMMY and, for tapscript,
+    MINIMALIF and the disabled OP_CHECKMULTISIG).
+    """
+
+    def __init__(self, observer: Optional[ScriptObserver] = None,
+                 check_signature: Optional[SignatureChecker] = None,
+                 max_ops: Optional[int] = MAX_SCRIPT_OPCODES,
+                 sigversion: Optional[int] = None):
+        self.observer = observer if observer is not None else ScriptObserver()
+        self.check_signature = check_signature
+        self.max_ops = max_ops
+        self.sigversion = sigversion
+
+    def run(self, script: bytes, stack: Optional[List[bytes]] = None
+            ) -> List[bytes]:
+        """
+        stack: initial stack, it is modified in place and returned. Items
+            may be bytes or memoryviews, pushes are views into the script.
+        """
+        self.script = memoryview(script)
+        self.stack = [] if stack is None else stack
+        self.altstack = []
+        self.exec_stack = []
+        self.op_count = 0
+        self.codesep_pos = 0xffffffff
+        self.script_code_start = 0
+
+        raw = self.script
+        script_len = len(raw)
+        observer = self.observer
+        stack = self.stack
+        exec_stack = self.exec_stack
+
+        observer.on_stack(len(stack), 0)
+
+        pos = 0
+        opcode_index = -1
+        while pos < script_len:
+            opcode_pos = pos
+            opcode = raw[pos]
+            pos += 1
+            opcode_index += 1
+            executed = False not in exec_stack
+
+            if opcode <= OP_PUSHDATA4:
+                if opcode < OP_PUSHDATA1:
+                    size = opcode
+                else:
+                    width = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2,
+                             OP_PUSHDATA4: 4}[opcode]
+                    if pos + width > script_len:
+                        raise ScriptEvalError("PUSHDATA: missing data length")
+                    size = int.from_bytes(
+                        raw[pos:pos + width], byteorder='little')
+                    pos += width
+                if pos + size > script_len:
+                    raise ScriptEvalError("PUSHDATA: truncated data")
+                if size > MAX_SCRIPT_ELEMENT_SIZE:
+                    raise ScriptEvalError("Push exceeds the element size")
+                observer.on_opcode(opcode_pos, opcode, executed)
+                pos += size
+                if executed:
+                    stack.append(raw[pos - size:pos])
+                    self._check_stack_size()
+                    observer.on_stack(len(stack), len(self.altstack))
+                continue
+
+            observer.on_opcode(opcode_pos, opcode, executed)
+
+            if opcode in DISABLED_OPCODES or opcode in (OP_VERIF,
+                                                        OP_VERNOTIF):
+                raise ScriptEvalError(f"Opcode 0x{opcode:02x} is disabled")
+
+            if opcode > OP_16:
+                self.op_count += 1
+                self._check_op_count()
+
+            if OP_IF <= opcode <= OP_ENDIF:
+                self._flow_control(opcode, executed)
+            elif executed:
+                operation = OPERATIONS.get(opcode)
+                if operation is None or not self._allowed(opcode):
+                    raise ScriptEvalError(f"Bad opcode 0x{opcode:02x}")
+                if opcode == OP_CODESEPARATOR:
+                    self.codesep_pos = opcode_index
+                    self.script_code_start = pos
+                else:
+                    operation(self, opcode)
+
+            self._check_stack_size()
+            if executed:
+                observer.on_stack(len(stack), len(self.altstack))
+
+        if exec_stack:
+            raise ScriptEvalError("Unterminated IF/ELSE block")
+        return stack
+
+    def _check_stack_size(self):
+        if len(self.stack) + len(self.altstack) > MAX_STACK_ITEMS:
+            raise ScriptEvalError("Stack size limit exceeded")
+
+    def _allowed(self, opcode: int) -> bool:
+        if self.sigversion is None:
+            return True
+        if self.sigversion == SIGVERSION_TAPSCRIPT:
+            return opcode not in (OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY)
+        return opcode != OP_CHECKSIGADD
+
+    def _check_op_count(self):
+        if self.max_ops is not None and self.op_count > self.max_ops:
+            raise ScriptEvalError("Opcode count limit exceeded")
+
+    def _flow_control(self, opcode: int, executed: bool):
+        if opcode in (OP_IF, OP_NOTIF):
+            value = False
+            if executed:
+                top = self.pop()
+                if self.sigversion == SIGVERSION_TAPSCRIPT and \
+                        top not in (b"", b"\x01"):
+                    raise ScriptEvalError("OP_IF argument must be minimal")
+                value = cast_to_bool(top)
+                if opcode == OP_NOTIF:
+                    value = not value
+            self.exec_stack.append(value)
+        elif opcode == OP_ELSE:
+            if not self.exec_stack:
+                raise ScriptEvalError("OP_ELSE without OP_IF")
+            self.exec_stack[-1] = not self.exec_stack[-1]
+        elif opcode == OP_ENDIF:
+            if not self.exec_stack:
+                raise ScriptEvalError("OP_ENDIF without OP_IF")
+            self.exec_stack.pop()
+
+    def require(self, count: int):
+        if len(self.stack) < count:
+            raise ScriptEvalError("Not enough stack items")
+
+    def pop(self) -> bytes:
+        self.require(1)
+        return self.stack.pop()
+
+    def pop_num(self) -> int:
+        return decode_num(self.pop())
+
+    def signature_ok(self, sig: bytes, pubkey: bytes) -> bool:
+        if self.check_signature is None:
+            return bool(sig)
+        # tapscript still rejects an empty public key for an empty signature
+        if not sig and self.sigversion != SIGVERSION_TAPSCRIPT:
+            return False
+        return self.check_signature(
+            sig, pubkey, self.script[self.script_code_start:].tobytes(),
+            self.codesep_pos)
+
+
+def _push_number(interp: ScriptInterpreter, opcode: int):
+    interp.stack.append(encode_num(opcode - (OP_1 - 1)))
+
+
+def _nop(interp: ScriptInterpreter, opcode: int):
+    pass
+
+
+def _verify(interp: ScriptInterpreter, opcode: int):
+    if not cast_to_bool(interp.pop()):
+        raise ScriptEvalError("OP_VERIFY failed")
+
+
+def _return(interp: ScriptInterpreter, opcode: int):
+    raise ScriptEvalError("OP_RETURN executed")
+
+
+def _to_altstack(interp: ScriptInterpreter, opcode: int):
+    interp.altstack.append(interp.pop())
+
+
+def _from_altstack(interp: ScriptInterpreter, opcode: int):
+    if not interp.altstack:
+        raise ScriptEvalError("Not enough alt stack items")
+    interp.stack.append(interp.altstack.pop())
+
+
+def _stack_operation(count: int, operation: Callable[[List[bytes]], None]):
+    """
+    operation rearranges the top count items of the stack
+    """
+    def run(interp: ScriptInterpreter, opcode: int):
+        interp.require(count)
+        operation(interp.stack)
+    return run
+
+
+def _2rot(stack: List[bytes]):
+    stack.extend(stack[-6:-4])
+    del stack[-8:-6]
+
+
+def _2swap(stack: List[bytes]):
+    stack[-4:] = stack[-2:] + stack[-4:-2]
+
+
+def _ifdup(interp: ScriptInterpreter, opcode: int):
+    interp.require(1)
+    if cast_to_bool(interp.stack[-1]):
+        interp.stack.append(interp.stack[-1])
+
+
+def _depth(interp: ScriptInterpreter, opcode: int):
+    interp.stack.append(encode_num(len(interp.stack)))
+
+
+def _pick_roll(interp: ScriptInterpreter, opcode: int):
+    interp.require(2)
+    n = interp.pop_num()
+    if n < 0 or n >= len(interp.stack):
+        raise ScriptEvalError("OP_PICK/OP_ROLL index out of range")
+    item = interp.stack[-n - 1]
+    if opcode == 0x7a:
+        del interp.stack[-n - 1]
+    interp.stack.append(item)
+
+
+def _size(interp: ScriptInterpreter, opcode: int):
+    interp.require(1)
+    interp.stack.append(encode_num(len(interp.stack[-1])))
+
+
+def _equal(interp: ScriptInterpreter, opcode: int):
+    interp.require(2)
+    equal = interp.stack.pop() == interp.stack.pop()
+    if opcode == 0x88:
+        if not equal:
+            raise ScriptEvalError("OP_EQUALVERIFY failed")
+    else:
+        interp.stack.append(b"\x01" if equal else b"")
+
+
+UNARY_OPERATIONS: Dict[int, Callable[[int], int]] = {
+    0x8b: lambda a: a + 1,
+    0x8c: lambda a: a - 1,
+    0x8f: lambda a: -a,
+    0x90: abs,
+    0x91: lambda a: int(a == 0),
+    0x92: lambda a: int(a != 0),
+}
+
+BINARY_OPERATIONS: Dict[int, Callable[[int, int], int]] = {
+    0x93: lambda a, b: a + b,
+    0x94: lambda a, b: a - b,
+    0x9a: lambda a, b: int(a != 0 and b != 0),
+    0x9b: lambda a, b: int(a != 0 or b != 0),
+    0x9c: lambda a, b: int(a == b),
+    0x9d: lambda a, b: int(a == b),
+    0x9e: lambda a, b: int(a != b),
+    0x9f: lambda a, b: int(a < b),
+    0xa0: lambda a, b: int(a > b),
+    0xa1: lambda a, b: int(a <= b),
+    0xa2: lambda a, b: int(a >= b),
+    0xa3: min,
+    0xa4: max,
+}
+
+
+def _unary(interp: ScriptInterpreter, opcode: int):
+    interp.stack.append(encode_num(UNARY_OPERATIONS[opcode](interp.pop_num())))
+
+
+def _binary(interp: ScriptInterpreter, opcode: int):
+    interp.require(2)
+    b = interp.pop_num()
+    a = interp.pop_num()
+    result = BINARY_OPERATIONS[opcode](a, b)
+    if opcode == 0x9d:
+        if not result:
+            raise ScriptEvalError("OP_NUMEQUALVERIFY failed")
+    else:
+        interp.stack.append(encode_num(result))
+
+
+def _within(interp: ScriptInterpreter, opcode: int):
+    interp.require(3)
+    upper = interp.pop_num()
+    lower = interp.pop_num()
+    value = interp.pop_num()
+    interp.stack.append(b"\x01" if lower <= value < upper else b"")
+
+
+def _hash(interp: ScriptInterpreter, opcode: int):
+    interp.require(1)
+    interp.observer.on_hash(opcode, len(interp.stack[-1]))
+    digest = HASH_FUNCTIONS[opcode](interp.stack.pop())
+    interp.observer.on_hash_result(opcode, digest)
+    interp.stack.append(digest)
+
+
+def _checksig(interp: ScriptInterpreter, opcode: int):
+    interp.require(2)
+    pubkey = interp.stack[-1]
+    sig = interp.stack[-2]
+    interp.observer.on_checksig(opcode, len(sig), len(pubkey))
+    ok = interp.signature_ok(sig, pubkey)
+    del interp.stack[-2:]
+    if opcode == OP_CHECKSIGVERIFY:
+        if not ok:
+            raise ScriptEvalError("OP_CHECKSIGVERIFY failed")
+    else:
+        interp.stack.append(b"\x01" if ok else b"")
+
+
+def _checksigadd(interp: ScriptInterpreter, opcode: int):
+    interp.require(3)
+    pubkey = interp.stack.pop()
+    n = interp.pop_num()
+    sig = interp.stack.pop()
+    interp.observer.on_checksig(opcode, len(sig), len(pubkey))
+    interp.stack.append(encode_num(
+        n + int(interp.signature_ok(sig, pubkey))))
+
+
+def _checkmultisig(interp: ScriptInterpreter, opcode: int):
+    stack = interp.stack
+    interp.require(1)
+    keys_count = decode_num(stack[-1])
+    if keys_count < 0 or keys_count > MAX_PUBKEYS_PER_MULTISIG:
+        raise ScriptEvalError("Invalid public key count")
+    interp.op_count += keys_count
+    interp._check_op_count()
+    interp.require(keys_count + 2)
+    sigs_count = decode_num(stack[-keys_count - 2])
+    if sigs_count < 0 or sigs_count > keys_count:
+        raise ScriptEvalError("Invalid signature count")
+    # the extra item consumed by the off-by-one bug
+    interp.require(keys_count + sigs_count + 3)
+
+    interp.observer.on_checkmultisig(opcode, keys_count, sigs_count)
+    dummy = stack[-keys_count - sigs_count - 3]
+    if interp.sigversion is not None and len(dummy):
+        raise ScriptEvalError("CHECKMULTISIG dummy must be empty")
+
+    keys = stack[-keys_count - 1:-1] if keys_count else []
+    sigs_end = -keys_count - 2
+    sigs = stack[sigs_end - sigs_count:sigs_end] if sigs_count else []
+    # both are checked from the last pushed one (the stack top), as
+    # Bitcoin Core does
+    keys = keys[::-1]
+    sigs = sigs[::-1]
+
+    success = True
+    key_idx = 0
+    sig_idx = 0
+    while success and sig_idx < len(sigs):
+        if interp.signature_ok(sigs[sig_idx], keys[key_idx]):
+            sig_idx += 1
+        key_idx += 1
+        if len(sigs) - sig_idx > len(keys) - key_idx:
+            success = False
+
+    del stack[-(keys_count + sigs_count + 3):]
+    if opcode == OP_CHECKMULTISIGVERIFY:
+        if not success:
+            raise ScriptEvalError("OP_CHECKMULTISIGVERIFY failed")
+    else:
+        stack.append(b"\x01" if success else b"")
+
+
+OPERATIONS: Dict[int, Callable[[ScriptInterpreter, int], None]] = {
+    OP_1NEGATE: _push_number,
+    **{opcode: _push_number for opcode in range(OP_1, OP_16 + 1)},
+    0x61: _nop,
+    0x69: _verify,
+    0x6a: _return,
+    0x6b: _to_altstack,
+    0x6c: _from_altstack,
+    0x6d: _stack_operation(2, lambda s: s.__delitem__(slice(-2, None))),
+    0x6e: _stack_operation(2, lambda s: s.extend(s[-2:])),
+    0x6f: _stack_operation(3, lambda s: s.extend(s[-3:])),
+    0x70: _stack_operation(4, lambda s: s.extend(s[-4:-2])),
+    0x71: _stack_operation(6, _2rot),
+    0x72: _stack_operation(4, _2swap),
+    0x73: _ifdup,
+    0x74: _depth,
+    0x75: _stack_operation(1, lambda s: s.pop()),
+    0x76: _stack_operation(1, lambda s: s.append(s[-1])),
+    0x77: _stack_operation(2, lambda s: s.__delitem__(-2)),
+    0x78: _stack_operation(2, lambda s: s.append(s[-2])),
+    0x79: _pick_roll,
+    0x7a: _pick_roll,
+    0x7b: _stack_operation(3, lambda s: s.append(s.pop(-3))),
+    0x7c: _stack_operation(2, lambda s: s.append(s.pop(-2))),
+    0x7d: _stack_operation(2, lambda s: s.insert(-2, s[-1])),
+    0x82: _size,
+    0x87: _equal,
+    0x88: _equal,
+    **{opcode: _unary for opcode in UNARY_OPERATIONS},
+    **{opcode: _binary for opcode in BINARY_OPERATIONS},
+    0xa5: _within,
+    **{opcode: _hash for opcode in HASH_FUNCTIONS},
+    OP_CODESEPARATOR: _nop,
+    OP_CHECKSIG: _checksig,
+    OP_CHECKSIGVERIFY: _checksig,
+    OP_CHECKMULTISIG: _checkmultisig,
+    OP_CHECKMULTISIGVERIFY: _checkmultisig,
+    # OP_NOP1, OP_CHECKLOCKTIMEVERIFY, OP_CHECKSEQUENCEVERIFY, OP_NOP4-10
+    # are not enforced here, the locktimes are checked by the circuits
+    **{opcode: _nop for opcode in range(0xb0, 0xba)},
+    OP_CHECKSIGADD: _checksigadd,
+}
@@ -1,7 +1,81 @@
-PATH = "./crates/script/src/generated.nr"
+from typing import Dict, List, Optional, Sequence
+import json
+import os
+import time
 
+from generators.utils.sources import tidy_noir, write_if_changed
+from generators.utils.straight_line import (
+    codegen_mode, render, straight_line_programs)
 
-def generate(sizes: set, taproot: bool = False):
+PATH = "./crates/script/src/generated.nr"
+# size sets of the generated spends, the input of
+# `python -m generators.batch.main`
+SIZES_LOG = "./target/sizes.jsonl"
+# records the size set of every generated spend in SIZES_LOG
+RECORD_SIZES_ENV = "GENERATORS_RECORD_SIZES"
+# path of a batch size set every spend is generated with
+BATCH_SIZES_ENV = "GENERATORS_BATCH_SIZES"
+
+
+def sizes_enabled() -> bool:
+    """
+    Size sets are recorded on request and in batch mode
+    """
+    return any(os.environ.get(env, "0") not in ("", "0")
+               for env in (RECORD_SIZES_ENV, BATCH_SIZES_ENV))
+
+
+def record_sizes(sizes: set, taproot: bool, path: str = SIZES_LOG):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps({
+            "recorded_at": time.time(),
+            "taproot": taproot,
+            "sizes": sorted(list(e) for e in sizes),
+        }) + "\n")
+
+
+def load_sizes(path: str = SIZES_LOG) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def batch_sizes(taproot: bool) -> Optional[set]:
+    """
+    The size set of the batch in GENERATORS_BATCH_SIZES, None outside of
+    batch mode
+    """
+    path = os.environ.get(BATCH_SIZES_ENV, "")
+    if path in ("", "0"):
+        return None
+    with open(path, "r") as f:
+        batch = json.load(f)
+    if batch["taproot"] != taproot:
+        raise ValueError(
+            f"{path} is a {'taproot' if batch['taproot'] else 'non-taproot'}"
+            f" batch, it can not generate this spend")
+    return {tuple(e) for e in batch["sizes"]}
+
+
+def generate(sizes: set, taproot: bool = False,
+             scripts: Sequence = ()) -> bool:
+    """
+    Writes generated.nr in the layout of `nargo fmt`, returns whether it
+    changed. In batch mode the branches cover the whole batch so every
+    spend of it shares one circuit. With GENERATORS_CODEGEN=straight_line
+    the scripts executed by the circuit also get a program specialized to
+    their opcode sequence, run instead of the interpreter loop.
+    """
+    if sizes_enabled():
+        record_sizes(sizes, taproot)
+    batch = batch_sizes(taproot)
+    if batch is not None:
+        if not sizes <= batch:
+            print(f"Spend sizes not covered by the batch: "
+                  f"{sorted(sizes - batch)}")
+        sizes = sizes | batch
 
     hash160 = {e for e in sizes if e[0] == 169}
     hash256 = {e for e in sizes if e[0] == 170}
@@ -18,94 +92,109 @@ def generate(sizes: set, taproot: bool = False):
     hash160ifs = "\n".join(
         f"""    if len == {e[1]} {{
         stack.op_hash160::<{e[1]}>();
-    }}""" for e in hash160
+    }}""" for e in sorted(hash160)
     )
 
     hash256ifs = "\n".join(
         f"""    if len == {e[1]} {{
         stack.op_hash256::<{e[1]}>();
-    }}""" for e in hash256
+    }}""" for e in sorted(hash256)
     )
 
     ripemd160ifs = "\n".join(
         f"""    if len == {e[1]} {{
         stack.op_ripemd160::<{e[1]}>();
-    }}""" for e in ripemd160
+    }}""" for e in sorted(ripemd160)
     )
 
     sha256ifs = "\n".join(
         f"""    if len == {e[1]} {{
         stack.op_sha256::<{e[1]}>();
-    }}""" for e in sha256
+    }}""" for e in sorted(sha256)
     )
 
     sha1ifs = "\n".join(
         f"""    if len == {e[1]} {{
         stack.op_sha1::<{e[1]}>();
-    }}""" for e in sha1
+    }}""" for e in sorted(sha1)
     )
 
     if not taproot:
-        checksigif = ("""stack
+        checksigif = ("""    stack
         .op_checksig::<SCRIPT_CODE_LEN, N_OUTPUT_SIZE, INPUT_TO_SIGN, INPUT_TO_SIGN_LEN, N_INPUT_SIZE>(
             address,
             verify,
             sigadd,
         );""") if checksig else ""
     else:
-        checksigif = (
-            """stack.op_checksig_p2tr::<UTXOS_LEN, CURRENT_INPUT_COUNT>(utxo_data, verify, sigadd, Option::none(), leaf_script_hash);""") if checksig else ""
+        checksigif = ("""    stack.op_checksig_p2tr::<UTXOS_LEN, CURRENT_INPUT_COUNT>(
+        utxo_data,
+        verify,
+        sigadd,
+        Option::none(),
+        leaf_script_hash,
+    );""") if checksig else ""
 
     mulsigifs = "\n".join(
         f"""    if (n == {e[2]}) & (m == {e[3]}) {{
-        stack.op_checkmulsig::<SCRIPT_CODE_LEN, N_OUTPUT_SIZE, INPUT_TO_SIGN, INPUT_TO_SIGN_LEN, N_INPUT_SIZE, {e[2]}, {e[3]}>(address, verify);
-    }}""" for e in mulsig
+        stack
+            .op_checkmulsig::<SCRIPT_CODE_LEN, N_OUTPUT_SIZE, INPUT_TO_SIGN, INPUT_TO_SIGN_LEN, N_INPUT_SIZE, {e[2]}, {e[3]}>(
+                address,
+                verify,
+            );
+    }}""" for e in sorted(mulsig)
     )
 
     pushbytesifs = "\n".join(
-        f"""\tif len == {e[0]} {{
+        f"""    if len == {e[0]} {{
         let mut value = [0; {e[0]}];
         for i in 0..{e[0]} {{
             value[i] = script[cur_pos];
             cur_pos += 1;
         }}
         stack.push_bytes(value);
-    }}""" for e in pushbytes
+    }}""" for e in sorted(pushbytes)
     )
 
     pushdata1ifs = "\n".join(
-        f"""\tif len == {e[1]} {{
+        f"""    if len == {e[1]} {{
         let mut value = [0; {e[1]}];
         for i in 0..{e[1]} {{
             value[i] = script[cur_pos];
             cur_pos += 1;
         }}
         stack.push_bytes(value);
-    }}""" for e in pushdata1
+    }}""" for e in sorted(pushdata1)
     )
 
     pushdata2ifs = "\n".join(
-        f"""\tif len == {e[1]} {{
+        f"""    if len == {e[1]} {{
         let mut value = [0; {e[1]}];
         for i in 0..{e[1]} {{
             value[i] = script[cur_pos];
             cur_pos += 1;
         }}
         stack.push_bytes(value);
-    }}""" for e in pushdata2
+    }}""" for e in sorted(pushdata2)
     )
 
     pushdata4ifs = "\n".join(
-        f"""\tif len == {e[1]} {{
+        f"""    if len == {e[1]} {{
         let mut value = [0; {e[1]}];
         for i in 0..{e[1]} {{
             value[i] = script[cur_pos];
             cur_pos += 1;
         }}
         stack.push_bytes(value);
-    }}""" for e in pushdata4
+    }}""" for e in sorted(pushdata4)
     )
 
+    programs = {}
+    if codegen_mode() == "straight_line":
+        programs = straight_line_programs(scripts, taproot)
+        print(f"Straight-line code for {len(programs)} of {len(scripts)} "
+              f"scripts, the others run on the interpreter")
+
     with open(PATH + ".template") as file:
         templateGenerated = file.read()
 
@@ -121,7 +210,7 @@ def generate(sizes: set, taproot: bool = False):
         pushdata1=pushdata1ifs,
         pushdata2=pushdata2ifs,
         pushdata4=pushdata4ifs,
+        **render(programs),
     )
 
-    with open(PATH, 'w') as file:
-        file.write(generatedFile)
+    return write_if_changed(PATH, tidy_noir(generatedFile))
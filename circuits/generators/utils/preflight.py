@@ -0,0 +1,468 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from generators.utils.interpreter import (
+    ScriptEvalError, ScriptInterpreter, ScriptObserver, cast_to_bool, OP_PUSHDATA1,
+    OP_PUSHDATA2, OP_PUSHDATA4, OP_16, SIGVERSION_BASE, SIGVERSION_WITNESS_V0,
+    SIGVERSION_TAPSCRIPT, MAX_SCRIPT_ELEMENT_SIZE, MAX_SCRIPT_OPCODES)
+from generators.utils.secp256k1 import (
+    ecdsa_verify, is_valid_der_signature, parse_der_signature,
+    schnorr_verify, taproot_tweak)
+from generators.utils.sighash import (
+    LEGACY_SIGHASH_ONE, SignatureHasher, hash256, tagged_hash, tapleaf_hash)
+from generators.utils.tx import Transaction
+
+# "1" verifies every spend before the circuit files are written
+PREFLIGHT_ENV = "GENERATORS_PREFLIGHT"
+
+MAX_SCRIPT_SIZE = 10000
+TAPSCRIPT_LEAF_VERSION = 0xc0
+ANNEX_TAG = 0x50
+TAPROOT_CONTROL_BASE_SIZE = 33
+TAPROOT_CONTROL_NODE_SIZE = 32
+TAPROOT_CONTROL_MAX_NODES = 128
+
+# opcodes that make a tapscript succeed unconditionally (BIP342)
+OP_SUCCESS = frozenset(
+    [0x50, 0x62, 0x7e, 0x7f, 0x80, 0x81, 0x83, 0x84, 0x85, 0x86, 0x89, 0x8a,
+     0x8d, 0x8e, 0x95, 0x96, 0x97, 0x98, 0x99] + list(range(0xbb, 0xff)))
+
+# sigversion, hash type, preimage (None for the constant legacy digest)
+# and digest of every computed signature hash
+SighashCallback = Callable[[int, int, Optional[bytes], bytes], None]
+
+
+class PreflightError(Exception):
+    """
+    A spend that the circuit could not prove.
+
+    code: short machine readable reason
+    message: human readable details
+    input_index: input of the current transaction being verified
+    """
+
+    def __init__(self, code: str, message: str, input_index: int):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.input_index = input_index
+
+    def to_dict(self) -> Dict:
+        return {"error": self.code, "message": self.message,
+                "input_index": self.input_index}
+
+
+def _push(data: bytes) -> bytes:
+    """
+    Minimal push of data, as CScript() << data serializes it
+    """
+    size = len(data)
+    if size < OP_PUSHDATA1:
+        return bytes([size]) + data
+    if size <= 0xff:
+        return bytes([OP_PUSHDATA1, size]) + data
+    if size <= 0xffff:
+        return bytes([OP_PUSHDATA2]) + size.to_bytes(2, 'little') + data
+    return bytes([OP_PUSHDATA4]) + size.to_bytes(4, 'little') + data
+
+
+def _opcode_spans(script: bytes) -> List[Tuple[int, int]]:
+    """
+    (start, end) of every opcode, raises ScriptEvalError on a truncated
+    push
+    """
+    spans = []
+    pos = 0
+    while pos < len(script):
+        start = pos
+        opcode = script[pos]
+        pos += 1
+        if opcode <= OP_PUSHDATA4:
+            size = opcode
+            if opcode >= OP_PUSHDATA1:
+                width = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2,
+                         OP_PUSHDATA4: 4}[opcode]
+                if pos + width > len(script):
+                    raise ScriptEvalError("PUSHDATA: missing data length")
+                size = int.from_bytes(script[pos:pos + width], 'little')
+                pos += width
+            if pos + size > len(script):
+                raise ScriptEvalError("PUSHDATA: truncated data")
+            pos += size
+        spans.append((start, pos))
+    return spans
+
+
+def find_and_delete(script: bytes, push: bytes) -> bytes:
+    """
+    Removes every opcode equal to push, like FindAndDelete of the legacy
+    signature hash
+    """
+    return b"".join(script[start:end] for start, end in _opcode_spans(script)
+                    if script[start:end] != push)
+
+
+def is_push_only(script: bytes) -> bool:
+    try:
+        spans = _opcode_spans(script)
+    except ScriptEvalError:
+        return False
+    return all(script[start] <= OP_16 for start, _ in spans)
+
+
+class SignatureChecker:
+    """
+    Consensus signature checks of one input for ScriptInterpreter.
+
+    Legacy and segwit v0 signatures are strict DER ECDSA signatures
+    (BIP66), tapscript signatures are BIP340 Schnorr signatures. An
+    invalid non-empty tapscript signature aborts the script. With
+    verify=False only the signature hashes are computed and every
+    well-formed non-empty signature passes.
+    """
+
+    def __init__(self, hasher: SignatureHasher, input_index: int,
+                 sigversion: int, amount: int = 0,
+                 leaf_hash: Optional[bytes] = None,
+                 annex: Optional[bytes] = None,
+                 on_sighash: Optional[SighashCallback] = None,
+                 verify: bool = True):
+        self.hasher = hasher
+        self.input_index = input_index
+        self.sigversion = sigversion
+        self.amount = amount
+        self.leaf_hash = leaf_hash
+        self.annex = annex
+        self.on_sighash = on_sighash
+        self.verify = verify
+
+    def __call__(self, sig: bytes, pubkey: bytes, script_code: bytes,
+                 codesep_pos: int) -> bool:
+        sig = bytes(sig)
+        pubkey = bytes(pubkey)
+        if self.sigversion == SIGVERSION_TAPSCRIPT:
+            return self._check_schnorr(sig, pubkey, codesep_pos)
+        return self._check_ecdsa(sig, pubkey, script_code)
+
+    def _check_ecdsa(self, sig: bytes, pubkey: bytes,
+                     script_code: bytes) -> bool:
+        if not is_valid_der_signature(sig):
+            raise ScriptEvalError("Non-canonical DER signature")
+        hash_type = sig[-1]
+        if self.sigversion == SIGVERSION_BASE:
+            script_code = find_and_delete(script_code, _push(sig))
+            preimage = self.hasher.legacy_preimage(
+                self.input_index, script_code, hash_type)
+        else:
+            preimage = self.hasher.segwit_v0_preimage(
+                self.input_index, script_code, self.amount, hash_type)
+        digest = LEGACY_SIGHASH_ONE if preimage is None \
+            else hash256(preimage)
+        if self.on_sighash is not None:
+            self.on_sighash(self.sigversion, hash_type, preimage, digest)
+        if not self.verify:
+            return True
+        r, s = parse_der_signature(sig[:-1])
+        return ecdsa_verify(pubkey, r, s, digest)
+
+    def _check_schnorr(self, sig: bytes, pubkey: bytes,
+                       codesep_pos: int) -> bool:
+        if not pubkey:
+            raise ScriptEvalError("Empty tapscript public key")
+        if not sig:
+            return False
+        if len(pubkey) != 32:
+            # unknown public key types are reserved for soft forks
+            return True
+        if not self.verify_schnorr(pubkey, sig, codesep_pos):
+            raise ScriptEvalError("Invalid Schnorr signature")
+        return True
+
+    def verify_schnorr(self, pubkey: bytes, sig: bytes,
+                       codesep_pos: int = 0xffffffff) -> bool:
+        if len(sig) == 65:
+            hash_type = sig[64]
+            if hash_type == 0x00:
+                raise ScriptEvalError("Explicit SIGHASH_DEFAULT")
+        elif len(sig) == 64:
+            hash_type = 0x00
+        else:
+            raise ScriptEvalError("Invalid Schnorr signature size")
+        try:
+            preimage = self.hasher.taproot_preimage(
+                self.input_index, hash_type, self.leaf_hash, self.annex,
+                codesep_pos)
+        except ValueError as e:
+            raise ScriptEvalError(str(e))
+        digest = tagged_hash("TapSighash", preimage)
+        if self.on_sighash is not None:
+            self.on_sighash(self.sigversion, hash_type, preimage, digest)
+        if not self.verify:
+            return True
+        return schnorr_verify(pubkey, sig[:64], digest)
+
+
+def _run(script: bytes, stack: List[bytes], sigversion: int,
+         checker: SignatureChecker,
+         observer: Optional[ScriptObserver] = None) -> List[bytes]:
+    if sigversion != SIGVERSION_TAPSCRIPT and len(script) > MAX_SCRIPT_SIZE:
+        raise ScriptEvalError("Script exceeds the size limit")
+    interpreter = ScriptInterpreter(
+        observer, check_signature=checker, sigversion=sigversion,
+        max_ops=None if sigversion == SIGVERSION_TAPSCRIPT
+        else MAX_SCRIPT_OPCODES)
+    return interpreter.run(script, stack)
+
+
+def _witness_program(script: bytes) -> Optional[Tuple[int, bytes]]:
+    if not 4 <= len(script) <= 42 or script[1] != len(script) - 2:
+        return None
+    if script[0] == 0:
+        return 0, script[2:]
+    if 0x51 <= script[0] <= OP_16:
+        return script[0] - 0x50, script[2:]
+    return None
+
+
+class InputVerifier:
+    """
+    Runs the scripts of one input in consensus order. observer receives
+    the events of every script run (scriptSig, scriptPubKey, redeem and
+    witness scripts), on_sighash and verify_signatures are passed to the
+    signature checkers.
+    """
+
+    def __init__(self, tx: Transaction, input_index: int, amount: int,
+                 prevouts: Optional[Sequence[Tuple[int, bytes]]],
+                 observer: Optional[ScriptObserver] = None,
+                 on_sighash: Optional[SighashCallback] = None,
+                 verify_signatures: bool = True):
+        self.tx = tx
+        self.input_index = input_index
+        self.amount = amount
+        self.hasher = SignatureHasher(tx, prevouts)
+        self.observer = observer
+        self.on_sighash = on_sighash
+        self.verify_signatures = verify_signatures
+
+    def fail(self, code: str, message: str):
+        raise PreflightError(code, message, self.input_index)
+
+    def checker(self, sigversion: int, **kwargs) -> SignatureChecker:
+        return SignatureChecker(self.hasher, self.input_index, sigversion,
+                                self.amount, on_sighash=self.on_sighash,
+                                verify=self.verify_signatures, **kwargs)
+
+    def run(self, script: bytes, stack: List[bytes], sigversion: int,
+            checker: SignatureChecker, clean_stack: bool = False):
+        try:
+            stack = _run(script, stack, sigversion, checker, self.observer)
+        except ScriptEvalError as e:
+            self.fail("script_error", str(e))
+        if not stack or not cast_to_bool(stack[-1]):
+            self.fail("eval_false", "Script evaluated to false")
+        if clean_stack and len(stack) != 1:
+            self.fail("clean_stack", "Witness script left extra items")
+
+    def verify(self, script_sig: bytes, script_pub_key: bytes,
+               witness: List[bytes]):
+        base = self.checker(SIGVERSION_BASE)
+        try:
+            stack = _run(script_sig, [], SIGVERSION_BASE, base, self.observer)
+        except ScriptEvalError as e:
+            self.fail("script_error", f"scriptSig: {e}")
+        p2sh_stack = list(stack)
+        self.run(script_pub_key, stack, SIGVERSION_BASE, base)
+
+        program = _witness_program(script_pub_key)
+        if program is not None:
+            if script_sig:
+                self.fail("witness_malleated",
+                          "Native witness spend with a scriptSig")
+            self.verify_witness(*program, witness, is_p2sh=False)
+            return
+
+        if len(script_pub_key) == 23 and script_pub_key[:2] == b"\xa9\x14" \
+                and script_pub_key[-1] == 0x87:
+            if not is_push_only(script_sig):
+                self.fail("sig_push_only", "P2SH scriptSig is not push only")
+            redeem_script = bytes(p2sh_stack.pop())
+            self.run(redeem_script, p2sh_stack, SIGVERSION_BASE, base)
+            program = _witness_program(redeem_script)
+            if program is not None:
+                if script_sig != _push(redeem_script):
+                    self.fail("witness_malleated_p2sh",
+                              "P2SH witness spend with extra scriptSig data")
+                self.verify_witness(*program, witness, is_p2sh=True)
+                return
+
+        if witness:
+            self.fail("witness_unexpected",
+                      "Witness data for a non-witness spend")
+
+    def verify_witness(self, version: int, program: bytes,
+                       witness: List[bytes], is_p2sh: bool):
+        if version == 0 and len(program) == 32:
+            if not witness:
+                self.fail("witness_program_witness_empty", "Empty witness")
+            witness_script = bytes(witness[-1])
+            if hashlib.sha256(witness_script).digest() != program:
+                self.fail("witness_program_mismatch",
+                          "Witness script does not match the program")
+            self.run_witness(witness_script, witness[:-1],
+                             SIGVERSION_WITNESS_V0,
+                             self.checker(SIGVERSION_WITNESS_V0))
+        elif version == 0 and len(program) == 20:
+            if len(witness) != 2:
+                self.fail("witness_program_mismatch",
+                          "P2WPKH witness must have two items")
+            script_code = b"\x76\xa9\x14" + program + b"\x88\xac"
+            self.run_witness(script_code, witness, SIGVERSION_WITNESS_V0,
+                             self.checker(SIGVERSION_WITNESS_V0))
+        elif version == 0:
+            self.fail("witness_program_wrong_length",
+                      "Invalid witness v0 program length")
+        elif version == 1 and len(program) == 32 and not is_p2sh:
+            self.verify_taproot(program, witness)
+        # other versions are left for future soft forks and succeed
+
+    def run_witness(self, script: bytes, stack: List[bytes], sigversion: int,
+                    checker: SignatureChecker):
+        if any(len(item) > MAX_SCRIPT_ELEMENT_SIZE for item in stack):
+            self.fail("push_size", "Witness item exceeds the element size")
+        self.run(script, list(stack), sigversion, checker, clean_stack=True)
+
+    def verify_taproot(self, program: bytes, witness: List[bytes]):
+        if not witness:
+            self.fail("witness_program_witness_empty", "Empty witness")
+        annex = None
+        if len(witness) >= 2 and witness[-1] and witness[-1][0] == ANNEX_TAG:
+            annex = bytes(witness[-1])
+            witness = witness[:-1]
+
+        if len(witness) == 1:
+            checker = self.checker(SIGVERSION_TAPSCRIPT, annex=annex)
+            try:
+                ok = checker.verify_schnorr(program, bytes(witness[0]))
+            except ScriptEvalError as e:
+                self.fail("schnorr_sig", str(e))
+            if not ok:
+                self.fail("schnorr_sig", "Invalid key path signature")
+            return
+
+        control = bytes(witness[-1])
+        script = bytes(witness[-2])
+        stack = witness[:-2]
+        path_size = len(control) - TAPROOT_CONTROL_BASE_SIZE
+        if path_size < 0 or path_size % TAPROOT_CONTROL_NODE_SIZE or \
+                path_size // TAPROOT_CONTROL_NODE_SIZE > \
+                TAPROOT_CONTROL_MAX_NODES:
+            self.fail("taproot_control_size", "Invalid control block size")
+
+        leaf_version = control[0] & 0xfe
+        leaf_hash = tapleaf_hash(script, leaf_version)
+        node = leaf_hash
+        for pos in range(TAPROOT_CONTROL_BASE_SIZE, len(control),
+                         TAPROOT_CONTROL_NODE_SIZE):
+            sibling = control[pos:pos + TAPROOT_CONTROL_NODE_SIZE]
+            node = tagged_hash("TapBranch", min(node, sibling) +
+                               max(node, sibling))
+        if taproot_tweak(control[1:33], node) != (control[0] & 1, program):
+            self.fail("witness_program_mismatch",
+                      "Control block does not commit to the output key")
+
+        if leaf_version != TAPSCRIPT_LEAF_VERSION:
+            # unknown leaf versions are left for future soft forks
+            return
+        try:
+            spans = _opcode_spans(script)
+        except ScriptEvalError as e:
+            self.fail("script_error", str(e))
+        if any(script[start] in OP_SUCCESS for start, _ in spans):
+            return
+        self.run_witness(
+            script, stack, SIGVERSION_TAPSCRIPT,
+            self.checker(SIGVERSION_TAPSCRIPT, leaf_hash=leaf_hash,
+                         annex=annex))
+
+
+def verify_input(tx: Transaction, input_index: int, script_sig: bytes,
+                 amount: int, script_pub_key: bytes,
+                 prevouts: Optional[Sequence[Tuple[int, bytes]]] = None):
+    """
+    Full consensus verification of one input, signatures included.
+    Raises PreflightError.
+
+    tx: spending transaction, with its witness
+    script_sig: scriptSig of the input
+    amount, script_pub_key: the spent output
+    prevouts: (amount, script_pub_key) of every input, needed by taproot
+        signatures that commit to all spent outputs
+    """
+    witness = []
+    if tx.witness is not None and input_index < len(tx.witness):
+        witness = [item.item for item in tx.witness[input_index].stack_items]
+    InputVerifier(tx, input_index, amount, prevouts).verify(
+        bytes(script_sig), bytes(script_pub_key), witness)
+
+
+def verify_spend(current_tx: Transaction, prev_tx: Transaction,
+                 input_index: int, script_sig: bytes,
+                 prevouts: Optional[Sequence[Tuple[int, bytes]]] = None):
+    """
+    Checks that prev_tx is the transaction spent by the input and
+    verifies the input against the spent output
+    """
+    if input_index >= current_tx.input_count:
+        raise PreflightError("input_index", "No such input", input_index)
+    spent = current_tx.inputs[input_index]
+    if bytes(spent.txid[::-1]).hex() != prev_tx.txid:
+        raise PreflightError(
+            "prevout_mismatch",
+            f"Input spends {bytes(spent.txid[::-1]).hex()}, "
+            f"the previous transaction is {prev_tx.txid}", input_index)
+    if spent.vout >= prev_tx.output_count:
+        raise PreflightError("prevout_mismatch",
+                             f"No output {spent.vout} in the previous "
+                             f"transaction", input_index)
+    output = prev_tx.outputs[spent.vout]
+    if prevouts is None and current_tx.input_count == 1:
+        prevouts = [(output.value, bytes(output.script_pub_key))]
+    verify_input(current_tx, input_index, script_sig, output.value,
+                 output.script_pub_key, prevouts)
+
+
+def preflight_enabled(argv: Optional[List[str]] = None) -> bool:
+    """
+    Enabled by the GENERATORS_PREFLIGHT environment variable or by the
+    --preflight flag
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--preflight", action="store_true")
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    mode = os.environ.get(PREFLIGHT_ENV, "").lower()
+    return args.preflight or mode not in ("", "0", "false", "off")
+
+
+def preflight(config: Dict,
+              prevouts: Optional[Sequence[Tuple[int, bytes]]] = None):
+    """
+    Verifies the spend of a generator config when pre-flight is enabled.
+    On failure the error is printed as JSON and the process exits before
+    any circuit input is written.
+    """
+    if not preflight_enabled():
+        return
+    input_index = config["input_to_sign"]
+    try:
+        verify_spend(Transaction(config["current_tx"]),
+                     Transaction(config["prev_tx"]), input_index,
+                     bytes.fromhex(config.get("script_sig", "")), prevouts)
+    except PreflightError as e:
+        print(json.dumps({"preflight": e.to_dict()}), file=sys.stderr)
+        sys.exit(1)
+    print("Pre-flight: input", input_index, "is valid")
@@ -0,0 +1,139 @@
+from typing import Dict, List, Optional
+import argparse
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from generators.constants import PROFILE_JSON, PROFILE_STATS
+
+# "1" records the stages, "cprofile" also dumps cProfile stats
+PROFILE_ENV = "GENERATORS_PROFILE"
+
+
+class Profiler:
+    """
+    Opt-in stage timer for the generator entry points.
+
+    Stages are consecutive: stage(name) ends the running stage and starts
+    the next one, so marks can be dropped between the existing statements.
+    A stage name may be used several times, its measurements are summed
+    (peaks are maxed). When disabled every call is a no-op.
+    """
+
+    def __init__(self, name: str, enabled: bool = False,
+                 cprofile: bool = False):
+        self.name = name
+        self.enabled = enabled or cprofile
+        self.stages: Dict[str, Dict] = {}
+        self.notes: Dict[str, object] = {}
+        self._current: Optional[str] = None
+        self._profile = None
+        if not self.enabled:
+            return
+
+        self._started_at = time.time()
+        self._start_wall = self._stage_wall = time.perf_counter()
+        self._start_cpu = self._stage_cpu = time.process_time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stage_memory = tracemalloc.get_traced_memory()[0]
+        self._traced_peak = 0
+        if cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    @classmethod
+    def from_env(cls, name: str,
+                 argv: Optional[List[str]] = None) -> 'Profiler':
+        """
+        Enabled by the GENERATORS_PROFILE environment variable or by the
+        --profile / --cprofile flags. The flags are exported to the
+        environment so that generators started from this one are
+        profiled as well.
+        """
+        parser = argparse.ArgumentParser(add_help=False)
+        parser.add_argument("--profile", action="store_true")
+        parser.add_argument("--cprofile", action="store_true")
+        args, _ = parser.parse_known_args(
+            sys.argv[1:] if argv is None else argv)
+
+        if args.cprofile:
+            os.environ[PROFILE_ENV] = "cprofile"
+        elif args.profile:
+            os.environ.setdefault(PROFILE_ENV, "1")
+
+        mode = os.environ.get(PROFILE_ENV, "").lower()
+        return cls(name,
+                   enabled=mode not in ("", "0", "false"),
+                   cprofile=mode == "cprofile")
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return
+        self._end_stage()
+        self._current = name
+
+    def note(self, name: str, value: object):
+        """
+        Adds a JSON serializable value to the report
+        """
+        if self.enabled:
+            self.notes[name] = value
+
+    def _end_stage(self):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        memory, peak = tracemalloc.get_traced_memory()
+
+        if self._current is not None:
+            stage = self.stages.setdefault(self._current, {
+                "calls": 0,
+                "wall_sec": 0.0,
+                "cpu_sec": 0.0,
+                "alloc_peak_bytes": 0,
+            })
+            stage["calls"] += 1
+            stage["wall_sec"] += wall - self._stage_wall
+            stage["cpu_sec"] += cpu - self._stage_cpu
+            stage["alloc_peak_bytes"] = max(
+                stage["alloc_peak_bytes"], peak - self._stage_memory)
+
+        self._traced_peak = max(self._traced_peak, peak)
+        self._current = None
+        self._stage_wall = wall
+        self._stage_cpu = cpu
+        self._stage_memory = memory
+        tracemalloc.reset_peak()
+
+    def report(self) -> Dict:
+        return {
+            "generator": self.name,
+            "started_at": self._started_at,
+            "pid": os.getpid(),
+            "python": platform.python_version(),
+            "wall_sec": time.perf_counter() - self._start_wall,
+            "cpu_sec": time.process_time() - self._start_cpu,
+            "traced_peak_bytes": self._traced_peak,
+            "stages": self.stages,
+            "notes": self.notes,
+        }
+
+    def finish(self, output_dir: str):
+        """
+        output_dir: directory of the generated Prover.toml, the JSON report
+            (and the cProfile stats) are written there
+        """
+        if not self.enabled:
+            return
+        self._end_stage()
+        output_dir = output_dir.rstrip("/")
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(output_dir + PROFILE_STATS)
+
+        with open(output_dir + PROFILE_JSON, "w") as file:
+            json.dump(self.report(), file, indent=2)
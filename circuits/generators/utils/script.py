@@ -1,180 +1,364 @@
 from bitcoin.core.script import *
-from bitcoin.core import CScript, CTransaction, lx
-from bitcoin.core.scripteval import _EvalScript
 from bitcoin.core import x
 from binascii import unhexlify
+from generators.utils.analysis_store import AnalysisStore
+from generators.utils.interpreter import (
+    ExecutionPathObserver, HashSizeObserver, ScriptInterpreter)
+from generators.utils.templates import match_template
 from generators.utils.tx import Transaction
+from collections import Counter, OrderedDict, namedtuple
+from typing import Optional, Tuple, Union
+import hashlib
+import json
+
+def _build_push_prefixes() -> Tuple[Optional[int], ...]:
+    """
+    By opcode, the width of the little endian push length that follows a
+    push opcode (0 when the length is the opcode itself) and None for the
+    other opcodes. Only the parse needs a table, the stack effects, hash
+    and signature sizes are reported by the interpreter for the executed
+    path (see ExecutionPathObserver).
+    """
+    prefixes = []
+    for opcode in range(256):
+        if 1 <= opcode <= 75:
+            prefixes.append(0)
+        elif 76 <= opcode <= 78:
+            prefixes.append({76: 1, 77: 2, 78: 4}[opcode])
+        else:
+            prefixes.append(None)
+    return tuple(prefixes)
 
-HASHES = [OP_SHA1, OP_SHA256, OP_RIPEMD160, OP_HASH160, OP_HASH256]
 
-add_1_element = [0, 79, 81, 82, 83, 84, 85, 86, 87, 88, 89, 90,
-                 91, 92, 93, 94, 95, 96, 108, 115, 116, 118, 120, 125, 130]
-add_2_elements = [110, 112]
-add_3_elements = [111]
-remove_1_element = [105, 107, 117, 119, 122, 135, 147, 148,
-                    154, 155, 156, 157, 158, 159, 160, 161, 162, 163, 164, 172]
-remove_2_elements = [109, 136, 165, 173, 186]
+PUSH_PREFIXES = _build_push_prefixes()
 
 
-class Script:
-    def __init__(self, hex: str, tx: Transaction, inIdx, stack=[]):
-        self.script_info(hex, tx, inIdx, stack)
+class PushData:
+    """
+    Element pushed by a script: a zero-copy view of the pushed bytes and
+    the offset of the first of them in the parsed script
+    """
+    __slots__ = ('data', 'offset')
+
+    def __init__(self, data: memoryview, offset: int):
+        self.data = data
+        self.offset = offset
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __bytes__(self) -> bytes:
+        return self.data.tobytes()
+
+    def hex(self) -> str:
+        return self.data.hex()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PushData):
+            return NotImplemented
+        return self.offset == other.offset and self.data == other.data
+
+    def __repr__(self) -> str:
+        return f"PushData({self.data.hex()}, offset={self.offset})"
+
+
+# a script as accepted by Script: hex, bytes or a pushed element
+ScriptSource = Union[str, bytes, bytearray, memoryview, PushData]
+
+
+def script_bytes(script: ScriptSource) -> Union[bytes, memoryview]:
+    """
+    Bytes of the script without copying views and pushed elements
+    """
+    if isinstance(script, str):
+        return unhexlify(script)
+    if isinstance(script, PushData):
+        return script.data
+    if isinstance(script, bytearray):
+        return bytes(script)
+    return script
+
+
+ScriptAnalysis = namedtuple('ScriptAnalysis', [
+    'script_elements', 'template', 'opcodes', 'executed_opcodes', 'stack_peak',
+    'alt_stack_peak', 'require_stack_size', 'max_element_size',
+    'script_len_codeseparator', 'sizes', 'costs'])
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+DEFAULT_ANALYSIS_CACHE_SIZE = 1024
+
+# bump whenever a change of the analysis changes its results, stored
+# analyses of other versions are ignored
+ANALYSIS_VERSION = 2
+
+
+def encode_analysis(analysis: ScriptAnalysis) -> str:
+    """
+    JSON form of an analysis, pushes are stored as [offset, size] and
+    point back into the script
+    """
+    return json.dumps([
+        [[e.offset, len(e)] if isinstance(e, PushData) else e
+         for e in analysis.script_elements],
+        *analysis[1:-2],
+        sorted(analysis.sizes),
+        analysis.costs,
+    ], separators=(',', ':'))
+
+
+def decode_analysis(text: str, script: bytes) -> ScriptAnalysis:
+    raw = memoryview(script)
+    fields = json.loads(text)
+    elements = tuple(
+        PushData(raw[e[0]:e[0] + e[1]], e[0]) if isinstance(e, list) else e
+        for e in fields[0])
+    sizes = frozenset(tuple(size) for size in fields[-2])
+    costs = tuple(tuple(cost) for cost in fields[-1])
+    return ScriptAnalysis(elements, *fields[1:-2], sizes, costs)
+
+
+class ScriptAnalysisCache:
+    """
+    LRU cache of Script analyses keyed by content hashes of the script and
+    the initial stack (the analysis does not depend on the transaction).
+
+    store: optional on-disk cache shared with other processes, consulted
+        on a miss and filled with every new analysis
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_ANALYSIS_CACHE_SIZE,
+                 store: Optional[AnalysisStore] = None):
+        self.maxsize = maxsize
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def key(script: bytes, stack) -> bytes:
+        h = hashlib.sha256()
+        h.update(len(script).to_bytes(4, byteorder='little'))
+        h.update(script)
+        for item in stack:
+            item = to_bytes_or_keep(item)
+            h.update(len(item).to_bytes(4, byteorder='little'))
+            h.update(item)
+        return h.digest()
+
+    def get(self, key: bytes, script: bytes) -> Optional[ScriptAnalysis]:
+        analysis = self._entries.get(key)
+        if analysis is None and self.store is not None:
+            text = self.store.get(key)
+            if text is not None:
+                analysis = decode_analysis(text, script)
+                self._insert(key, analysis)
+        if analysis is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return analysis
+
+    def put(self, key: bytes, analysis: ScriptAnalysis):
+        self._insert(key, analysis)
+        if self.store is not None:
+            self.store.put(key, encode_analysis(analysis))
+
+    def _insert(self, key: bytes, analysis: ScriptAnalysis):
+        self._entries[key] = analysis
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._entries))
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries.clear()
+
+
+# shared by every Script unless another cache (or None) is passed, backed
+# by the on-disk store when GENERATORS_ANALYSIS_CACHE is set
+ANALYSIS_CACHE = ScriptAnalysisCache(
+    store=AnalysisStore.from_env(ANALYSIS_VERSION))
+
+
+def cache_report(cache: ScriptAnalysisCache = ANALYSIS_CACHE) -> str:
+    info = cache.cache_info()
+    return (f"Script analysis cache: {info.hits} hits, {info.misses} "
+            f"misses, {info.currsize}/{info.maxsize} entries")
 
-    def script_info(self, hex: str, tx: Transaction, inIdx, stack):
-        bytes = unhexlify(hex)
-        script = CScript(bytes)
 
-        self.script_elements = format_script_elements(script)
+class Script:
+    """
+    script_elements: OP_0..OP_16 as 0..16, other opcodes as ints and
+        pushes as PushData views into the script
+    costs: (opcode, operand size) -> count, the pushes of the whole script
+        (by data size) and the opcodes above OP_16 of the executed path
+        (see ExecutionPathObserver)
+    raw, initial_stack: the script and the stack it was analyzed with
+    """
+
+    def __init__(self, hex: ScriptSource, tx: Transaction, inIdx, stack=[],
+                 cache: Optional[ScriptAnalysisCache] = ANALYSIS_CACHE):
+        script = script_bytes(hex)
+        self.raw = script
+        self.initial_stack = stack
+        if cache is None:
+            self.script_info(script, tx, inIdx, stack)
+            return
+
+        key = cache.key(script, stack)
+        analysis = cache.get(key, script)
+        if analysis is None:
+            self.script_info(script, tx, inIdx, stack)
+            cache.put(key, self.to_analysis())
+        else:
+            self.from_analysis(analysis)
+
+    def to_analysis(self) -> ScriptAnalysis:
+        return ScriptAnalysis(
+            tuple(self.script_elements), self.template, self.opcodes,
+            self.executed_opcodes, self.stack_peak, self.alt_stack_peak,
+            self.require_stack_size, self.max_element_size,
+            self.script_len_codeseparator, frozenset(self.sizes),
+            tuple(sorted((*key, count) for key, count in self.costs.items())))
+
+    def from_analysis(self, analysis: ScriptAnalysis):
+        self.script_elements = list(analysis.script_elements)
+        self.template = analysis.template
+        self.opcodes = analysis.opcodes
+        self.executed_opcodes = analysis.executed_opcodes
+        self.stack_peak = analysis.stack_peak
+        self.alt_stack_peak = analysis.alt_stack_peak
+        self.require_stack_size = analysis.require_stack_size
+        self.max_element_size = analysis.max_element_size
+        self.script_len_codeseparator = analysis.script_len_codeseparator
+        self.sizes = set(analysis.sizes)
+        self.costs = {(opcode, size): count
+                      for opcode, size, count in analysis.costs}
+
+    def script_info(self, script: bytes, tx: Transaction, inIdx, stack):
+        self.sizes = set()
+        self.script_elements = []
+        self.template = None
         self.opcodes = 0
+        self.executed_opcodes = 0
+        self.stack_peak = 0
+        self.alt_stack_peak = 0
         self.require_stack_size = 0
         self.max_element_size = 0
-        self.sizes = get_hashed_data_sizes(
-            bytes, tx.to_hex(), inIdx, stack, tuple())
         self.script_len_codeseparator = 0
-
-        cur_stack_size = 0
-        require_alt_stack_size = 0
-        alt_stack_size = 0
-
+        self.costs = Counter()
+
+        raw = memoryview(script)
+        script_len = len(raw)
+        push_prefixes = PUSH_PREFIXES
+        elements = self.script_elements
+        sizes = self.sizes
+        costs = self.costs
+        shape = []
+
+        max_element_size = 0
+        codeseparator_len = 0
+
+        # the circuit walks the elements of every branch, skipped ones
+        # included, so the pushes and the element count cover the whole
+        # script while the stack peaks and the hash and signature sizes
+        # come from the executed path only
         i = 0
-        j = 0
-        while i < len(bytes):
-            self.opcodes += 1
-
-            if bytes[i] == 107:
-                alt_stack_size += 1
-            elif bytes[i] == 108:
-                alt_stack_size -= 1
-
-            if bytes[i] == 171:
-                self.script_len_codeseparator = -1
-
-            if bytes[i] == 172 or bytes[i] == 173:
-                self.sizes.add((bytes[i], 0, 0, 0))
-
-            if bytes[i] == 174 or bytes[i] == 175:
-                n = self.script_elements[j - 1]
-                m = self.script_elements[j - 2 - n]
-                self.sizes.add((bytes[i], 0, n, m))
-
-            if bytes[i] >= 1 and bytes[i] <= 75:
-                self.sizes.add((bytes[i], 0, 0, 0))
-                if self.max_element_size < bytes[i]:
-                    self.max_element_size = bytes[i]
-                self.script_len_codeseparator += bytes[i]
-                i += bytes[i]
-                cur_stack_size += 1
-            elif bytes[i] == 76:
-                size = bytes[i + 1]
-                self.sizes.add((bytes[i], size, 0, 0))
-                self.script_len_codeseparator += size + 1
-                i += size + 1
-                cur_stack_size += 1
-                if self.max_element_size < size:
-                    self.max_element_size = size
-            elif bytes[i] == 77:
-                size = bytes[i + 1] + (bytes[i + 2] << 8)
-                self.sizes.add((bytes[i], size, 0, 0))
-                self.script_len_codeseparator += size + 2
-                i += size + 2
-                cur_stack_size += 1
-                if self.max_element_size < size:
-                    self.max_element_size = size
-            elif bytes[i] == 78:
-                size = bytes[i + 1] + (bytes[i + 2] << 8) + \
-                    (bytes[i + 3] << 16) + (bytes[i + 4] << 24)
-                self.sizes.add((bytes[i], size, 0, 0))
-                self.script_len_codeseparator += size + 4
-                i += size + 4
-                cur_stack_size += 1
-                if self.max_element_size < size:
-                    self.max_element_size = size
-            elif bytes[i] in add_1_element:
-                cur_stack_size += 1
-            elif bytes[i] in add_2_elements:
-                cur_stack_size += 2
-            elif bytes[i] in add_3_elements:
-                cur_stack_size += 3
-            elif bytes[i] in remove_1_element:
-                cur_stack_size -= 1
-            elif bytes[i] in remove_2_elements:
-                cur_stack_size -= 2
-
-            if cur_stack_size > self.require_stack_size:
-                self.require_stack_size = cur_stack_size
-            if alt_stack_size > require_alt_stack_size:
-                require_alt_stack_size = alt_stack_size
-
-            # todo: if we have IF opcodes we can try minimize amount of opcodes
-
+        while i < script_len:
+            opcode = raw[i]
+            push_prefix = push_prefixes[opcode]
+            shape.append(opcode)
             i += 1
-            j += 1
-            self.script_len_codeseparator += 1
 
-        if require_alt_stack_size > self.require_stack_size:
-            self.require_stack_size = require_alt_stack_size
+            if opcode == 0:
+                elements.append(0)
+                costs[(0, 0)] += 1
+            elif push_prefix is not None:
+                if push_prefix:
+                    if i + push_prefix > script_len:
+                        raise CScriptInvalidError(
+                            "PUSHDATA: missing data length")
+                    size = int.from_bytes(
+                        raw[i:i + push_prefix], byteorder='little')
+                    i += push_prefix
+                else:
+                    size = opcode
+                if i + size > script_len:
+                    raise CScriptTruncatedPushDataError(
+                        "PUSHDATA: truncated data", raw[i:].tobytes())
+                elements.append(PushData(raw[i:i + size], i))
+                i += size
+                sizes.add((opcode, size if push_prefix else 0, 0, 0))
+                costs[(opcode, size)] += 1
+                codeseparator_len += push_prefix + size
+                if size > max_element_size:
+                    max_element_size = size
+            elif 81 <= opcode <= 96:
+                elements.append(opcode - 80)
+                costs[(opcode, 0)] += 1
+            else:
+                elements.append(opcode)
+                if opcode < OP_1:
+                    # OP_1NEGATE and OP_RESERVED
+                    costs[(opcode, 0)] += 1
+
+            if opcode == OP_CODESEPARATOR:
+                codeseparator_len = -1
+
+            codeseparator_len += 1
+
+        template = None if stack else match_template(script, shape)
+        if template is not None:
+            self.template = template.name
+            path = template
+        else:
+            path = ExecutionPathObserver()
+            ScriptInterpreter(path, max_ops=None).run(
+                script, [to_bytes_or_keep(op) for op in stack])
+        sizes |= path.sizes
+        costs.update(path.costs)
+        self.executed_opcodes = path.executed_opcodes
+        self.stack_peak = path.stack_peak
+        self.alt_stack_peak = path.alt_stack_peak
+
+        self.opcodes = len(elements)
+        self.max_element_size = max_element_size
+        self.script_len_codeseparator = codeseparator_len
+        self.require_stack_size = max(self.stack_peak, self.alt_stack_peak)
 
         # due to the specifics of implementation using noir
         self.require_stack_size += 3
 
 
-def get_hashed_data_sizes(script, txTo, inIdx, stack, flags=()):
-    sizes = set()
-    tx = CTransaction.deserialize(unhexlify(txTo))
-    stack = [to_bytes_or_keep(op) for op in stack]
-    parts = split_list_by_hash(CScript(script))
-    if parts[0][0] in HASHES:
-        sizes.add((parts[0][0], len(stack[len(stack) - 1]), 0, 0))
+def get_hashed_data_sizes(script: bytes, stack) -> set:
+    """
+    Sizes of the data hashed by the script, collected in one run of the
+    interpreter. Signatures are not verified, only their sizes matter.
+    """
+    observer = HashSizeObserver()
+    interpreter = ScriptInterpreter(observer, max_ops=None)
+    interpreter.run(script, [to_bytes_or_keep(op) for op in stack])
+    return observer.sizes
 
-    for idx, part in enumerate(parts):
-        part_fixed = [ensure_bytes_or_opcode(el) for el in part]
-        _EvalScript(stack, CScript(part_fixed), tx, inIdx, flags)
-        if (idx != len(parts) - 1):
-            sizes.add((parts[idx + 1][0], len(stack[len(stack) - 1]), 0, 0))
 
-    return sizes
+def clear_caches():
+    ANALYSIS_CACHE.clear()
 
 
 def to_bytes_or_keep(op):
-    if isinstance(op, str):
+    if isinstance(op, PushData):
+        return op.data
+    elif isinstance(op, str):
         return x(op)
     elif isinstance(op, int):
         return op.to_bytes((op.bit_length() + 7) //
                            8 or 1, 'little', signed=True)
     else:
         return op
-
-
-def ensure_bytes_or_opcode(el):
-    if isinstance(el, str):
-        return bytes.fromhex(el)
-    return el
-
-
-def split_list_by_hash(script):
-    result = []
-    current = []
-
-    script = format_script_elements(script)
-    for item in script:
-        if item in HASHES:
-            if current:
-                result.append(current)
-            current = [item]
-        else:
-            current.append(item)
-
-    if current:
-        result.append(current)
-
-    return result
-
-
-def format_script_elements(script):
-    elements = []
-    for el in script:
-        if isinstance(el, int):
-            elements.append(el)
-        else:
-            elements.append(el.hex())
-    return elements
@@ -0,0 +1,223 @@
+from typing import Optional, Tuple
+
+from generators.utils.sighash import tagged_hash
+
+# Verification-only secp256k1 arithmetic for the pre-flight checks. It is
+# not constant time and must never see a private key.
+
+P = 2 ** 256 - 2 ** 32 - 977
+N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
+G = (0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798,
+     0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8)
+
+Point = Optional[Tuple[int, int]]
+
+
+def _to_jacobian(point: Point) -> Tuple[int, int, int]:
+    if point is None:
+        return (0, 1, 0)
+    return (point[0], point[1], 1)
+
+
+def _from_jacobian(point: Tuple[int, int, int]) -> Point:
+    x, y, z = point
+    if z == 0:
+        return None
+    z_inv = pow(z, -1, P)
+    z_inv2 = z_inv * z_inv % P
+    return (x * z_inv2 % P, y * z_inv2 * z_inv % P)
+
+
+def _double(point: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    x, y, z = point
+    if z == 0 or y == 0:
+        return (0, 1, 0)
+    y2 = y * y % P
+    s = 4 * x * y2 % P
+    m = 3 * x * x % P
+    nx = (m * m - 2 * s) % P
+    ny = (m * (s - nx) - 8 * y2 * y2) % P
+    nz = 2 * y * z % P
+    return (nx, ny, nz)
+
+
+def _add(a: Tuple[int, int, int],
+         b: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    if a[2] == 0:
+        return b
+    if b[2] == 0:
+        return a
+    az2 = a[2] * a[2] % P
+    bz2 = b[2] * b[2] % P
+    u1 = a[0] * bz2 % P
+    u2 = b[0] * az2 % P
+    s1 = a[1] * bz2 * b[2] % P
+    s2 = b[1] * az2 * a[2] % P
+    if u1 == u2:
+        if s1 != s2:
+            return (0, 1, 0)
+        return _double(a)
+    h = (u2 - u1) % P
+    r = (s2 - s1) % P
+    h2 = h * h % P
+    h3 = h * h2 % P
+    u1h2 = u1 * h2 % P
+    nx = (r * r - h3 - 2 * u1h2) % P
+    ny = (r * (u1h2 - nx) - s1 * h3) % P
+    nz = h * a[2] * b[2] % P
+    return (nx, ny, nz)
+
+
+def point_add(a: Point, b: Point) -> Point:
+    return _from_jacobian(_add(_to_jacobian(a), _to_jacobian(b)))
+
+
+def point_mul(k: int, point: Point) -> Point:
+    return _from_jacobian(_mul(k, _to_jacobian(point)))
+
+
+def _mul(k: int, point: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    result = (0, 1, 0)
+    for bit in bin(k % N)[2:]:
+        result = _double(result)
+        if bit == "1":
+            result = _add(result, point)
+    return result
+
+
+def _double_mul(k1: int, k2: int, point: Point) -> Point:
+    """
+    k1 * G + k2 * point with a shared doubling chain
+    """
+    g = _to_jacobian(G)
+    q = _to_jacobian(point)
+    gq = _add(g, q)
+    result = (0, 1, 0)
+    k1 %= N
+    k2 %= N
+    for i in range(max(k1.bit_length(), k2.bit_length()) - 1, -1, -1):
+        result = _double(result)
+        bits = ((k1 >> i) & 1, (k2 >> i) & 1)
+        if bits == (1, 1):
+            result = _add(result, gq)
+        elif bits == (1, 0):
+            result = _add(result, g)
+        elif bits == (0, 1):
+            result = _add(result, q)
+    return _from_jacobian(result)
+
+
+def lift_x(x: int) -> Point:
+    """
+    Point with the given x coordinate and an even y (BIP340)
+    """
+    if x >= P:
+        return None
+    y_sq = (pow(x, 3, P) + 7) % P
+    y = pow(y_sq, (P + 1) // 4, P)
+    if y * y % P != y_sq:
+        return None
+    return (x, y if y % 2 == 0 else P - y)
+
+
+def decode_pubkey(data: bytes) -> Point:
+    """
+    Compressed, uncompressed or hybrid SEC encoding, None if invalid
+    """
+    if len(data) == 33 and data[0] in (2, 3):
+        point = lift_x(int.from_bytes(data[1:], 'big'))
+        if point is None:
+            return None
+        if (point[1] & 1) != (data[0] & 1):
+            point = (point[0], P - point[1])
+        return point
+    if len(data) == 65 and data[0] in (4, 6, 7):
+        x = int.from_bytes(data[1:33], 'big')
+        y = int.from_bytes(data[33:], 'big')
+        if x >= P or y >= P or (y * y - x * x * x - 7) % P != 0:
+            return None
+        if data[0] != 4 and (y & 1) != (data[0] & 1):
+            return None
+        return (x, y)
+    return None
+
+
+def is_valid_der_signature(sig: bytes) -> bool:
+    """
+    Strict DER encoding of BIP66, sig includes the trailing hash type
+    """
+    if len(sig) < 9 or len(sig) > 73:
+        return False
+    if sig[0] != 0x30 or sig[1] != len(sig) - 3:
+        return False
+    len_r = sig[3]
+    if 5 + len_r >= len(sig):
+        return False
+    len_s = sig[5 + len_r]
+    if len_r + len_s + 7 != len(sig):
+        return False
+    if sig[2] != 0x02 or len_r == 0 or sig[4] & 0x80:
+        return False
+    if len_r > 1 and sig[4] == 0x00 and not sig[5] & 0x80:
+        return False
+    if sig[len_r + 4] != 0x02 or len_s == 0 or sig[len_r + 6] & 0x80:
+        return False
+    if len_s > 1 and sig[len_r + 6] == 0x00 and not sig[len_r + 7] & 0x80:
+        return False
+    return True
+
+
+def parse_der_signature(sig: bytes) -> Tuple[int, int]:
+    """
+    sig: DER signature without the hash type
+    """
+    len_r = sig[3]
+    r = int.from_bytes(sig[4:4 + len_r], 'big')
+    len_s = sig[5 + len_r]
+    s = int.from_bytes(sig[6 + len_r:6 + len_r + len_s], 'big')
+    return r, s
+
+
+def ecdsa_verify(pubkey: bytes, r: int, s: int, msg: bytes) -> bool:
+    point = decode_pubkey(pubkey)
+    if point is None or not (0 < r < N and 0 < s < N):
+        return False
+    s_inv = pow(s, -1, N)
+    z = int.from_bytes(msg, 'big')
+    result = _double_mul(z * s_inv, r * s_inv, point)
+    return result is not None and result[0] % N == r
+
+
+def schnorr_verify(pubkey: bytes, sig: bytes, msg: bytes) -> bool:
+    """
+    BIP340 verification, pubkey is the 32 byte x-only key
+    """
+    if len(pubkey) != 32 or len(sig) != 64:
+        return False
+    point = lift_x(int.from_bytes(pubkey, 'big'))
+    r = int.from_bytes(sig[:32], 'big')
+    s = int.from_bytes(sig[32:], 'big')
+    if point is None or r >= P or s >= N:
+        return False
+    e = int.from_bytes(tagged_hash(
+        "BIP0340/challenge", sig[:32] + pubkey + msg), 'big') % N
+    result = _double_mul(s, N - e, point)
+    return result is not None and result[1] % 2 == 0 and result[0] == r
+
+
+def taproot_tweak(internal_key: bytes,
+                  merkle_root: bytes) -> Optional[Tuple[int, bytes]]:
+    """
+    (parity, x-only output key) of the BIP341 tweaked internal key
+    """
+    point = lift_x(int.from_bytes(internal_key, 'big'))
+    if point is None:
+        return None
+    t = int.from_bytes(tagged_hash("TapTweak", internal_key + merkle_root),
+                       'big')
+    if t >= N:
+        return None
+    result = point_add(point, point_mul(t, G))
+    if result is None:
+        return None
+    return result[1] & 1, result[0].to_bytes(32, 'big')
@@ -1,20 +1,15 @@
-from bitcoin.core import CTransaction
-from bitcoin.core.script import CScript, SignatureHash, SIGHASH_ALL, SIGHASH_ANYONECANPAY
-from bitcoin import SelectParams
-
-SelectParams('mainnet')
+from generators.utils.tx import Transaction
+from generators.utils.sighash import SignatureHasher, SIGHASH_ALL, SIGHASH_ANYONECANPAY
 
 tx_hex = "..."  # Paste raw tx
-tx_bytes = bytes.fromhex(tx_hex)
-tx = CTransaction.deserialize(tx_bytes)
+tx = Transaction(tx_hex)
 
 script_pubkey_hex = "..."  # Paste script pub key
-script_pubkey = CScript(bytes.fromhex(script_pubkey_hex))
+script_pubkey = bytes.fromhex(script_pubkey_hex)
 
-sighash = SignatureHash(
-    script_pubkey,
-    tx,
+sighash = SignatureHasher(tx).legacy(
     0,
+    script_pubkey,
     SIGHASH_ALL | SIGHASH_ANYONECANPAY)
 
 print(sighash.hex())
@@ -0,0 +1,343 @@
+from functools import cached_property
+from typing import List, Optional, Sequence, Tuple
+import hashlib
+import struct
+
+from generators.utils.tx import Transaction, _append_compact_size, _compact_size_size, _write_compact_size
+
+SIGHASH_DEFAULT = 0x00
+SIGHASH_ALL = 0x01
+SIGHASH_NONE = 0x02
+SIGHASH_SINGLE = 0x03
+SIGHASH_ANYONECANPAY = 0x80
+
+OP_CODESEPARATOR = 0xab
+
+# digest returned by legacy signature hashing for out of range inputs
+# and SIGHASH_SINGLE without a matching output
+LEGACY_SIGHASH_ONE = (1).to_bytes(32, byteorder='little')
+
+
+def sha256(data) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def hash256(data) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def tagged_hash(tag: str, data) -> bytes:
+    tag_hash = sha256(tag.encode())
+    return sha256(tag_hash + tag_hash + data)
+
+
+def with_compact_size(data) -> bytes:
+    buffer = bytearray(_compact_size_size(len(data)) + len(data))
+    cur_pos = _write_compact_size(buffer, 0, len(data))
+    buffer[cur_pos:] = data
+    return bytes(buffer)
+
+
+def tapleaf_hash(script, leaf_version: int = 0xc0) -> bytes:
+    return tagged_hash("TapLeaf", bytes([leaf_version]) +
+                       with_compact_size(script))
+
+
+class SignatureHasher:
+    """
+    Computes legacy, BIP143 and BIP341 signature hashes of every input of
+    one transaction.
+
+    The serialized transaction is built once and every shared hash
+    (hashPrevouts, hashSequence, hashOutputs, sha_amounts,
+    sha_scriptpubkeys, ...) is computed on first use and then reused, so
+    hashing all inputs costs O(n) instead of O(n^2) for segwit spends.
+    """
+
+    def __init__(self, tx: Transaction,
+                 prevouts: Optional[Sequence[Tuple[int, bytes]]] = None):
+        """
+        tx: transaction that spends the inputs
+        prevouts: (amount, script_pub_key) of every spent output in input
+            order, required only for taproot signature hashes
+        """
+        self.tx = tx
+        self.prevouts = prevouts
+        self._raw = memoryview(tx.to_bytes())
+        self._layout = tx.layout
+
+    def _outpoint(self, idx: int) -> memoryview:
+        offset = self._layout.inputs[idx].offset
+        return self._raw[offset:offset + 36]
+
+    def _sequence(self, idx: int) -> memoryview:
+        span = self._layout.inputs[idx]
+        return self._raw[span.offset + span.size - 4:span.offset + span.size]
+
+    def _output(self, idx: int) -> memoryview:
+        span = self._layout.outputs[idx]
+        return self._raw[span.offset:span.offset + span.size]
+
+    @cached_property
+    def _prevouts_data(self) -> bytes:
+        return b"".join(self._outpoint(i) for i in range(self.tx.input_count))
+
+    @cached_property
+    def _sequences_data(self) -> bytes:
+        return b"".join(self._sequence(i) for i in range(self.tx.input_count))
+
+    @cached_property
+    def _outputs_data(self) -> memoryview:
+        outputs = self._layout.outputs
+        if not outputs:
+            return memoryview(b"")
+        end = outputs[-1].offset + outputs[-1].size
+        return self._raw[outputs[0].offset:end]
+
+    # BIP143 midstates
+
+    @cached_property
+    def hash_prevouts(self) -> bytes:
+        return hash256(self._prevouts_data)
+
+    @cached_property
+    def hash_sequence(self) -> bytes:
+        return hash256(self._sequences_data)
+
+    @cached_property
+    def hash_outputs(self) -> bytes:
+        return hash256(self._outputs_data)
+
+    # BIP341 midstates
+
+    @cached_property
+    def sha_prevouts(self) -> bytes:
+        return sha256(self._prevouts_data)
+
+    @cached_property
+    def sha_sequences(self) -> bytes:
+        return sha256(self._sequences_data)
+
+    @cached_property
+    def sha_outputs(self) -> bytes:
+        return sha256(self._outputs_data)
+
+    @cached_property
+    def sha_amounts(self) -> bytes:
+        return sha256(b"".join(
+            struct.pack('<Q', amount) for amount, _ in self._get_prevouts()))
+
+    @cached_property
+    def sha_scriptpubkeys(self) -> bytes:
+        return sha256(b"".join(
+            with_compact_size(script_pub_key)
+            for _, script_pub_key in self._get_prevouts()))
+
+    def _get_prevouts(self) -> Sequence[Tuple[int, bytes]]:
+        if self.prevouts is None or \
+                len(self.prevouts) != self.tx.input_count:
+            raise ValueError("Spent outputs of every input are required")
+        return self.prevouts
+
+    def legacy(self, input_index: int, script_code: bytes,
+               hash_type: int = SIGHASH_ALL) -> bytes:
+        """
+        script_code: script of the spent output (or the redeem script),
+            OP_CODESEPARATORs are removed here, the signature itself must
+            already be removed by the caller
+        """
+        preimage = self.legacy_preimage(input_index, script_code, hash_type)
+        if preimage is None:
+            return LEGACY_SIGHASH_ONE
+        return hash256(preimage)
+
+    def legacy_preimage(self, input_index: int, script_code: bytes,
+                        hash_type: int = SIGHASH_ALL) -> Optional[bytes]:
+        """
+        Serialized data hashed by legacy(), None when the digest is the
+        constant LEGACY_SIGHASH_ONE
+        """
+        tx = self.tx
+        base_type = hash_type & 0x1f
+        anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+
+        if input_index >= tx.input_count:
+            return None
+        if base_type == SIGHASH_SINGLE and input_index >= tx.output_count:
+            return None
+
+        script_code = _remove_codeseparators(script_code)
+
+        data = bytearray(self._raw[:4])
+        input_indexes = [input_index] if anyone_can_pay \
+            else range(tx.input_count)
+        _append_compact_size(data, len(input_indexes))
+        for i in input_indexes:
+            data += self._outpoint(i)
+            if i == input_index:
+                data += with_compact_size(script_code)
+            else:
+                data.append(0)
+            if i != input_index and base_type in (SIGHASH_NONE,
+                                                   SIGHASH_SINGLE):
+                data += bytes(4)
+            else:
+                data += self._sequence(i)
+
+        if base_type == SIGHASH_NONE:
+            data.append(0)
+        elif base_type == SIGHASH_SINGLE:
+            _append_compact_size(data, input_index + 1)
+            for _ in range(input_index):
+                # value -1 and empty script
+                data += b"\xff" * 8 + b"\x00"
+            data += self._output(input_index)
+        else:
+            _append_compact_size(data, tx.output_count)
+            data += self._outputs_data
+
+        data += struct.pack('<I', tx.lock_time)
+        data += struct.pack('<I', hash_type)
+        return bytes(data)
+
+    def segwit_v0(self, input_index: int, script_code: bytes, amount: int,
+                  hash_type: int = SIGHASH_ALL) -> bytes:
+        """
+        BIP143 signature hash, script_code is the witness script (or the
+        implied P2PKH script for P2WPKH)
+        """
+        return hash256(self.segwit_v0_preimage(
+            input_index, script_code, amount, hash_type))
+
+    def segwit_v0_preimage(self, input_index: int, script_code: bytes,
+                           amount: int,
+                           hash_type: int = SIGHASH_ALL) -> bytes:
+        base_type = hash_type & 0x1f
+        anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+
+        hash_prevouts = bytes(32) if anyone_can_pay else self.hash_prevouts
+        hash_sequence = bytes(32) if anyone_can_pay or base_type in (
+            SIGHASH_NONE, SIGHASH_SINGLE) else self.hash_sequence
+        if base_type not in (SIGHASH_NONE, SIGHASH_SINGLE):
+            hash_outputs = self.hash_outputs
+        elif base_type == SIGHASH_SINGLE and \
+                input_index < self.tx.output_count:
+            hash_outputs = hash256(self._output(input_index))
+        else:
+            hash_outputs = bytes(32)
+
+        data = bytearray(self._raw[:4])
+        data += hash_prevouts
+        data += hash_sequence
+        data += self._outpoint(input_index)
+        data += with_compact_size(script_code)
+        data += struct.pack('<Q', amount)
+        data += self._sequence(input_index)
+        data += hash_outputs
+        data += struct.pack('<I', self.tx.lock_time)
+        data += struct.pack('<I', hash_type)
+        return bytes(data)
+
+    def taproot(self, input_index: int, hash_type: int = SIGHASH_DEFAULT,
+                leaf_hash: Optional[bytes] = None,
+                annex: Optional[bytes] = None,
+                codesep_pos: int = 0xffffffff) -> bytes:
+        """
+        BIP341 signature hash, leaf_hash selects the script path spend
+        (BIP342 extension), annex is the raw annex including the 0x50 byte
+        """
+        return tagged_hash("TapSighash", self.taproot_preimage(
+            input_index, hash_type, leaf_hash, annex, codesep_pos))
+
+    def taproot_preimage(self, input_index: int,
+                         hash_type: int = SIGHASH_DEFAULT,
+                         leaf_hash: Optional[bytes] = None,
+                         annex: Optional[bytes] = None,
+                         codesep_pos: int = 0xffffffff) -> bytes:
+        """
+        Message of the TapSighash tagged hash
+        """
+        if hash_type not in (0x00, 0x01, 0x02, 0x03, 0x81, 0x82, 0x83):
+            raise ValueError("Invalid taproot hash type")
+
+        tx = self.tx
+        base_type = hash_type & 0x03
+        anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+
+        if base_type == SIGHASH_SINGLE and input_index >= tx.output_count:
+            raise ValueError("SIGHASH_SINGLE without a matching output")
+
+        data = bytearray([0x00, hash_type])
+        data += self._raw[:4]
+        data += struct.pack('<I', tx.lock_time)
+
+        if not anyone_can_pay:
+            data += self.sha_prevouts
+            data += self.sha_amounts
+            data += self.sha_scriptpubkeys
+            data += self.sha_sequences
+        if base_type not in (SIGHASH_NONE, SIGHASH_SINGLE):
+            data += self.sha_outputs
+
+        ext_flag = 0 if leaf_hash is None else 1
+        data.append(ext_flag * 2 + (0 if annex is None else 1))
+
+        if anyone_can_pay:
+            amount, script_pub_key = self._get_prevouts()[input_index]
+            data += self._outpoint(input_index)
+            data += struct.pack('<Q', amount)
+            data += with_compact_size(script_pub_key)
+            data += self._sequence(input_index)
+        else:
+            data += struct.pack('<I', input_index)
+
+        if annex is not None:
+            data += sha256(with_compact_size(annex))
+        if base_type == SIGHASH_SINGLE:
+            data += sha256(self._output(input_index))
+
+        if leaf_hash is not None:
+            data += leaf_hash
+            data.append(0x00)
+            data += struct.pack('<I', codesep_pos)
+
+        return bytes(data)
+
+    def all_legacy(self, script_codes: Sequence[bytes],
+                   hash_type: int = SIGHASH_ALL) -> List[bytes]:
+        return [self.legacy(i, script_code, hash_type)
+                for i, script_code in enumerate(script_codes)]
+
+    def all_segwit_v0(self, script_codes: Sequence[bytes],
+                      amounts: Sequence[int],
+                      hash_type: int = SIGHASH_ALL) -> List[bytes]:
+        return [self.segwit_v0(i, script_code, amount, hash_type)
+                for i, (script_code, amount)
+                in enumerate(zip(script_codes, amounts))]
+
+    def all_taproot(self, hash_type: int = SIGHASH_DEFAULT) -> List[bytes]:
+        return [self.taproot(i, hash_type)
+                for i in range(self.tx.input_count)]
+
+
+def _remove_codeseparators(script: bytes) -> bytes:
+    """
+    Drops OP_CODESEPARATOR opcodes while skipping over push data
+    """
+    res = bytearray()
+    i = 0
+    while i < len(script):
+        opcode = script[i]
+        start = i
+        i += 1
+        if 1 <= opcode <= 75:
+            i += opcode
+        elif opcode == 76:
+            i += 1 + script[i]
+        elif opcode == 77:
+            i += 2 + int.from_bytes(script[i:i + 2], byteorder='little')
+        elif opcode == 78:
+            i += 4 + int.from_bytes(script[i:i + 4], byteorder='little')
+        if opcode != OP_CODESEPARATOR:
+            res += script[start:i]
+    return bytes(res)
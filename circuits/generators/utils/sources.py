@@ -0,0 +1,195 @@
+from typing import Iterator, Optional, Set
+import argparse
+import glob
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+WORKSPACE_MANIFEST = "./Nargo.toml"
+# sha256 of the circuit sources and the toolchain the last VK of a package
+# was written with
+SOURCES_STAMP = "./target/{package}/sources.sha256"
+ARTIFACT = "./target/{package}.json"
+VK = "./target/{package}/vk"
+
+DEPENDENCY_PATH = re.compile(r'path\s*=\s*"([^"]+)"')
+TOOLCHAIN = (["nargo", "--version"], ["bb", "--version"])
+
+_toolchain: Optional[str] = None
+
+
+def toolchain_version() -> str:
+    """
+    Versions of nargo and bb, a compiled circuit and its VK are only valid
+    for the toolchain they were built with
+    """
+    global _toolchain
+    if _toolchain is None:
+        versions = []
+        for command in TOOLCHAIN:
+            try:
+                result = subprocess.run(command, capture_output=True,
+                                        text=True, check=True)
+                versions.append(result.stdout.strip())
+            except (OSError, subprocess.CalledProcessError):
+                versions.append(f"{command[0]} missing")
+        _toolchain = "\n".join(versions)
+    return _toolchain
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Writes the file only if its content differs, so unchanged sources
+    keep their mtime and do not look modified to nargo. The new content
+    is swapped in atomically. Returns whether the file was written.
+    """
+    data = content.encode()
+    try:
+        with open(path, "rb") as file:
+            if hashlib.sha256(file.read()).digest() == \
+                    hashlib.sha256(data).digest():
+                return False
+    except FileNotFoundError:
+        pass
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+
+def tidy_noir(text: str) -> str:
+    """
+    Layout of `nargo fmt` for the generated sources: no trailing
+    whitespace, no blank lines at the start or the end of a block, at most
+    one blank line in a row and the closing parenthesis of a split list
+    at the indentation of the line that opened it
+    """
+    lines = []
+    # indentation of the lines ending with an open parenthesis
+    openers = []
+    for line in text.split("\n"):
+        line = line.rstrip()
+        stripped = line.lstrip()
+        if stripped.startswith(")") and openers:
+            line = openers.pop() + stripped
+        if line.endswith("("):
+            openers.append(line[:len(line) - len(stripped)])
+        if not line:
+            if lines and (not lines[-1] or lines[-1].endswith("{")):
+                continue
+        elif line.lstrip().startswith(("}", ")")) and lines and not lines[-1]:
+            lines.pop()
+        lines.append(line)
+    while lines and not lines[-1]:
+        lines.pop()
+    return "\n".join(lines) + "\n"
+
+
+def _package_dirs(directory: str, seen: Set[str]):
+    # the package and its path dependencies
+    directory = os.path.normpath(directory)
+    if directory in seen:
+        return
+    seen.add(directory)
+    with open(os.path.join(directory, "Nargo.toml"), "r") as file:
+        manifest = file.read()
+    for dependency in DEPENDENCY_PATH.findall(manifest):
+        _package_dirs(os.path.join(directory, dependency), seen)
+
+
+def _source_files(package: str) -> Iterator[str]:
+    yield WORKSPACE_MANIFEST
+    seen: Set[str] = set()
+    _package_dirs(f"./app/{package}", seen)
+    for directory in sorted(seen):
+        yield os.path.join(directory, "Nargo.toml")
+        yield from sorted(glob.glob(os.path.join(directory, "**", "*.nr"),
+                                    recursive=True))
+
+
+def sources_fingerprint(package: str) -> str:
+    """
+    sha256 over the sources the package is compiled from: the workspace
+    manifest, the package and its path dependencies
+    """
+    h = hashlib.sha256()
+    for path in _source_files(package):
+        with open(path, "rb") as file:
+            data = file.read()
+        h.update(path.encode() + b"\0")
+        h.update(len(data).to_bytes(8, byteorder='little'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def build_fingerprint(package: str) -> str:
+    """
+    sha256 over the sources fingerprint and the toolchain version, what
+    the compiled circuit and its VK depend on
+    """
+    h = hashlib.sha256()
+    h.update(sources_fingerprint(package).encode() + b"\0")
+    h.update(toolchain_version().encode())
+    return h.hexdigest()
+
+
+def _stamp(package: str) -> Optional[str]:
+    try:
+        with open(SOURCES_STAMP.format(package=package), "r") as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def recompile_needed(package: str) -> bool:
+    """
+    Whether the sources or the toolchain differ from the ones of the last
+    written VK (or the circuit was never compiled)
+    """
+    return not (os.path.exists(ARTIFACT.format(package=package))
+                and os.path.exists(VK.format(package=package))
+                and _stamp(package) == build_fingerprint(package))
+
+
+def stamp(package: str):
+    path = SOURCES_STAMP.format(package=package)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_if_changed(path, build_fingerprint(package) + "\n")
+
+
+def recompile_report(app_path: str) -> str:
+    package = os.path.basename(app_path.rstrip("/"))
+    if recompile_needed(package):
+        return (f"Circuit sources or toolchain of {package} changed since "
+                f"the last compile, recompile needed")
+    return (f"Circuit sources of {package} unchanged, only the witness "
+            f"changes")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Track the circuit sources the VK was written for")
+    parser.add_argument("command", choices=["check", "stamp"],
+                        help="check: exit 1 if the circuit must be "
+                        "recompiled, stamp: record the current sources")
+    parser.add_argument("--package", type=str, required=True)
+    args = parser.parse_args()
+
+    if args.command == "check":
+        sys.exit(1 if recompile_needed(args.package) else 0)
+    stamp(args.package)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from generators.constants import (
+    CONSTANTS_NR, CONSTANTS_TEMPLATE, PROVER_TEMPLATE, PROVER_TOML)
+from generators.utils.artifacts import restore_report
+from generators.utils.buckets import apply_buckets
+from generators.utils.cost import (
+    cost_enabled, cost_report, remove_cost, spend_cost, write_cost)
+from generators.utils.hints import (
+    hints_to_toml, spend_hints, spend_sighashes)
+from generators.utils.preflight import preflight
+from generators.utils.profiling import Profiler
+from generators.utils.script import ANALYSIS_CACHE, Script, cache_report
+from generators.utils.sources import write_if_changed
+
+
+def write_spend(profiler: Profiler, config: Dict, constants: Dict,
+                prover: Dict, scripts: Sequence[Script] = (),
+                codegen: Optional[Callable[[], object]] = None,
+                tx_size: int = 0, signatures: int = 0,
+                prevouts: Optional[Sequence[Tuple[int, bytes]]] = None):
+    """
+    The steps every spend generator runs once the spend is parsed:
+    pre-flight, generated.nr, hints, the cost estimate (with
+    GENERATORS_COST set), constants.nr
+    (rounded to the size classes) and Prover.toml from their templates,
+    the artifact lookup of the rendered sources and the profile report
+    (with the script analysis cache counters).
+
+    constants, prover: values of the constants.nr and Prover.toml templates
+    scripts: the scripts executed by the circuit
+    codegen: writes generated.nr, after the spend passed pre-flight
+    tx_size: bytes of the transactions passed to the circuit
+    signatures: signature checks outside the scripts (taproot key path)
+    prevouts: (amount, script_pub_key) of every input, needed by taproot
+    """
+    app_path = config["file_path"]
+    profiler.stage("preflight")
+    preflight(config, prevouts)
+
+    if codegen is not None:
+        profiler.stage("codegen")
+        codegen()
+    profiler.stage("hints")
+    hints = spend_hints(config, scripts, prevouts)
+    profiler.stage("cost")
+    if cost_enabled():
+        cost = spend_cost(scripts, spend_sighashes(config, prevouts, hints),
+                          tx_size, signatures)
+        print(cost_report(cost, write_cost(app_path, cost)))
+    else:
+        remove_cost(app_path)
+
+    profiler.stage("render")
+    with open(app_path + CONSTANTS_TEMPLATE, "r") as file:
+        constants_nr = file.read().format(
+            **apply_buckets(app_path, constants))
+    profiler.stage("write")
+    write_if_changed(app_path + CONSTANTS_NR, constants_nr)
+
+    profiler.stage("render")
+    with open(app_path + PROVER_TEMPLATE, "r") as file:
+        prover_toml = file.read().format(**prover) + hints_to_toml(hints)
+    profiler.stage("write")
+    write_if_changed(app_path + PROVER_TOML, prover_toml)
+
+    print(restore_report(app_path))
+    if profiler.enabled:
+        profiler.note("analysis_cache", ANALYSIS_CACHE.cache_info()._asdict())
+        print(cache_report())
+    profiler.finish(app_path)
@@ -0,0 +1,254 @@
+from typing import Dict, List, Optional, Sequence, Union
+import os
+
+from generators.utils.interpreter import (
+    OP_0, OP_16, OP_1, OP_1NEGATE, OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY,
+    OP_CHECKSIG, OP_CHECKSIGVERIFY, OP_PUSHDATA1, OP_PUSHDATA2, OP_PUSHDATA4,
+    HASH_FUNCTIONS, ScriptEvalError, ScriptInterpreter, ScriptObserver)
+from generators.utils.script import Script, to_bytes_or_keep
+
+# interpreter (default) or straight_line
+CODEGEN_ENV = "GENERATORS_CODEGEN"
+CODEGEN_MODES = ("interpreter", "straight_line")
+
+# opcodes executed the same way as by ScriptExecutionEngine::execute,
+# a script using any other opcode keeps the interpreter
+STACK_CALLS = {
+    107: "stack.op_toaltstack();",
+    108: "stack.op_fromaltstack();",
+    109: "stack.op_2drop();",
+    110: "stack.op_2dup();",
+    111: "stack.op_3dup();",
+    112: "stack.op_2over();",
+    113: "stack.op_2rot();",
+    114: "stack.op_2swap();",
+    115: "stack.op_ifdup();",
+    116: "stack.op_depth();",
+    117: "stack.op_drop();",
+    118: "stack.op_dup();",
+    119: "stack.op_nip();",
+    120: "stack.op_over();",
+    121: "stack.op_pick();",
+    122: "stack.op_roll();",
+    123: "stack.op_rot();",
+    124: "stack.op_swap();",
+    125: "stack.op_tuck();",
+    130: "stack.op_size();",
+    135: "stack.op_equal();",
+    136: "stack.op_equalverify();",
+    139: "stack.op_1add();",
+    140: "stack.op_1sub();",
+    143: "stack.op_negate();",
+    144: "stack.op_abs();",
+    145: "stack.op_not();",
+    146: "stack.op_0notequal();",
+    147: "stack.op_add();",
+    148: "stack.op_sub();",
+    154: "stack.op_booland();",
+    155: "stack.op_boolor();",
+    156: "stack.op_numequal();",
+    157: "stack.op_numequal();\nassert(stack.op_verify());",
+    158: "stack.op_numnotequal();",
+    159: "stack.op_lessthan();",
+    160: "stack.op_greaterthan();",
+    161: "stack.op_lessthanorequal();",
+    162: "stack.op_greaterthanorequal();",
+    163: "stack.op_min();",
+    164: "stack.op_max();",
+    165: "stack.op_within();",
+    177: "stack.op_checklocktimeverify();",
+    178: "stack.op_checksequenceverify();",
+}
+
+HASH_CALLS = {
+    0xa6: "op_ripemd160",
+    0xa7: "op_sha1",
+    0xa8: "op_sha256",
+    0xa9: "op_hash160",
+    0xaa: "op_hash256",
+}
+
+INDENT = " " * 8
+
+
+def codegen_mode() -> str:
+    mode = os.environ.get(CODEGEN_ENV, "interpreter")
+    if mode not in CODEGEN_MODES:
+        raise ValueError(f"{CODEGEN_ENV} must be one of "
+                         f"{', '.join(CODEGEN_MODES)}, not {mode}")
+    return mode
+
+
+class OperandObserver(ScriptObserver):
+    """
+    Operand sizes of the hash and multisig opcodes by script position
+    """
+
+    def __init__(self):
+        self.operands: Dict[int, tuple] = {}
+        self._pos = 0
+
+    def on_opcode(self, pos: int, opcode: int, executed: bool):
+        self._pos = pos
+
+    def on_hash(self, opcode: int, size: int):
+        self.operands[self._pos] = (size,)
+
+    def on_checkmultisig(self, opcode: int, keys_count: int,
+                         sigs_count: int):
+        self.operands[self._pos] = (keys_count, sigs_count)
+
+
+def _at(index: Union[int, str]) -> str:
+    # every program is instantiated for every SCRIPT_SIZE, the index is
+    # reduced so it stays in bounds for the sizes whose branch is dead
+    if isinstance(index, str):
+        index = f"({index})"
+    return f"script[{index} % SCRIPT_SIZE]"
+
+
+def _push(pos: int, width: int, size: int) -> List[str]:
+    lines = []
+    for i in range(width):
+        lines.append(f"assert({_at(pos + 1 + i)} == "
+                     f"{(size >> (8 * i)) & 0xff});")
+    start = pos + 1 + width
+    lines += [
+        f"let mut value = [0; {size}];",
+        f"for i in 0..{size} {{",
+        f"    value[i] = {_at(f'{start} + i')};",
+        "}",
+        "stack.push_bytes(value);",
+    ]
+    return lines
+
+
+def _checksig(verify: bool, taproot: bool) -> List[str]:
+    verify = str(verify).lower()
+    if taproot:
+        return [
+            "stack.op_checksig_p2tr::<UTXOS_LEN, CURRENT_INPUT_COUNT>(",
+            "    utxo_data,",
+            f"    {verify},",
+            "    false,",
+            "    Option::none(),",
+            "    leaf_script_hash,",
+            ");",
+        ]
+    return [
+        "stack",
+        "    .op_checksig::<SCRIPT_CODE_LEN, N_OUTPUT_SIZE, INPUT_TO_SIGN, "
+        "INPUT_TO_SIGN_LEN, N_INPUT_SIZE>(",
+        "        address,",
+        f"        {verify},",
+        "        false,",
+        "    );",
+    ]
+
+
+def specialize(script: Script, taproot: bool = False) -> Optional[List[str]]:
+    """
+    Noir statements executing the script as a fixed opcode sequence, None
+    if the script needs the interpreter (flow control, code separators,
+    opcodes the engine does not execute, or a failing evaluation). Every
+    opcode and push length byte is asserted against the script, the
+    pushed data stays a witness.
+    """
+    raw = bytes(script.raw)
+    observer = OperandObserver()
+    try:
+        ScriptInterpreter(observer, max_ops=None).run(
+            raw, [to_bytes_or_keep(op) for op in script.initial_stack])
+    except (ScriptEvalError, IndexError, ValueError):
+        return None
+
+    lines = []
+    pos = 0
+    while pos < len(raw):
+        opcode = raw[pos]
+        lines.append(f"assert({_at(pos)} == {opcode});")
+        if OP_0 < opcode <= OP_PUSHDATA4:
+            if opcode < OP_PUSHDATA1:
+                width, size = 0, opcode
+            else:
+                width = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2,
+                         OP_PUSHDATA4: 4}[opcode]
+                size = int.from_bytes(raw[pos + 1:pos + 1 + width],
+                                      byteorder='little')
+            lines += _push(pos, width, size)
+            pos += 1 + width + size
+            continue
+
+        if opcode == OP_0:
+            lines.append("stack.op_num(0);")
+        elif opcode == OP_1NEGATE:
+            lines.append("stack.op_num(-1);")
+        elif OP_1 <= opcode <= OP_16:
+            lines.append(f"stack.op_num({opcode - 80});")
+        elif opcode in STACK_CALLS:
+            lines += STACK_CALLS[opcode].split("\n")
+        elif opcode in HASH_FUNCTIONS:
+            (size,) = observer.operands[pos]
+            lines += [
+                f"assert(stack.get_last_stack_element_length() == {size});",
+                f"stack.{HASH_CALLS[opcode]}::<{size}>();",
+            ]
+        elif opcode in (OP_CHECKSIG, OP_CHECKSIGVERIFY):
+            lines += _checksig(opcode == OP_CHECKSIGVERIFY, taproot)
+        elif opcode in (OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY) \
+                and not taproot:
+            n, m = observer.operands[pos]
+            verify = str(opcode == OP_CHECKMULTISIGVERIFY).lower()
+            lines += [
+                "assert(utils::convert::vec_to_u32(stack.data[stack.stack_size"
+                f" - 1]) == {n});",
+                "assert(utils::convert::vec_to_u32(stack.data[stack.stack_size"
+                f" - {2 + n}]) == {m});",
+                "stack",
+                "    .op_checkmulsig::<SCRIPT_CODE_LEN, N_OUTPUT_SIZE, "
+                f"INPUT_TO_SIGN, INPUT_TO_SIGN_LEN, N_INPUT_SIZE, {n}, {m}>(",
+                "        address,",
+                f"        {verify},",
+                "    );",
+            ]
+        else:
+            return None
+        pos += 1
+    return lines
+
+
+def straight_line_programs(scripts: Sequence[Script],
+                           taproot: bool = False) -> Dict[int, List[str]]:
+    """
+    Specialized programs of the scripts by script size, the size selects
+    the program at compile time. Scripts of the same size with different
+    programs keep the interpreter.
+    """
+    programs: Dict[int, List[str]] = {}
+    conflicts = set()
+    for script in scripts:
+        size = len(script.raw)
+        program = specialize(script, taproot)
+        if program is None or size == 0:
+            conflicts.add(size)
+        elif programs.setdefault(size, program) != program:
+            conflicts.add(size)
+    return {size: program for size, program in programs.items()
+            if size not in conflicts}
+
+
+def render(programs: Dict[int, List[str]]) -> Dict[str, str]:
+    """
+    The straightLineCovers and straightLine placeholders of
+    generated.nr.template
+    """
+    covers = " | ".join(f"(SCRIPT_SIZE == {size})"
+                        for size in sorted(programs)) or "false"
+    blocks = []
+    for size in sorted(programs):
+        body = "\n".join(INDENT + line for line in programs[size])
+        blocks.append(f"    if SCRIPT_SIZE == {size} {{\n{body}\n    }}")
+    return {
+        "straightLineCovers": covers,
+        "straightLine": "\n".join(blocks),
+    }
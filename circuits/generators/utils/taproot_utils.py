@@ -2,8 +2,6 @@ import requests
 import sys
 from typing import Tuple
 
-from bitcoin.core import b2x, CTransaction
-from bitcoin.core.serialize import BytesIO
 from generators.utils.tx import Transaction
 
 
@@ -12,7 +10,7 @@ def get_outputs_from_inputs(
     outs = []
     pos = []
     cur_pos = 0
-    txid = calculate_txid_from_hex(tx.to_hex())
+    txid = tx.txid
     response = requests.get(f"https://blockstream.info/api/tx/{txid}")
     if response.ok:
         tx_data = response.json()
@@ -35,9 +33,20 @@ def get_outputs_from_inputs(
     return (outs, pos)
 
 
+def get_spent_outputs(outs: list[int], pos: list[Tuple[int, int, int]]
+                      ) -> list[Tuple[int, bytes]]:
+    """
+    (amount, script_pub_key) of every input from the result of
+    get_outputs_from_inputs
+    """
+    data = bytes(outs)
+    return [(int.from_bytes(data[amount_pos:size_pos], byteorder='little'),
+             data[script_pos:pos[i + 1][0]])
+            for i, (amount_pos, size_pos, script_pos) in enumerate(pos[:-1])]
+
+
 def calculate_txid_from_hex(raw_hex: str) -> str:
-    tx = CTransaction.stream_deserialize(BytesIO(bytes.fromhex(raw_hex)))
-    return b2x(tx.GetTxid()[::-1])
+    return Transaction(raw_hex).txid
 
 
 def get_outputs_positions_as_toml(pos: list[Tuple[int, int, int]]) -> str:
@@ -0,0 +1,101 @@
+from collections import namedtuple
+from typing import Optional, Sequence
+
+OP_0 = 0x00
+OP_1 = 0x51
+OP_16 = 0x60
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+MAX_DIRECT_PUSH = 75
+
+# executed_opcodes, stack_peak, alt_stack_peak and costs as reported by
+# ExecutionPathObserver, sizes holds the hash and signature entries only
+# (the pushes are collected while the elements are parsed)
+TemplateAnalysis = namedtuple('TemplateAnalysis', [
+    'name', 'executed_opcodes', 'stack_peak', 'alt_stack_peak', 'sizes',
+    'costs'])
+
+
+def _is_push(opcode: int) -> bool:
+    return 1 <= opcode <= MAX_DIRECT_PUSH
+
+
+def _p2pk(script: bytes, shape: Sequence[int]) -> Optional[TemplateAnalysis]:
+    # <sig> <pubkey> OP_CHECKSIG
+    if len(shape) != 3 or not (_is_push(shape[0]) and _is_push(shape[1])) \
+            or shape[2] != OP_CHECKSIG:
+        return None
+    return TemplateAnalysis("p2pk", 3, 2, 0, {(OP_CHECKSIG, 0, 0, 0)},
+                            {(OP_CHECKSIG, 0): 1})
+
+
+def _p2pkh(script: bytes, shape: Sequence[int]) -> Optional[TemplateAnalysis]:
+    # <sig> <pubkey> OP_DUP OP_HASH160 <20> OP_EQUALVERIFY OP_CHECKSIG,
+    # p2wpkh spends are analysed in the same form
+    if len(shape) != 7 or not (_is_push(shape[0]) and _is_push(shape[1])) \
+            or tuple(shape[2:]) != (OP_DUP, OP_HASH160, 20, OP_EQUALVERIFY,
+                                    OP_CHECKSIG):
+        return None
+    return TemplateAnalysis("p2pkh", 7, 4, 0, {
+        (OP_HASH160, shape[1], 0, 0), (OP_CHECKSIG, 0, 0, 0)}, {
+        (OP_DUP, 0): 1, (OP_HASH160, shape[1]): 1, (OP_EQUALVERIFY, 0): 1,
+        (OP_CHECKSIG, 0): 1})
+
+
+def _multisig(script: bytes,
+              shape: Sequence[int]) -> Optional[TemplateAnalysis]:
+    # OP_0 <sig>...<sig> OP_m <pubkey>...<pubkey> OP_n OP_CHECKMULTISIG
+    if len(shape) < 6 or shape[0] != OP_0 or shape[-1] != OP_CHECKMULTISIG \
+            or not OP_1 <= shape[-2] <= OP_16:
+        return None
+    n = shape[-2] - (OP_1 - 1)
+    m_pos = len(shape) - 3 - n
+    if m_pos < 2 or not OP_1 <= shape[m_pos] <= OP_16:
+        return None
+    m = shape[m_pos] - (OP_1 - 1)
+    if m > n or m_pos != m + 1 or \
+            not all(_is_push(op) for op in shape[1:m_pos]) or \
+            not all(_is_push(op) for op in shape[m_pos + 1:-2]):
+        return None
+    return TemplateAnalysis("multisig", m + n + 4, m + n + 3, 0, {
+        (OP_CHECKMULTISIG, 0, n, m)}, {(OP_CHECKMULTISIG, n): 1})
+
+
+def _p2sh_witness(script: bytes,
+                  shape: Sequence[int]) -> Optional[TemplateAnalysis]:
+    # <0 <20 or 32 byte program>> OP_HASH160 <20> OP_EQUAL
+    if tuple(shape) not in ((22, OP_HASH160, 20, OP_EQUAL),
+                            (34, OP_HASH160, 20, OP_EQUAL)):
+        return None
+    if script[1] != OP_0 or script[2] != shape[0] - 2:
+        return None
+    return TemplateAnalysis("p2sh_witness", 4, 2, 0, {
+        (OP_HASH160, shape[0], 0, 0)}, {
+        (OP_HASH160, shape[0]): 1, (OP_EQUAL, 0): 1})
+
+
+# a taproot key path spend has no script: the p2tr generator never builds a
+# Script for it and counts its signature check separately, so there is no
+# template for it
+TEMPLATES = (_p2pkh, _p2pk, _multisig, _p2sh_witness)
+
+
+def match_template(script: bytes,
+                   shape: Sequence[int]) -> Optional[TemplateAnalysis]:
+    """
+    Recognizes the standard spends whose analysis follows from the
+    template, every signature is assumed to be valid.
+
+    script: the whole script, analysed with an empty initial stack
+    shape: first byte of every element (the size of a direct push)
+    """
+    for template in TEMPLATES:
+        analysis = template(script, shape)
+        if analysis is not None:
+            return analysis
+    return None
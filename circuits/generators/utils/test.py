@@ -1,6 +1,45 @@
 import unittest
 from tx import Transaction
+import hashlib
+import io
 import json
+import os
+import tempfile
+from unittest import mock
+
+from bitcoin.core import CTransaction, Hash160
+from bitcoin.core.script import CScript, RawSignatureHash
+from bitcoin.core.scripteval import _EvalScript
+from generators.blocks.raw_block import RawBlockReader
+from generators.utils import tx as tx_module
+from generators.utils.analysis_store import AnalysisStore
+from generators.utils.artifacts import MANIFEST, ArtifactStore, artifact_key
+from generators.utils.buckets import BUCKETS_ENV, Buckets, apply_buckets
+from generators.utils.interpreter import (
+    MAX_SCRIPT_OPCODES, SIGVERSION_TAPSCRIPT, SIGVERSION_WITNESS_V0,
+    ScriptInterpreter, ScriptObserver)
+from generators.utils.script import Script, ScriptAnalysisCache
+from generators.utils.straight_line import (
+    render, specialize, straight_line_programs)
+from generators.utils.sources import (
+    recompile_needed, stamp, tidy_noir, write_if_changed)
+from generators.utils.sighash import (
+    SIGHASH_ALL, SIGHASH_ANYONECANPAY, SIGHASH_NONE, SIGHASH_SINGLE,
+    SignatureHasher)
+from generators.utils.preflight import PreflightError, verify_input
+from generators.utils.secp256k1 import (
+    N, ecdsa_verify, is_valid_der_signature, parse_der_signature,
+    schnorr_verify)
+from generators.utils.tx_batch import TxBatch
+from generators.utils.tx_stream import (
+    _decode_chunk, _iter_line_chunks, iter_json_records, iter_transactions,
+    record_to_bytes)
+
+TX_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tx_json")
+LEGACY_TX_HEX = "0100000001ca6f756063374f4becc0c1a9cdadd7ba5280628e85cfe913b74e430acac2832b010000006b483045022100cfb9859fac5da682f6cebfa91edce02b14cb02055f96a3923a4e49391d19c426022063d5cf657c6dae418fd5148b50a5d3c47dac08621d4a1f80824c0ab9a2ec679301210263edb55eb14e554f816f1eb15d239f52d9089200034eecf7e8a6851b575bfb7dffffffff02905f0100000000001976a914307893c7b1618d0c89594c80b3c1bf1bef9e6a9c88aca58b4102000000001976a9140f2b734427c169a1b312105e1185517d57e1fbe188ac00000000"
+SEGWIT_TX_HEX = "020000000001014e3cd415635d53518d162dd9cedd2173da7234760b1f7aa7f6bb3946b63d283e0100000000fdffffff0234700000000000001600146e470afa1366f07125b1638e99586327e3c17af99a09360000000000160014c6af146c1b3cfe443c09cd7c06fb12a59ad9051002483045022100cba3efd18e7190b2927a94d51108a132c258d949b1ac0e55c7b6a87dee93e82e02200984996b234a39de2bd7e1f5b3f76d31688c38bf0304a95fc717d88a51a04498012102c482d6683ed1ca34571770bb71aafe633b970bc077c14b64d1822a6effb4878900000000"
+GENESIS_HEADER_HEX = "0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c"
+GENESIS_COINBASE_HEX = "01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000"
 
 
 class TestTransation(unittest.TestCase):
@@ -20,6 +59,60 @@ class TestTransation(unittest.TestCase):
         tx_hex_2 = tx.to_hex()
         self.assertEqual(tx_hex, tx_hex_2)
 
+    def test_bytes_tx(self):
+        tx_hex = "020000000001014e3cd415635d53518d162dd9cedd2173da7234760b1f7aa7f6bb3946b63d283e0100000000fdffffff0234700000000000001600146e470afa1366f07125b1638e99586327e3c17af99a09360000000000160014c6af146c1b3cfe443c09cd7c06fb12a59ad9051002483045022100cba3efd18e7190b2927a94d51108a132c258d949b1ac0e55c7b6a87dee93e82e02200984996b234a39de2bd7e1f5b3f76d31688c38bf0304a95fc717d88a51a04498012102c482d6683ed1ca34571770bb71aafe633b970bc077c14b64d1822a6effb4878900000000"
+        raw = bytes.fromhex(tx_hex)
+        tx = Transaction(memoryview(raw + b"\x00" * 8))
+        self.assertEqual(tx.to_hex(), tx_hex)
+        self.assertEqual(tx.witness[0].stack_items[1].item_size, 33)
+        self.assertEqual(
+            tx.outputs[1].script_pub_key,
+            bytes.fromhex("0014c6af146c1b3cfe443c09cd7c06fb12a59ad90510"))
+        # decoded fields are bytes, not views of the buffer
+        self.assertEqual(tx.inputs[0].script_sig + b"\x51", b"\x51")
+        self.assertEqual(tx.inputs[0].txid[:2] + b"", bytes.fromhex("4e3c"))
+
+    def test_cut_script_sigs(self):
+        tx_hex = "0100000001ca6f756063374f4becc0c1a9cdadd7ba5280628e85cfe913b74e430acac2832b010000006b483045022100cfb9859fac5da682f6cebfa91edce02b14cb02055f96a3923a4e49391d19c426022063d5cf657c6dae418fd5148b50a5d3c47dac08621d4a1f80824c0ab9a2ec679301210263edb55eb14e554f816f1eb15d239f52d9089200034eecf7e8a6851b575bfb7dffffffff02905f0100000000001976a914307893c7b1618d0c89594c80b3c1bf1bef9e6a9c88aca58b4102000000001976a9140f2b734427c169a1b312105e1185517d57e1fbe188ac00000000"
+        tx = Transaction(bytes.fromhex(tx_hex))
+        tx.cut_script_sigs()
+        self.assertEqual(tx.inputs[0].script_sig_size, 0)
+        self.assertEqual(
+            tx.to_hex(), tx_hex[:82] + "00" + tx_hex[82 + 2 + 0x6b * 2:])
+
+    def test_write_into(self):
+        tx_hex = "0100000001ca6f756063374f4becc0c1a9cdadd7ba5280628e85cfe913b74e430acac2832b010000006b483045022100cfb9859fac5da682f6cebfa91edce02b14cb02055f96a3923a4e49391d19c426022063d5cf657c6dae418fd5148b50a5d3c47dac08621d4a1f80824c0ab9a2ec679301210263edb55eb14e554f816f1eb15d239f52d9089200034eecf7e8a6851b575bfb7dffffffff02905f0100000000001976a914307893c7b1618d0c89594c80b3c1bf1bef9e6a9c88aca58b4102000000001976a9140f2b734427c169a1b312105e1185517d57e1fbe188ac00000000"
+        tx = Transaction(tx_hex)
+        tx.cut_script_sigs()
+        size = tx._get_transaction_size()
+        buffer = bytearray(size + 3)
+        self.assertEqual(tx.write_into(buffer, 3), size + 3)
+        self.assertEqual(bytes(buffer[3:]), tx.to_bytes())
+        self.assertEqual(tx._get_hex_from_compact_size(0x1234), "fd3412")
+
+    def test_layout(self):
+        tx_hex = "020000000001014e3cd415635d53518d162dd9cedd2173da7234760b1f7aa7f6bb3946b63d283e0100000000fdffffff0234700000000000001600146e470afa1366f07125b1638e99586327e3c17af99a09360000000000160014c6af146c1b3cfe443c09cd7c06fb12a59ad9051002483045022100cba3efd18e7190b2927a94d51108a132c258d949b1ac0e55c7b6a87dee93e82e02200984996b234a39de2bd7e1f5b3f76d31688c38bf0304a95fc717d88a51a04498012102c482d6683ed1ca34571770bb71aafe633b970bc077c14b64d1822a6effb4878900000000"
+        tx = Transaction(tx_hex)
+        layout = tx.layout
+        self.assertEqual(layout.size, len(tx_hex) // 2)
+        self.assertEqual(layout.inputs[0], (7, 41))
+        self.assertEqual(layout.outputs[1], (80, 31))
+        self.assertEqual(layout.witnesses[0], (111, 108))
+        self.assertEqual(layout.witness_items[0][1], (185, 34))
+        self.assertEqual(layout.max_witness_stack_size, 2)
+        self.assertEqual(layout, tx._build_layout())
+
+    def test_txid(self):
+        tx = Transaction("01000000030dd7891efbf67da47c651531db8aab3144ed7a524e4ae1e30b773525e27ddd7b000000004948304502206f6a68710a51f77e5a1fa4d1037a23a76723724a51fd54710949e0189ee02dfa022100dad3454ade12fe84f3818e14c41ec2e02bbb154dd3136a094cdf86f67ebbe0b601ffffffff16851666962e37a75a246101f2e340c628b1db3c045d4d3cfb2d1c0f58f97c6f000000008b48304502203f004eeed0cef2715643e2f25a27a28f3c578e94c7f0f6a4df104e7d163f7f8f022100b8b248c1cfd8f77a0365107a9511d759b7544d979dd152a955c867afac0ef7860141044d05240cfbd8a2786eda9dadd520c1609b8593ff8641018d57703d02ba687cf2f187f0cee2221c3afb1b5ff7888caced2423916b61444666ca1216f26181398cffffffffffda5d38e91fd9a0d92872d51f83cb746fc7bf5d3ff13402f8d0d5ed60ddc79c0000000049483045022100b6fd43f2fa16e092678283f64d2e08fb2070b4af2b3ddfb9ca3c5e238288acaa02200c5a28e0a4fc1a540f6eeb30ccc4788050eae46964fe33ccb4500c3de1320c2501ffffffff02c0c62d00000000001976a91417194e1bd175fb5b1b2a1f9d221f6f5c29e1928388ac00c817a8040000001976a91465bda9b05f7e9a8f96a7f4ba0996a877708ef90888ac00000000")
+        self.assertEqual(
+            tx.txid, "12e753ef5cc30925a6eee2c457aa7f53022443ca013ea81882a6b59b69e342a6")
+        self.assertEqual(tx.wtxid, tx.txid)
+        tx = Transaction("020000000001014e3cd415635d53518d162dd9cedd2173da7234760b1f7aa7f6bb3946b63d283e0100000000fdffffff0234700000000000001600146e470afa1366f07125b1638e99586327e3c17af99a09360000000000160014c6af146c1b3cfe443c09cd7c06fb12a59ad9051002483045022100cba3efd18e7190b2927a94d51108a132c258d949b1ac0e55c7b6a87dee93e82e02200984996b234a39de2bd7e1f5b3f76d31688c38bf0304a95fc717d88a51a04498012102c482d6683ed1ca34571770bb71aafe633b970bc077c14b64d1822a6effb4878900000000")
+        self.assertEqual(
+            tx.txid, "bc6a353070bc98e501c8ebc32397a4b088b04bf4f54d749a934b3e4f75e978d8")
+        self.assertEqual(
+            tx.wtxid, "76d2885064f5ca6ad75731a0ccb15d76892706461db23f016a7c388ee45ed129")
+
     def test_legacy_from_json(self):
         file_path = "tx-json/legacy.json"
         tx_hex = "01000000030dd7891efbf67da47c651531db8aab3144ed7a524e4ae1e30b773525e27ddd7b000000004948304502206f6a68710a51f77e5a1fa4d1037a23a76723724a51fd54710949e0189ee02dfa022100dad3454ade12fe84f3818e14c41ec2e02bbb154dd3136a094cdf86f67ebbe0b601ffffffff16851666962e37a75a246101f2e340c628b1db3c045d4d3cfb2d1c0f58f97c6f000000008b48304502203f004eeed0cef2715643e2f25a27a28f3c578e94c7f0f6a4df104e7d163f7f8f022100b8b248c1cfd8f77a0365107a9511d759b7544d979dd152a955c867afac0ef7860141044d05240cfbd8a2786eda9dadd520c1609b8593ff8641018d57703d02ba687cf2f187f0cee2221c3afb1b5ff7888caced2423916b61444666ca1216f26181398cffffffffffda5d38e91fd9a0d92872d51f83cb746fc7bf5d3ff13402f8d0d5ed60ddc79c0000000049483045022100b6fd43f2fa16e092678283f64d2e08fb2070b4af2b3ddfb9ca3c5e238288acaa02200c5a28e0a4fc1a540f6eeb30ccc4788050eae46964fe33ccb4500c3de1320c2501ffffffff02c0c62d00000000001976a91417194e1bd175fb5b1b2a1f9d221f6f5c29e1928388ac00c817a8040000001976a91465bda9b05f7e9a8f96a7f4ba0996a877708ef90888ac00000000"
@@ -45,5 +138,943 @@ class TestTransation(unittest.TestCase):
         self.assertEqual(tx.print_noir_template(), template)
 
 
+class TestRawBlock(unittest.TestCase):
+    def test_genesis_block(self):
+        raw = bytes.fromhex(GENESIS_HEADER_HEX + "01" + GENESIS_COINBASE_HEX)
+        with RawBlockReader(raw) as reader:
+            self.assertEqual(
+                reader.header.get_block_hash(),
+                "000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f")
+            txs = list(reader)
+            self.assertEqual(len(reader), 1)
+            self.assertEqual(txs[0].offset, 81)
+            self.assertEqual(txs[0].size, 204)
+            self.assertEqual(
+                txs[0].txid,
+                "4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b")
+            del txs
+
+    def test_offsets_and_txids(self):
+        tx_hexes = [GENESIS_COINBASE_HEX, LEGACY_TX_HEX, SEGWIT_TX_HEX]
+        raw = bytes.fromhex(GENESIS_HEADER_HEX + "03" + "".join(tx_hexes))
+        # trailing bytes after the block are not read
+        reader = RawBlockReader(raw + b"\xff" * 4)
+        offset = 81
+        for index, block_tx in enumerate(reader):
+            tx_raw = bytes.fromhex(tx_hexes[index])
+            self.assertEqual(block_tx.index, index)
+            self.assertEqual(block_tx.offset, offset)
+            self.assertEqual(block_tx.size, len(tx_raw))
+            self.assertEqual(raw[offset:offset + block_tx.size], tx_raw)
+            self.assertEqual(block_tx.txid, Transaction(tx_hexes[index]).txid)
+            self.assertEqual(block_tx.tx.to_hex(), tx_hexes[index])
+            offset += block_tx.size
+        self.assertEqual(offset, len(raw))
+
+
+class TestTxBatch(unittest.TestCase):
+    def test_rehydrate(self):
+        stripped = tx_module.Transaction(LEGACY_TX_HEX)
+        stripped.cut_script_sigs()
+        txs = [
+            tx_module.Transaction(LEGACY_TX_HEX),
+            tx_module.Transaction(SEGWIT_TX_HEX),
+            stripped,
+        ]
+        batch = TxBatch()
+        batch.extend(txs)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.input_count(1), 1)
+        self.assertEqual(batch.output_count(1), 2)
+        for tx, stored in zip(txs, batch):
+            self.assertEqual(stored.to_bytes(), tx.to_bytes())
+            self.assertEqual(stored.txid, tx.txid)
+            self.assertEqual(stored.wtxid, tx.wtxid)
+        self.assertEqual(batch[-2].witness[0].stack_items[1].item_size, 33)
+        self.assertEqual(bytes(batch.to_bytes(0)), bytes.fromhex(LEGACY_TX_HEX))
+        with self.assertRaises(IndexError):
+            batch[3]
+
+
+class TestSignatureHasher(unittest.TestCase):
+    # BIP143 examples
+    def test_p2wpkh(self):
+        tx = tx_module.Transaction("0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000")
+        hasher = SignatureHasher(tx)
+        script_code = bytes.fromhex(
+            "76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac")
+        self.assertEqual(
+            hasher.hash_prevouts.hex(),
+            "96b827c8483d4e9b96712b6713a7b68d6e8003a781feba36c31143470b4efd37")
+        self.assertEqual(
+            hasher.hash_sequence.hex(),
+            "52b0a642eea2fb7ae638c36f6252b6750293dbe574a806984b8e4d8548339a3b")
+        self.assertEqual(
+            hasher.hash_outputs.hex(),
+            "863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5")
+        self.assertEqual(
+            hasher.segwit_v0(1, script_code, 600000000).hex(),
+            "c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670")
+
+    def test_p2sh_p2wpkh(self):
+        tx = tx_module.Transaction("0100000001db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a54770100000000feffffff02b8b4eb0b000000001976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac92040000")
+        script_code = bytes.fromhex(
+            "76a91479091972186c449eb1ded22b78e40d009bdf008988ac")
+        self.assertEqual(
+            SignatureHasher(tx).segwit_v0(0, script_code, 1000000000).hex(),
+            "64f3b0f4dd2bb3aa1ce8566d220cc74dda9df97d8490cc81d89d735c92e59fb6")
+
+    def test_p2wsh_codeseparator(self):
+        tx = tx_module.Transaction("0100000002fe3dc9208094f3ffd12645477b3dc56f60ec4fa8e6f5d67c565d1c6b9216b36e0000000000ffffffff0815cf020f013ed6cf91d29f4202e8a58726b1ac6c79da47c23d1bee0a6925f80000000000ffffffff0100f2052a010000001976a914a30741f8145e5acadf23f751864167f32e0963f788ac00000000")
+        hasher = SignatureHasher(tx)
+        script_code = bytes.fromhex("21026dccc749adc2a9d0d89497ac511f760f45c47dc5ed9cf352a58ac706453880aeadab210255a9626aebf5e29c0e6538428ba0d1dcf6ca98ffdf086aa8ced5e0d0215ea465ac")
+        self.assertEqual(
+            hasher.segwit_v0(1, script_code, 4900000000, SIGHASH_SINGLE).hex(),
+            "82dde6e4f1e94d02c2b7ad03d2115d691f48d064e9d52f58194a6637e4194391")
+        self.assertEqual(
+            hasher.segwit_v0(1, script_code[36:], 4900000000,
+                             SIGHASH_SINGLE).hex(),
+            "fef7bd749cce710c5c052bd796df1af0d935e59cea63736268bcbe2d2134fc47")
+
+    def test_p2sh_p2wsh_hash_types(self):
+        tx = tx_module.Transaction("010000000136641869ca081e70f394c6948e8af409e18b619df2ed74aa106c1ca29787b96e0100000000ffffffff0200e9a435000000001976a914389ffce9cd9ae88dcc0631e88a821ffdbe9bfe2688acc0832f05000000001976a9147480a33f950689af511e6e84c138dbbd3c3ee41588ac00000000")
+        hasher = SignatureHasher(tx)
+        witness_script = bytes.fromhex("56210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba32103b28f0c28bfab54554ae8c658ac5c3e0ce6e79ad336331f78c428dd43eea8449b21034b8113d703413d57761b8b9781957b8c0ac1dfe69f492580ca4195f50376ba4a21033400f6afecb833092a9a21cfdf1ed1376e58c5d1f47de74683123987e967a8f42103a6d48b1131e94ba04d9737d61acdaa1322008af9602b3b14862c07a1789aac162102d8b661b0b3302ee2f162b09e07a55ad5dfbe673a9f01d9f0c19617681024306b56ae")
+        expected = {
+            SIGHASH_ALL: "185c0be5263dce5b4bb50a047973c1b6272bfbd0103a89444597dc40b248ee7c",
+            SIGHASH_NONE: "e9733bc60ea13c95c6527066bb975a2ff29a925e80aa14c213f686cbae5d2f36",
+            SIGHASH_SINGLE: "1e1f1c303dc025bd664acb72e583e933fae4cff9148bf78c157d1e8f78530aea",
+            SIGHASH_ALL | SIGHASH_ANYONECANPAY: "2a67f03e63a6a422125878b40b82da593be8d4efaafe88ee528af6e5a9955c6e",
+            SIGHASH_NONE | SIGHASH_ANYONECANPAY: "781ba15f3779d5542ce8ecb5c18716733a5ee42a6f51488ec96154934e2c890a",
+            SIGHASH_SINGLE | SIGHASH_ANYONECANPAY: "511e8e52ed574121fc1b654970395502128263f62662e076dc6baf05c2e6a99b",
+        }
+        for hash_type, sighash in expected.items():
+            self.assertEqual(
+                hasher.segwit_v0(0, witness_script, 987654321,
+                                 hash_type).hex(), sighash)
+
+    # BIP341 key path spending vectors
+    def test_taproot(self):
+        tx = tx_module.Transaction("02000000097de20cbff686da83a54981d2b9bab3586f4ca7e48f57f5b55963115f3b334e9c010000000000000000d7b7cab57b1393ace2d064f4d4a2cb8af6def61273e127517d44759b6dafdd990000000000fffffffff8e1f583384333689228c5d28eac13366be082dc57441760d957275419a418420000000000fffffffff0689180aa63b30cb162a73c6d2a38b7eeda2a83ece74310fda0843ad604853b0100000000feffffffaa5202bdf6d8ccd2ee0f0202afbbb7461d9264a25e5bfd3c5a52ee1239e0ba6c0000000000feffffff956149bdc66faa968eb2be2d2faa29718acbfe3941215893a2a3446d32acd050000000000000000000e664b9773b88c09c32cb70a2a3e4da0ced63b7ba3b22f848531bbb1d5d5f4c94010000000000000000e9aa6b8e6c9de67619e6a3924ae25696bb7b694bb677a632a74ef7eadfd4eabf0000000000ffffffffa778eb6a263dc090464cd125c466b5a99667720b1c110468831d058aa1b82af10100000000ffffffff0200ca9a3b000000001976a91406afd46bcdfd22ef94ac122aa11f241244a37ecc88ac807840cb0000000020ac9a87f5594be208f8532db38cff670c450ed2fea8fcdefcc9a663f78bab962b0065cd1d")
+        prevouts = [
+            (420000000, "512053a1f6e454df1aa2776a2814a721372d6258050de330b3c6d10ee8f4e0dda343"),
+            (462000000, "5120147c9c57132f6e7ecddba9800bb0c4449251c92a1e60371ee77557b6620f3ea3"),
+            (294000000, "76a914751e76e8199196d454941c45d1b3a323f1433bd688ac"),
+            (504000000, "5120e4d810fd50586274face62b8a807eb9719cef49c04177cc6b76a9a4251d5450e"),
+            (630000000, "512091b64d5324723a985170e4dc5a0f84c041804f2cd12660fa5dec09fc21783605"),
+            (378000000, "00147dd65592d0ab2fe0d0257d571abf032cd9db93dc"),
+            (672000000, "512075169f4001aa68f15bbed28b218df1d0a62cbbcf1188c6665110c293c907b831"),
+            (546000000, "5120712447206d7a5238acc7ff53fbe94a3b64539ad291c7cdbc490b7577e4b17df5"),
+            (588000000, "512077e30a5522dd9f894c3f8b8bd4c4b2cf82ca7da8a3ea6a239655c39c050ab220"),
+        ]
+        hasher = SignatureHasher(
+            tx, [(amount, bytes.fromhex(spk)) for amount, spk in prevouts])
+        self.assertEqual(
+            hasher.sha_amounts.hex(),
+            "58a6964a4f5f8f0b642ded0a8a553be7622a719da71d1f5befcefcdee8e0fde6")
+        self.assertEqual(
+            hasher.sha_outputs.hex(),
+            "a2e6dab7c1f0dcd297c8d61647fd17d821541ea69c3cc37dcbad7f90d4eb4bc5")
+        self.assertEqual(
+            hasher.sha_prevouts.hex(),
+            "e3b33bb4ef3a52ad1fffb555c0d82828eb22737036eaeb02a235d82b909c4c3f")
+        self.assertEqual(
+            hasher.sha_sequences.hex(),
+            "18959c7221ab5ce9e26c3cd67b22c24f8baa54bac281d8e6b05e400e6c3a957e")
+        expected = [
+            (0, 0x03, "2514a6272f85cfa0f45eb907fcb0d121b808ed37c6ea160a5a9046ed5526d555"),
+            (1, 0x83, "325a644af47e8a5a2591cda0ab0723978537318f10e6a63d4eed783b96a71a4d"),
+            (3, 0x01, "bf013ea93474aa67815b1b6cc441d23b64fa310911d991e713cd34c7f5d46669"),
+            (4, 0x00, "4f900a0bae3f1446fd48490c2958b5a023228f01661cda3496a11da502a7f7ef"),
+            (6, 0x02, "15f25c298eb5cdc7eb1d638dd2d45c97c4c59dcaec6679cfc16ad84f30876b85"),
+            (7, 0x82, "cd292de50313804dabe4685e83f923d2969577191a3e1d2882220dca88cbeb10"),
+            (8, 0x81, "cccb739eca6c13a8a89e6e5cd317ffe55669bbda23f2fd37b0f18755e008edd2"),
+        ]
+        for input_index, hash_type, sighash in expected:
+            self.assertEqual(
+                hasher.taproot(input_index, hash_type).hex(), sighash)
+        with self.assertRaises(ValueError):
+            hasher.taproot(0, 0x04)
+        with self.assertRaises(ValueError):
+            SignatureHasher(tx).taproot(0)
+
+    def test_legacy(self):
+        tx = tx_module.Transaction("0100000002fe3dc9208094f3ffd12645477b3dc56f60ec4fa8e6f5d67c565d1c6b9216b36e0000000000ffffffff0815cf020f013ed6cf91d29f4202e8a58726b1ac6c79da47c23d1bee0a6925f80000000000ffffffff0100f2052a010000001976a914a30741f8145e5acadf23f751864167f32e0963f788ac00000000")
+        reference = CTransaction.deserialize(tx.to_bytes())
+        hasher = SignatureHasher(tx)
+        script_code = bytes.fromhex("21026dccc749adc2a9d0d89497ac511f760f45c47dc5ed9cf352a58ac706453880aeadab210255a9626aebf5e29c0e6538428ba0d1dcf6ca98ffdf086aa8ced5e0d0215ea465ac")
+        for input_index in range(2):
+            for hash_type in (0x01, 0x02, 0x03, 0x81, 0x82, 0x83):
+                reference_hash, _ = RawSignatureHash(
+                    CScript(script_code), reference, input_index, hash_type)
+                self.assertEqual(
+                    hasher.legacy(input_index, script_code, hash_type),
+                    reference_hash)
+        # SIGHASH_SINGLE without a matching output signs the constant one
+        self.assertEqual(hasher.legacy(1, script_code, SIGHASH_SINGLE),
+                         (1).to_bytes(32, byteorder='little'))
+
+
+class TestTxStream(unittest.TestCase):
+    def test_blockchain_com_records(self):
+        for name in ("legacy.json", "segwit.json"):
+            with open(os.path.join(TX_JSON, name), "r") as file:
+                record = json.load(file)
+            raw = record_to_bytes(record)
+            tx = tx_module.Transaction(raw)
+            self.assertEqual(tx.txid, record["txid"])
+            self.assertEqual(tx.to_bytes(), bytes(raw))
+
+    def test_esplora_record(self):
+        record = {
+            "txid": "bc6a353070bc98e501c8ebc32397a4b088b04bf4f54d749a934b3e4f75e978d8",
+            "version": 2,
+            "locktime": 0,
+            "vin": [{
+                "txid": "3e283db64639bbf6a77a1f0b763472da7321ddced92d168d51535d6315d43c4e",
+                "vout": 1,
+                "scriptsig": "",
+                "witness": [
+                    "3045022100cba3efd18e7190b2927a94d51108a132c258d949b1ac0e55c7b6a87dee93e82e02200984996b234a39de2bd7e1f5b3f76d31688c38bf0304a95fc717d88a51a0449801",
+                    "02c482d6683ed1ca34571770bb71aafe633b970bc077c14b64d1822a6effb48789",
+                ],
+                "sequence": 4294967293,
+            }],
+            "vout": [
+                {"scriptpubkey": "00146e470afa1366f07125b1638e99586327e3c17af9",
+                 "value": 28724},
+                {"scriptpubkey": "0014c6af146c1b3cfe443c09cd7c06fb12a59ad90510",
+                 "value": 3541402},
+            ],
+        }
+        self.assertEqual(record_to_bytes(record).hex(), SEGWIT_TX_HEX)
+        # without witness items the transaction has no marker and flag
+        del record["vin"][0]["witness"]
+        tx = tx_module.Transaction(record_to_bytes(record))
+        self.assertIsNone(tx.witness)
+        self.assertEqual(tx.txid, record["txid"])
+
+    def test_json_records(self):
+        with open(os.path.join(TX_JSON, "legacy.json"), "r") as file:
+            indented = file.read()
+        compact = json.dumps(json.loads(indented))
+        lines = io.StringIO(compact + "\n" + indented + "\n" + compact + "\n")
+        records = list(iter_json_records(lines))
+        self.assertEqual(len(records), 3)
+        self.assertTrue(all(record == records[0] for record in records))
+        with self.assertRaises(ValueError):
+            list(iter_json_records(io.StringIO(indented[:-10])))
+
+    def test_indented_chunks(self):
+        # records nested in an indented dump: no line starts with a bracket
+        with open(os.path.join(TX_JSON, "legacy.json"), "r") as file:
+            record = json.load(file)
+        record["note"] = "} {"
+        text = "".join("  " + line + "\n" for _ in range(5) for line in
+                       json.dumps(record, indent=2).split("\n"))
+        lines = text.splitlines(keepends=True)
+        chunks = list(_iter_line_chunks(iter(lines), 10))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(sum(chunks, []), lines)
+        for chunk in chunks:
+            self.assertEqual(_decode_chunk(chunk), [record_to_bytes(record)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dump.json")
+            with open(path, "w") as file:
+                file.write(text)
+            txids = [tx.txid for tx in iter_transactions(
+                path, workers=2, chunk_lines=10)]
+        self.assertEqual(txids, [record["txid"]] * 5)
+
+BIP340_PUBKEY = "DFF1D77F2A671C5F36183726DB2341BE58FEAE1DA2DECED843240F7B502BA659"
+BIP340_MSG = "243F6A8885A308D313198A2E03707344A4093822299F31D0082EFA98EC4E6C89"
+# (pubkey, message, signature, valid) of the BIP340 test vectors
+BIP340_VECTORS = [
+    ("F9308A019258C31049344F85F89D5229B531C845836F99B08601F113BCE036F9", "00" * 32,
+     "E907831F80848D1069A5371B402410364BDF1C5F8307B0084C55F1CE2DCA821525F66A4A85EA8B71E482A74F382D2CE5EBEEE8FDB2172F477DF4900D310536C0", True),
+    (BIP340_PUBKEY, BIP340_MSG,
+     "6896BD60EEAE296DB48A229FF71DFE071BDE413E6D43F917DC8DCF8C78DE33418906D11AC976ABCCB20B091292BFF4EA897EFCB639EA871CFA95F6DE339E4B0A", True),
+    ("DD308AFEC5777E13121FA72B9CC1B7CC0139715309B086C960E18FD969774EB8", "7E2D58D8B3BCDF1ABADEC7829054F90DDA9805AAB56C77333024B9D0A508B75C",
+     "5831AAEED7B44BB74E5EAB94BA9D4294C49BCF2A60728D8B4C200F50DD313C1BAB745879A5AD954A72C45A91C3A51D3C7ADEA98D82F8481E0E1E03674A6F3FB7", True),
+    ("25D1DFF95105F5253C4022F628A996AD3A0D95FBF21D468A1B33F8C160D8F517", "FF" * 32,
+     "7EB0509757E246F19449885651611CB965ECC1A187DD51B64FDA1EDC9637D5EC97582B9CB13DB3933705B32BA982AF5AF25FD78881EBB32771FC5922EFC66EA3", True),
+    ("D69C3509BB99E412E68B0FE8544E72837DFA30746D8BE2AA65975F29D22DC7B9", "4DF3C3F68FCC83B27E9D42C90431A72499F17875C81A599B566C9889B9696703",
+     "00000000000000000000003B78CE563F89A0ED9414F5AA28AD0D96D6795F9C6376AFB1548AF603B3EB45C9F8207DEE1060CB71C04E80F593060B07D28308D7F4", True),
+    # public key not on the curve
+    ("EEFDEA4CDB677750A420FEE807EACF21EB9898AE79B9768766E4FAA04A2D4A34", BIP340_MSG,
+     "6CFF5C3BA86C69EA4B7376F31A9BCB4F74C1976089B2D9963DA2E5543E17776969E89B4C5564D00349106B8497785DD7D1D713A8AE82B32FA79D5F7FC407D39B", False),
+    # has_even_y(R) is false
+    (BIP340_PUBKEY, BIP340_MSG,
+     "FFF97BD5755EEEA420453A14355235D382F6472F8568A18B2F057A14602975563CC27944640AC607CD107AE10923D9EF7A73C643E166BE5EBEAFA34B1AC553E2", False),
+    # negated message
+    (BIP340_PUBKEY, BIP340_MSG,
+     "1FA62E331EDBC21C394792D2AB1100A7B432B013DF3F6FF4F99FCB33E0E1515F28890B3EDB6E7189B630448B515CE4F8622A954CFE545735AAEA5134FCCDB2BD", False),
+    # negated s
+    (BIP340_PUBKEY, BIP340_MSG,
+     "6CFF5C3BA86C69EA4B7376F31A9BCB4F74C1976089B2D9963DA2E5543E177769961764B3AA9B2FFCB6EF947B6887A226E8D7C93E00C5ED0C1834FF0D0C2E6DA6", False),
+    # R at infinity
+    (BIP340_PUBKEY, BIP340_MSG,
+     "0000000000000000000000000000000000000000000000000000000000000000123DDA8328AF9C23A94C1FEECFD123BA4FB73476F0D594DCB65C6425BD186051", False),
+    (BIP340_PUBKEY, BIP340_MSG,
+     "00000000000000000000000000000000000000000000000000000000000000017615FBAF5AE28864013C099742DEADB4DBA87F11AC6754F93780D5A1837CF197", False),
+    # r is not an x coordinate on the curve
+    (BIP340_PUBKEY, BIP340_MSG,
+     "4A298DACAE57395A15D0795DDBFD1DCB564DA82B0F269BC70A74F8220429BA1D69E89B4C5564D00349106B8497785DD7D1D713A8AE82B32FA79D5F7FC407D39B", False),
+    # r equal to the field size
+    (BIP340_PUBKEY, BIP340_MSG,
+     "FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F69E89B4C5564D00349106B8497785DD7D1D713A8AE82B32FA79D5F7FC407D39B", False),
+    # s equal to the curve order
+    (BIP340_PUBKEY, BIP340_MSG,
+     "6CFF5C3BA86C69EA4B7376F31A9BCB4F74C1976089B2D9963DA2E5543E177769FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141", False),
+    # public key exceeds the field size
+    ("FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC30", BIP340_MSG,
+     "6CFF5C3BA86C69EA4B7376F31A9BCB4F74C1976089B2D9963DA2E5543E17776969E89B4C5564D00349106B8497785DD7D1D713A8AE82B32FA79D5F7FC407D39B", False),
+]
+
+# (spending transaction, scriptSig, amount, spent scriptPubKey) of input 0
+P2PK_SPEND = (
+    "01000000019d7a3553c3faec3d88d18b36ec3bfcdf00c7639ea161205a02e7fc9a1a25b61d0100000049483045022100c219a522e65ca8500ebe05a70d5a49d840ccc15f2afa4ee9df783f06b2a322310220489a46c37feb33f52c586da25c70113b8eea41216440eb84771cb67a67fdb68c01ffffffff0200f2052a010000001976a914e32acf8e6718a32029dc395cca1e0ac45c33f14188ac00c817a8040000004341049464205950188c29d377eebca6535e0f3699ce4069ecd77ffebfbd0bcf95e3c134cb7d2742d800a12df41413a09ef87a80516353a2f0a280547bb5512dc03da8ac00000000",
+    "483045022100c219a522e65ca8500ebe05a70d5a49d840ccc15f2afa4ee9df783f06b2a322310220489a46c37feb33f52c586da25c70113b8eea41216440eb84771cb67a67fdb68c01",
+    25000000000,
+    "41049464205950188c29d377eebca6535e0f3699ce4069ecd77ffebfbd0bcf95e3c134cb7d2742d800a12df41413a09ef87a80516353a2f0a280547bb5512dc03da8ac")
+P2MS_SPEND = (
+    "010000000110a5fee9786a9d2d72c25525e52dd70cbd9035d5152fac83b62d3aa7e2301d58000000009300483045022100af204ef91b8dba5884df50f87219ccef22014c21dd05aa44470d4ed800b7f6e40220428fe058684db1bb2bfb6061bff67048592c574effc217f0d150daedcf36787601483045022100e8547aa2c2a2761a5a28806d3ae0d1bbf0aeff782f9081dfea67b86cacb321340220771a166929469c34959daf726a2ac0c253f9aff391e58a3c7cb46d8b7e0fdc4801ffffffff0180a21900000000001976a914971802edf585cdbc4e57017d6e5142515c1e502888ac00000000",
+    "00483045022100af204ef91b8dba5884df50f87219ccef22014c21dd05aa44470d4ed800b7f6e40220428fe058684db1bb2bfb6061bff67048592c574effc217f0d150daedcf36787601483045022100e8547aa2c2a2761a5a28806d3ae0d1bbf0aeff782f9081dfea67b86cacb321340220771a166929469c34959daf726a2ac0c253f9aff391e58a3c7cb46d8b7e0fdc4801",
+    1690000,
+    "524104d81fd577272bbe73308c93009eec5dc9fc319fc1ee2e7066e17220a5d47a18314578be2faea34b9f1f8ca078f8621acd4bc22897b03daa422b9bf56646b342a24104ec3afff0b2b66e8152e9018fe3be3fc92b30bf886b3487a525997d00fd9da2d012dce5d5275854adc3106572a5d1e12d4211b228429f5a7b2f7ba92eb0475bb14104b49b496684b02855bc32f5daefa2e2e406db4418f3b86bca5195600951c7d918cdbe5e6d3736ec2abf2dd7610995c3086976b2c0c7b4e459d10b34a316d5a5e753ae")
+P2SH_P2WSH_SPEND = (
+    "01000000000101ce0840aa3e0ace82c6fe2b7c3b4893ad6e8cc2c28f5d89447cfdab0f980770c50000000023220020973cfd44e60501c38320ab1105fb3ee3916d2952702e3c8cb4cbb7056aa6b47fffffffff01d1fb0000000000001976a914142b5b5e77897361be0a40032db2fbb6b28973f488ac0400473044022047ebba593cba4048da04316b9fb6c076d95d17175d7560edc93868a7d170767502203d0ce939ae462ca685a15f5fd3a64b7a1793cb10473665d5bedd3322c55a2b1001473044022022a8a0ae1f80934abb38d4f8c3febf6f5c5c43e7e70460aa71f9a895aaea4d950220023b8f4d2fd90abdbe6f80c9bcb2b38c7326e5e9e0f3b1ea25a5499d240cacb20169522103591da02bf7c80dc5d0edee4bbbfad7e58320785e3e54d4dab117152361f7002c21027ea2bc65ce49dcd748e4e41a0c8881be388b9182ad5e47579a0de0119803827b2103c5fdaf887f76119a73a7f738d5d4a451ff07bbbc83422c529452d8a36ae59e3953ae00000000",
+    "220020973cfd44e60501c38320ab1105fb3ee3916d2952702e3c8cb4cbb7056aa6b47f",
+    74465,
+    "a914257014cec2f75c19367b2a6a0e08b9f304108e3b87")
+P2WPKH_SPEND = (
+    "020000000001016972546966be990440a0665b73d0f4c3c942592d1f64d1033717aaa3e2c2ec913300000000ffffffff024087100000000000160014841b80d2cc75f5345c482af96294d04fdd66b2b760e31600000000001600142e8734f8e263e516d47fcaa2dfe1bd01e0dc935802473044022042e5e3ed2a41214ae864634b6fde33ca2ff312f3d89d6aa3e14c026d50d8ed3202206c38dcd0432a0724490356fbf599cdae40e334c3667a9253f8f4cc57cf3c4480012103f465315805ed271eb972e43d84d2a9e19494d10151d9f6adb32b8534bfd764ab00000000",
+    "",
+    2595489,
+    "0014841b80d2cc75f5345c482af96294d04fdd66b2b7")
+# the witness script checks a hash preimage and no signature
+P2WSH_SPEND = (
+    "020000000001018a39b5cdd48c7d45a31a89cd675a95f5de78aebeeda1e55ac35d7110c3bacfc60000000000ffffffff01204e0000000000001976a914ee63c8c790952de677d1f8019c9474d84098d6e188ac0202123423aa20a23421f2ba909c885a3077bb6f8eb4312487797693bbcfe7e311f797e3c5b8fa8700000000",
+    "",
+    30000,
+    "0020ee4fd29ce2f9ca8411778f8e94687d5e75ec3e86cc530ca9ad1787e5208cc996")
+P2TR_SPEND = (
+    "02000000000101ec9016580d98a93909faf9d2f431e74f781b438d81372bb6aab4db67725c11a70000000000ffffffff0110270000000000001600144e44ca792ce545acba99d41304460dd1f53be3840141b693a0797b24bae12ed0516a2f5ba765618dca89b75e498ba5b745b71644362298a45ca39230d10a02ee6290a91cebf9839600f7e35158a447ea182ea0e022ae0100000000",
+    "",
+    20000,
+    "51200f0c8db753acbd17343a39c2f3f4e35e4be6da749f9e35137ab220e7b238a667")
+P2TR_SCRIPT_SPEND = (
+    "020000000001013cfe8b95d22502698fd98837f83d8d4be31ee3eddd9d1ab1a95654c64604c4d10000000000ffffffff01983a0000000000001600140de745dc58d8e62e6f47bde30cd5804a82016f9e034101769105cbcbdcaaee5e58cd201ba3152477fda31410df8b91b4aee2c4864c7700615efb425e002f146a39ca0a4f2924566762d9213bd33f825fad83977fba7f0122206d4ddc0e47d2e8f82cbe2fc2d0d749e7bd3338112cecdc76d8f831ae6620dbe0ac21c0924c163b385af7093440184af6fd6244936d1288cbb41cc3812286d3f83a332900000000",
+    "",
+    20000,
+    "5120f3778defe5173a9bf7169575116224f961c03c725c0e98b8da8f15df29194b80")
+
+
+def _der(r: int, s: int) -> bytes:
+    def integer(value: int) -> bytes:
+        data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+        if data[0] & 0x80:
+            data = b"\x00" + data
+        return bytes([0x02, len(data)]) + data
+
+    body = integer(r) + integer(s)
+    return bytes([0x30, len(body)]) + body
+
+
+class TestSecp256k1(unittest.TestCase):
+    def test_bip340_vectors(self):
+        for i, (pubkey, msg, sig, valid) in enumerate(BIP340_VECTORS):
+            with self.subTest(vector=i):
+                self.assertEqual(
+                    schnorr_verify(bytes.fromhex(pubkey), bytes.fromhex(sig),
+                                   bytes.fromhex(msg)), valid)
+
+    def test_schnorr_lengths(self):
+        pubkey, msg, sig, _ = BIP340_VECTORS[1]
+        self.assertFalse(schnorr_verify(bytes.fromhex(pubkey)[1:],
+                                        bytes.fromhex(sig), bytes.fromhex(msg)))
+        self.assertFalse(schnorr_verify(bytes.fromhex(pubkey),
+                                        bytes.fromhex(sig) + b"\x01",
+                                        bytes.fromhex(msg)))
+
+    def _p2pk_signature(self):
+        tx_hex, script_sig, _, script_pub_key = P2PK_SPEND
+        sig = bytes.fromhex(script_sig)[1:]
+        pubkey = bytes.fromhex(script_pub_key)[1:-1]
+        digest = SignatureHasher(Transaction(tx_hex)).legacy(
+            0, bytes.fromhex(script_pub_key), sig[-1])
+        return sig, pubkey, digest
+
+    def test_ecdsa_low_and_high_s(self):
+        sig, pubkey, digest = self._p2pk_signature()
+        r, s = parse_der_signature(sig[:-1])
+        self.assertEqual(_der(r, s) + sig[-1:], sig)
+        self.assertTrue(ecdsa_verify(pubkey, r, s, digest))
+        # consensus accepts the high-S twin, the circuit normalizes it
+        self.assertTrue(ecdsa_verify(pubkey, r, N - s, digest))
+        self.assertTrue(is_valid_der_signature(_der(r, N - s) + sig[-1:]))
+        self.assertFalse(ecdsa_verify(pubkey, r, s, digest[::-1]))
+        self.assertFalse(ecdsa_verify(pubkey, r, 0, digest))
+        self.assertFalse(ecdsa_verify(pubkey, N, s, digest))
+
+    def test_der_encoding(self):
+        sig, _, _ = self._p2pk_signature()
+        der, hash_type = sig[:-1], sig[-1:]
+        r, s = parse_der_signature(der)
+        self.assertTrue(is_valid_der_signature(sig))
+        # r is 33 bytes, its first byte is the sign padding
+        self.assertEqual(der[3:5], b"\x21\x00")
+        invalid = {
+            "no hash type": der,
+            "trailing byte": der + b"\x00" + hash_type,
+            "wrong sequence tag": b"\x31" + sig[1:],
+            "wrong total length": sig[:1] + bytes([sig[1] + 1]) + sig[2:],
+            "wrong integer tag": sig[:2] + b"\x03" + sig[3:],
+            "r over-padded": b"\x30" + bytes([der[1] + 1]) + b"\x02"
+            + bytes([der[3] + 1]) + b"\x00" + der[4:] + hash_type,
+            "r negative": b"\x30" + bytes([der[1] - 1]) + b"\x02"
+            + bytes([der[3] - 1]) + der[5:] + hash_type,
+            "empty s": b"\x30" + bytes([der[3] + 4]) + der[2:4 + der[3]]
+            + b"\x02\x00" + hash_type,
+        }
+        for name, data in invalid.items():
+            with self.subTest(case=name):
+                self.assertFalse(is_valid_der_signature(data))
+
+
+class TestPreflight(unittest.TestCase):
+    SPENDS = {
+        "p2pk": P2PK_SPEND,
+        "p2ms": P2MS_SPEND,
+        "p2sh_p2wsh": P2SH_P2WSH_SPEND,
+        "p2wpkh": P2WPKH_SPEND,
+        "p2wsh": P2WSH_SPEND,
+        "p2tr": P2TR_SPEND,
+        "p2tr_script": P2TR_SCRIPT_SPEND,
+    }
+
+    @staticmethod
+    def _verify(tx_hex: str, script_sig: str, amount: int,
+                script_pub_key: str):
+        verify_input(Transaction(tx_hex), 0, bytes.fromhex(script_sig),
+                     amount, bytes.fromhex(script_pub_key),
+                     [(amount, bytes.fromhex(script_pub_key))])
+
+    @staticmethod
+    def _p2pkh_spend():
+        tx = Transaction(LEGACY_TX_HEX)
+        script_sig = bytes(tx.inputs[0].script_sig)
+        pubkey = script_sig[-33:]
+        script_pub_key = b"\x76\xa9\x14" + Hash160(pubkey) + b"\x88\xac"
+        return LEGACY_TX_HEX, script_sig.hex(), 0, script_pub_key.hex()
+
+    def test_valid_spends(self):
+        spends = dict(self.SPENDS, p2pkh=self._p2pkh_spend())
+        for name, spend in spends.items():
+            with self.subTest(spend=name):
+                self._verify(*spend)
+
+    def test_tampered_lock_time(self):
+        # every signature commits to the lock time
+        spends = dict(self.SPENDS, p2pkh=self._p2pkh_spend())
+        del spends["p2wsh"]
+        for name, (tx_hex, script_sig, amount, spk) in spends.items():
+            with self.subTest(spend=name):
+                tampered = tx_hex[:-2] + "01"
+                with self.assertRaises(PreflightError):
+                    self._verify(tampered, script_sig, amount, spk)
+
+    def test_tampered_amount(self):
+        # segwit signatures commit to the spent amount
+        for name in ("p2sh_p2wsh", "p2wpkh", "p2tr", "p2tr_script"):
+            tx_hex, script_sig, amount, spk = self.SPENDS[name]
+            with self.subTest(spend=name):
+                with self.assertRaises(PreflightError):
+                    self._verify(tx_hex, script_sig, amount + 1, spk)
+
+    def test_tampered_witness(self):
+        tx_hex, script_sig, amount, spk = P2WSH_SPEND
+        tampered = tx_hex.replace("0202123423aa", "0202123523aa")
+        with self.assertRaises(PreflightError) as cm:
+            self._verify(tampered, script_sig, amount, spk)
+        self.assertEqual(cm.exception.input_index, 0)
+
+    def test_wrong_script_pub_key(self):
+        for name, (tx_hex, script_sig, amount, spk) in self.SPENDS.items():
+            with self.subTest(spend=name):
+                wrong = spk[:-2] + ("00" if spk[-2:] != "00" else "01")
+                with self.assertRaises(PreflightError):
+                    self._verify(tx_hex, script_sig, amount, wrong)
+
+
+class SizeRecorder(ScriptObserver):
+    """
+    The sizes reported to the observer, in the form of Script.sizes
+    """
+
+    def __init__(self):
+        self.sizes = set()
+        self.signatures = []
+
+    def on_hash(self, opcode, size):
+        self.sizes.add((opcode, size, 0, 0))
+
+    def on_checksig(self, opcode, sig_size, pubkey_size):
+        self.sizes.add((opcode, 0, 0, 0))
+        self.signatures.append((sig_size, pubkey_size))
+
+    def on_checkmultisig(self, opcode, keys_count, sigs_count):
+        self.sizes.add((opcode, 0, keys_count, sigs_count))
+
+
+def baseline_sizes(script, stack, tx_hex):
+    """
+    Sizes as the bitcoinlib based analysis found them: the stack top
+    before every hash opcode, evaluating the script in parts split by the
+    hash opcodes, and the signature opcodes by a scan of the script
+    """
+    hashes = (0xa6, 0xa7, 0xa8, 0xa9, 0xaa)
+    tx = CTransaction.deserialize(bytes.fromhex(tx_hex))
+    elements = list(CScript(script))
+    parts = [[]]
+    for element in elements:
+        if element in hashes and parts[-1]:
+            parts.append([])
+        parts[-1].append(element)
+
+    stack = list(stack)
+    sizes = set()
+    for part in parts:
+        if part[0] in hashes:
+            sizes.add((part[0], len(stack[-1]), 0, 0))
+        _EvalScript(stack, CScript(part), tx, 0, ())
+    for i, element in enumerate(elements):
+        if element in (0xac, 0xad):
+            sizes.add((element, 0, 0, 0))
+        elif element in (0xae, 0xaf):
+            keys_count = elements[i - 1]
+            sizes.add((element, 0, keys_count, elements[i - 2 - keys_count]))
+    return sizes
+
+
+class TestInterpreter(unittest.TestCase):
+    @staticmethod
+    def _witness(tx_hex):
+        return [bytes(item.item)
+                for item in Transaction(tx_hex).witness[0].stack_items]
+
+    def _check(self, script, stack, tx_hex, sigversion=None,
+               max_ops=MAX_SCRIPT_OPCODES):
+        observer = SizeRecorder()
+        ScriptInterpreter(observer, max_ops=max_ops,
+                          sigversion=sigversion).run(script, list(stack))
+        self.assertEqual(observer.sizes, baseline_sizes(script, stack, tx_hex))
+        return observer
+
+    def test_p2pkh(self):
+        tx_hex, script_sig, _, spk = TestPreflight._p2pkh_spend()
+        stack = [bytes(item) for item in
+                 ScriptInterpreter().run(bytes.fromhex(script_sig))]
+        observer = self._check(bytes.fromhex(spk), stack, tx_hex)
+        self.assertEqual(observer.sizes, {(0xa9, 33, 0, 0), (0xac, 0, 0, 0)})
+        self.assertEqual(observer.signatures, [(72, 33)])
+
+    def test_p2sh_multisig(self):
+        tx_hex = P2SH_P2WSH_SPEND[0]
+        *sigs, redeem_script = self._witness(tx_hex)
+        spk = b"\xa9\x14" + Hash160(redeem_script) + b"\x87"
+        observer = self._check(spk, [redeem_script], tx_hex)
+        self.assertEqual(observer.sizes, {(0xa9, 105, 0, 0)})
+        observer = self._check(redeem_script, sigs, tx_hex)
+        self.assertEqual(observer.sizes, {(0xae, 0, 3, 2)})
+
+    def test_p2wsh(self):
+        tx_hex = P2WSH_SPEND[0]
+        preimage, witness_script = self._witness(tx_hex)
+        observer = self._check(witness_script, [preimage], tx_hex,
+                               SIGVERSION_WITNESS_V0)
+        self.assertEqual(observer.sizes, {(0xaa, 2, 0, 0)})
+
+    def test_tapscript(self):
+        tx_hex = P2TR_SCRIPT_SPEND[0]
+        signature, tapscript, _ = self._witness(tx_hex)
+        observer = self._check(tapscript, [signature], tx_hex,
+                               SIGVERSION_TAPSCRIPT, None)
+        self.assertEqual(observer.sizes, {(0xac, 0, 0, 0)})
+        self.assertEqual(observer.signatures, [(65, 32)])
+
+
+HTLC_PREIMAGE = b"\x11" * 32
+# OP_IF OP_SIZE 32 OP_EQUALVERIFY OP_SHA256 <hash> OP_EQUALVERIFY <key>
+# OP_ELSE <lock time> OP_CHECKLOCKTIMEVERIFY OP_DROP <key> OP_ENDIF
+# OP_CHECKSIG
+HTLC_SCRIPT = (
+    bytes([0x63, 0x82, 0x01, 0x20, 0x88, 0xa8, 0x20])
+    + hashlib.sha256(HTLC_PREIMAGE).digest()
+    + bytes([0x88, 0x21]) + b"\x02" * 33
+    + bytes([0x67, 0x03]) + bytes.fromhex("001040")
+    + bytes([0xb1, 0x75, 0x21]) + b"\x03" * 33
+    + bytes([0x68, 0xac]))
+HTLC_PUSHES = {(0x01, 0, 0, 0), (0x03, 0, 0, 0), (0x20, 0, 0, 0),
+               (0x21, 0, 0, 0)}
+
+
+class TestScriptAnalysis(unittest.TestCase):
+    def test_htlc_hash_branch(self):
+        script = Script(HTLC_SCRIPT, None, 0,
+                        [b"\x30" * 71, HTLC_PREIMAGE, b"\x01"], cache=None)
+        self.assertEqual(script.opcodes, 15)
+        # OP_IF to OP_ELSE and OP_CHECKSIG
+        self.assertEqual(script.executed_opcodes, 10)
+        # OP_SIZE on top of the preimage
+        self.assertEqual(script.stack_peak, 1)
+        self.assertEqual(script.alt_stack_peak, 0)
+        self.assertEqual(script.sizes, HTLC_PUSHES | {
+            (0xa8, 32, 0, 0), (0xac, 0, 0, 0)})
+
+    def test_htlc_timeout_branch(self):
+        script = Script(HTLC_SCRIPT, None, 0, [b"\x30" * 71, b""],
+                        cache=None)
+        self.assertEqual(script.opcodes, 15)
+        # OP_IF, OP_ELSE to OP_ENDIF and OP_CHECKSIG
+        self.assertEqual(script.executed_opcodes, 7)
+        self.assertEqual(script.stack_peak, 0)
+        self.assertEqual(script.alt_stack_peak, 0)
+        # the skipped OP_SHA256 is not reported
+        self.assertEqual(script.sizes, HTLC_PUSHES | {(0xac, 0, 0, 0)})
+
+    def test_cache_lru(self):
+        cache = ScriptAnalysisCache(maxsize=2)
+        first = Script("5176", None, 0, cache=cache)
+        Script("5276", None, 0, cache=cache)
+        self.assertEqual(cache.cache_info(), (0, 2, 2, 2))
+
+        # a hit makes the first script the most recently used one
+        again = Script("5176", None, 0, cache=cache)
+        self.assertEqual(again.to_analysis(), first.to_analysis())
+        self.assertEqual(cache.cache_info(), (1, 2, 2, 2))
+
+        # evicts 5276, the least recently used one
+        Script("5376", None, 0, cache=cache)
+        self.assertEqual(cache.cache_info(), (1, 3, 2, 2))
+        Script("5176", None, 0, cache=cache)
+        self.assertEqual(cache.cache_info(), (2, 3, 2, 2))
+        Script("5276", None, 0, cache=cache)
+        self.assertEqual(cache.cache_info(), (2, 4, 2, 2))
+
+        # the stack is part of the key
+        Script("5276", None, 0, [b"\x01"], cache=cache)
+        self.assertEqual(cache.cache_info(), (2, 5, 2, 2))
+        cache.clear()
+        self.assertEqual(cache.cache_info(), (0, 0, 2, 0))
+
+    def test_templates_match_interpreter(self):
+        p2pkh = TestPreflight._p2pkh_spend()
+        spends = {
+            "p2pk": P2PK_SPEND[1] + P2PK_SPEND[3],
+            "p2pkh": p2pkh[1] + p2pkh[3],
+            "multisig": P2MS_SPEND[1] + P2MS_SPEND[3],
+            "p2sh_witness": P2SH_P2WSH_SPEND[1] + P2SH_P2WSH_SPEND[3],
+        }
+        for name, script_hex in spends.items():
+            with self.subTest(template=name):
+                fast = Script(script_hex, None, 0, cache=None).to_analysis()
+                with mock.patch("generators.utils.script.match_template",
+                                return_value=None):
+                    full = Script(script_hex, None, 0,
+                                  cache=None).to_analysis()
+                self.assertEqual(fast.template, name)
+                self.assertIsNone(full.template)
+                self.assertEqual(fast._replace(template=None), full)
+
+class TestSources(unittest.TestCase):
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "generated.nr")
+            self.assertTrue(write_if_changed(path, "fn main() {}\n"))
+            os.utime(path, (1000000000, 1000000000))
+
+            self.assertFalse(write_if_changed(path, "fn main() {}\n"))
+            self.assertEqual(os.stat(path).st_mtime, 1000000000)
+
+            self.assertTrue(write_if_changed(path, "fn main() {\n}\n"))
+            self.assertNotEqual(os.stat(path).st_mtime, 1000000000)
+            with open(path, "r") as file:
+                self.assertEqual(file.read(), "fn main() {\n}\n")
+            # the temporary file was swapped in
+            self.assertEqual(os.listdir(directory), ["generated.nr"])
+
+    def test_tidy_noir(self):
+        text = "\n".join([
+            "// Generated",
+            "",
+            "",
+            "pub(crate) fn hash160<let N: u32>(",
+            "    mut stack: Stack<N>,   ",
+            "    len: u32,",
+            "    ) -> Stack<N> {",
+            "",
+            "    if len == 20 {",
+            "        stack",
+            "            .op_checksig::<N>(",
+            "                verify,",
+            "            );",
+            "",
+            "    }",
+            "    stack",
+            "}",
+            "",
+            "",
+        ])
+        self.assertEqual(tidy_noir(text), "\n".join([
+            "// Generated",
+            "",
+            "pub(crate) fn hash160<let N: u32>(",
+            "    mut stack: Stack<N>,",
+            "    len: u32,",
+            ") -> Stack<N> {",
+            "    if len == 20 {",
+            "        stack",
+            "            .op_checksig::<N>(",
+            "                verify,",
+            "            );",
+            "    }",
+            "    stack",
+            "}",
+            "",
+        ]))
+
+
+class TestStraightLine(unittest.TestCase):
+    def test_rejects_flow_control(self):
+        # OP_IF OP_1 OP_ELSE OP_2 OP_ENDIF
+        script = Script("6351675268", None, 0, [b"\x01"], cache=None)
+        self.assertIsNone(specialize(script))
+
+    def test_rejects_codeseparator(self):
+        # OP_1 OP_CODESEPARATOR OP_DUP
+        script = Script("51ab76", None, 0, cache=None)
+        self.assertIsNone(specialize(script))
+
+    def test_same_size_conflict(self):
+        # OP_1 OP_DUP and OP_2 OP_DUP share a size, OP_1 OP_DUP OP_1 does not
+        scripts = [Script(script_hex, None, 0, cache=None)
+                   for script_hex in ("5176", "5276", "517651")]
+        self.assertEqual(list(straight_line_programs(scripts)), [3])
+
+    def test_render_p2pkh(self):
+        _, script_sig, _, spk = TestPreflight._p2pkh_spend()
+        stack = [bytes(item) for item in
+                 ScriptInterpreter().run(bytes.fromhex(script_sig))]
+        programs = straight_line_programs(
+            [Script(spk, None, 0, stack, cache=None)])
+        rendered = render(programs)
+        self.assertEqual(rendered["straightLineCovers"], "(SCRIPT_SIZE == 25)")
+        self.assertEqual(rendered["straightLine"], "\n".join([
+            "    if SCRIPT_SIZE == 25 {",
+            "        assert(script[0 % SCRIPT_SIZE] == 118);",
+            "        stack.op_dup();",
+            "        assert(script[1 % SCRIPT_SIZE] == 169);",
+            "        assert(stack.get_last_stack_element_length() == 33);",
+            "        stack.op_hash160::<33>();",
+            "        assert(script[2 % SCRIPT_SIZE] == 20);",
+            "        let mut value = [0; 20];",
+            "        for i in 0..20 {",
+            "            value[i] = script[(3 + i) % SCRIPT_SIZE];",
+            "        }",
+            "        stack.push_bytes(value);",
+            "        assert(script[23 % SCRIPT_SIZE] == 136);",
+            "        stack.op_equalverify();",
+            "        assert(script[24 % SCRIPT_SIZE] == 172);",
+            "        stack",
+            "            .op_checksig::<SCRIPT_CODE_LEN, N_OUTPUT_SIZE, "
+            "INPUT_TO_SIGN, INPUT_TO_SIGN_LEN, N_INPUT_SIZE>(",
+            "                address,",
+            "                false,",
+            "                false,",
+            "            );",
+            "    }",
+        ]))
+
+    def test_render_nothing(self):
+        self.assertEqual(render({}), {"straightLineCovers": "false",
+                                      "straightLine": ""})
+
+
+class TestAnalysisStore(unittest.TestCase):
+    def test_versions_and_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "analysis_cache.sqlite")
+            first = AnalysisStore(path, 1)
+            self.assertIsNone(first.get(b"key"))
+            first.put(b"key", "analysis")
+            self.assertEqual(first.get(b"key"), "analysis")
+
+            # rows of another analysis version are not returned
+            other_version = AnalysisStore(path, 2)
+            self.assertIsNone(other_version.get(b"key"))
+
+            # another process reads the row back from the file
+            second = AnalysisStore(path, 1)
+            self.assertEqual(second.get(b"key"), "analysis")
+
+            other_version.put(b"key", "newer analysis")
+            second.clear()
+            self.assertIsNone(first.get(b"key"))
+            self.assertEqual(other_version.get(b"key"), "newer analysis")
+            for store in (first, second, other_version):
+                store.close()
+
+
+class TestArtifactStore(unittest.TestCase):
+    PACKAGE = "p2pk"
+
+    def setUp(self):
+        # a workspace with one package and its compiled artifacts
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+        os.makedirs(f"app/{self.PACKAGE}/src")
+        os.makedirs(f"target/{self.PACKAGE}")
+        self._write("Nargo.toml", "[workspace]\n")
+        self._write(f"app/{self.PACKAGE}/Nargo.toml", "[package]\n")
+        self._compile("fn main() {}\n")
+        self.store = ArtifactStore("store", 1 << 20)
+
+    @staticmethod
+    def _write(path, content):
+        with open(path, "w") as file:
+            file.write(content)
+
+    def _read(self, path):
+        with open(path.format(package=self.PACKAGE), "r") as file:
+            return file.read()
+
+    def _compile(self, source):
+        self._write(f"app/{self.PACKAGE}/src/main.nr", source)
+        self._write(f"target/{self.PACKAGE}.json", "program " + source)
+        self._write(f"target/{self.PACKAGE}/vk", "vk " + source)
+        stamp(self.PACKAGE)
+
+    def _clean_target(self):
+        os.remove(f"target/{self.PACKAGE}.json")
+        os.remove(f"target/{self.PACKAGE}/vk")
+
+    def test_save_and_restore(self):
+        self.assertTrue(self.store.save(self.PACKAGE))
+        self.assertTrue(self.store.contains(artifact_key(self.PACKAGE)))
+        # stored once per sources
+        self.assertFalse(self.store.save(self.PACKAGE))
+
+        self._clean_target()
+        self.assertTrue(recompile_needed(self.PACKAGE))
+        self.assertTrue(self.store.restore(self.PACKAGE))
+        self.assertFalse(recompile_needed(self.PACKAGE))
+        self.assertEqual(self._read("target/{package}.json"),
+                         "program fn main() {}\n")
+        self.assertEqual(self._read("target/{package}/vk"),
+                         "vk fn main() {}\n")
+
+    def test_save_needs_current_artifacts(self):
+        self._write(f"app/{self.PACKAGE}/src/main.nr", "fn main() {\n}\n")
+        self.assertFalse(self.store.save(self.PACKAGE))
+        self.assertEqual(self.store.entries(), [])
+
+    def test_corrupted_entry(self):
+        self.store.save(self.PACKAGE)
+        entry = os.path.join("store", artifact_key(self.PACKAGE))
+        self._write(os.path.join(entry, "vk"), "tampered")
+        self._clean_target()
+        self.assertFalse(self.store.restore(self.PACKAGE))
+        self.assertFalse(os.path.exists(entry))
+        self.assertFalse(os.path.exists(f"target/{self.PACKAGE}/vk"))
+
+    def test_partial_manifest(self):
+        self.store.save(self.PACKAGE)
+        entry = os.path.join("store", artifact_key(self.PACKAGE))
+        self._write(os.path.join(entry, MANIFEST),
+                    json.dumps({"package": self.PACKAGE}))
+        self.assertFalse(self.store.restore(self.PACKAGE))
+        self.assertFalse(os.path.exists(entry))
+
+    def test_evict(self):
+        keys = []
+        for i, source in enumerate(("fn main() {}\n", "fn main() {\n}\n")):
+            self._compile(source)
+            self.store.save(self.PACKAGE)
+            keys.append(artifact_key(self.PACKAGE))
+            manifest = os.path.join("store", keys[-1], MANIFEST)
+            os.utime(manifest, (1000000000 + i, 1000000000 + i))
+        self.assertEqual(self.store.evict(), 0)
+
+        # room for one entry, the least recently used one goes
+        self.store.max_bytes = max(entry["size"]
+                                   for entry in self.store.entries())
+        self.assertEqual(self.store.evict(), 1)
+        self.assertEqual([entry["key"] for entry in self.store.entries()],
+                         keys[1:])
+
+
+class TestBuckets(unittest.TestCase):
+    def test_pow2(self):
+        buckets = Buckets()
+        for value, rounded in ((1, 1), (2, 2), (3, 4), (17, 32), (64, 64)):
+            with self.subTest(value=value):
+                self.assertEqual(buckets.round("stackSize", value), rounded)
+
+    def test_learned_classes(self):
+        buckets = Buckets({"stackSize": [40, 10, 20]})
+        self.assertEqual(buckets.round("stackSize", 5), 10)
+        self.assertEqual(buckets.round("stackSize", 10), 10)
+        self.assertEqual(buckets.round("stackSize", 11), 20)
+        self.assertEqual(buckets.round("stackSize", 40), 40)
+        # above the top class
+        self.assertEqual(buckets.round("stackSize", 41), 64)
+        # names without learned classes fall back to powers of two
+        self.assertEqual(buckets.round("opcodesCount", 5), 8)
+
+    def test_unbucketed_and_zero(self):
+        buckets = Buckets({"stackSize": [10]})
+        # layout sizes are asserted exactly by the circuit
+        self.assertEqual(buckets.round("currentTxSize", 41), 41)
+        # a non-segwit transaction asserts a witness stack size of 0
+        self.assertEqual(buckets.round("currentTxMaxWitnessStackSize", 0), 0)
+        self.assertEqual(buckets.round("stackSize", 0), 0)
+
+    def test_apply(self):
+        constants = {"stackSize": 9, "currentTxSize": 41,
+                     "maxStackElementSize": 33}
+        self.assertEqual(Buckets().apply(constants), {
+            "stackSize": 16, "currentTxSize": 41,
+            "maxStackElementSize": 64})
+
+    def test_apply_buckets_env(self):
+        constants = {"stackSize": 9}
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+
+        with mock.patch.dict(os.environ, {BUCKETS_ENV: "0"}):
+            self.assertEqual(apply_buckets("app/p2pkh", constants),
+                             constants)
+        self.assertFalse(os.path.exists("target/shapes.jsonl"))
+        with mock.patch.dict(os.environ, {BUCKETS_ENV: "record"}):
+            self.assertEqual(apply_buckets("app/p2pkh", constants),
+                             constants)
+        with mock.patch.dict(os.environ, {BUCKETS_ENV: "pow2"}):
+            self.assertEqual(apply_buckets("app/p2pkh", constants),
+                             {"stackSize": 16})
+        with open("target/shapes.jsonl", "r") as f:
+            shapes = [json.loads(line) for line in f]
+        # the exact constants are recorded
+        self.assertEqual([s["constants"] for s in shapes],
+                         [{"stackSize": 9}, {"stackSize": 9}])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,9 @@
-from typing import Dict, Union, Tuple
+import hashlib
+import mmap
+import struct
+from typing import Callable, Dict, Union, Tuple
 from collections import namedtuple
+from collections.abc import Sequence
 
 Input = namedtuple(
     'Input', [
@@ -10,11 +14,159 @@ Output = namedtuple(
 Witness = namedtuple('Witness', ['stack_items'])
 WitnessStackItem = namedtuple('WitnessStackItem', ['item_size', 'item'])
 
+# offset and size of a serialized element, compact size prefixes included
+Span = namedtuple('Span', ['offset', 'size'])
+# offsets of every serialized input, output, witness stack and witness item;
+# section sizes include their compact size counters
+TxLayout = namedtuple(
+    'TxLayout', [
+        'size',
+        'input_count_size', 'input_size', 'inputs',
+        'output_count_size', 'output_size', 'outputs',
+        'witness_size', 'witnesses', 'witness_items',
+        'max_witness_stack_size'])
+
+BytesLike = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def _read_compact_size(raw: memoryview, cur_pos: int) -> Tuple[int, int]:
+    """
+    raw: buffer with the serialized data
+    cur_pos: the position of the first byte of the compact size
+    return: (compact size, updated cur_pos)
+    """
+    first = raw[cur_pos]
+    if first <= 0xfc:
+        return first, cur_pos + 1
+    elif first == 0xfd:
+        return int.from_bytes(
+            raw[cur_pos + 1:cur_pos + 3], byteorder='little'), cur_pos + 3
+    elif first == 0xfe:
+        return int.from_bytes(
+            raw[cur_pos + 1:cur_pos + 5], byteorder='little'), cur_pos + 5
+    else:
+        return int.from_bytes(
+            raw[cur_pos + 1:cur_pos + 9], byteorder='little'), cur_pos + 9
+
+
+def _compact_size_size(int_val: int) -> int:
+    if int_val <= 0xfc:
+        return 1
+    elif int_val <= 0xffff:
+        return 3
+    elif int_val <= 0xffffffff:
+        return 5
+    elif int_val <= 0xffffffffffffffff:
+        return 9
+    else:
+        raise ValueError("Invalid compact size value")
+
+
+def _write_compact_size(buffer, cur_pos: int, int_val: int) -> int:
+    """
+    buffer: writable buffer with enough room for the compact size
+    return: updated cur_pos
+    """
+    if int_val <= 0xfc:
+        buffer[cur_pos] = int_val
+        return cur_pos + 1
+    elif int_val <= 0xffff:
+        buffer[cur_pos] = 0xfd
+        struct.pack_into('<H', buffer, cur_pos + 1, int_val)
+        return cur_pos + 3
+    elif int_val <= 0xffffffff:
+        buffer[cur_pos] = 0xfe
+        struct.pack_into('<I', buffer, cur_pos + 1, int_val)
+        return cur_pos + 5
+    elif int_val <= 0xffffffffffffffff:
+        buffer[cur_pos] = 0xff
+        struct.pack_into('<Q', buffer, cur_pos + 1, int_val)
+        return cur_pos + 9
+    else:
+        raise ValueError("Invalid compact size value")
+
+
+def _append_compact_size(buffer: bytearray, int_val: int):
+    cur_pos = len(buffer)
+    buffer.extend(bytes(_compact_size_size(int_val)))
+    _write_compact_size(buffer, cur_pos, int_val)
+
+
+def _read_input(raw: memoryview, span: Span) -> Input:
+    cur_pos = span.offset
+    txid = bytes(raw[cur_pos:cur_pos + 32])
+    vout = int.from_bytes(raw[cur_pos + 32:cur_pos + 36], byteorder='little')
+    script_sig_size, cur_pos = _read_compact_size(raw, cur_pos + 36)
+    script_sig = bytes(raw[cur_pos:cur_pos + script_sig_size])
+    sequence = int.from_bytes(
+        raw[span.offset + span.size - 4:span.offset + span.size],
+        byteorder='little')
+    return Input(txid, vout, script_sig_size, script_sig, sequence)
+
+
+def _read_stripped_input(raw: memoryview, span: Span) -> Input:
+    return _read_input(raw, span)._replace(script_sig_size=0, script_sig=b'')
+
+
+def _read_output(raw: memoryview, span: Span) -> Output:
+    cur_pos = span.offset
+    value = int.from_bytes(raw[cur_pos:cur_pos + 8], byteorder='little')
+    script_pub_key_size, cur_pos = _read_compact_size(raw, cur_pos + 8)
+    script_pub_key = bytes(raw[cur_pos:cur_pos + script_pub_key_size])
+    return Output(value, script_pub_key_size, script_pub_key)
+
+
+def _read_witness(raw: memoryview, items: Tuple[Span, ...]) -> Witness:
+    witness_stack = []
+    for item in items:
+        item_size, cur_pos = _read_compact_size(raw, item.offset)
+        item_data = bytes(raw[cur_pos:cur_pos + item_size])
+        witness_stack.append(WitnessStackItem(item_size, item_data))
+    return Witness(witness_stack)
+
+
+class _LazySequence(Sequence):
+    """
+    Read-only list of transaction fields that are decoded from the raw
+    buffer only when they are accessed for the first time.
+
+    It keeps the buffer and the spans instead of the transaction itself,
+    so parsed transactions do not form reference cycles.
+    """
+    __slots__ = ('_raw', '_spans', '_reader', '_cache')
+
+    def __init__(self, raw: memoryview, spans: tuple,
+                 reader: Callable[[memoryview, tuple], tuple]):
+        self._raw = raw
+        self._spans = spans
+        self._reader = reader
+        self._cache = [None] * len(spans)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self._cache)))]
+        if idx < 0:
+            idx += len(self._cache)
+        if idx < 0 or idx >= len(self._cache):
+            raise IndexError("transaction field index out of range")
+        item = self._cache[idx]
+        if item is None:
+            item = self._reader(self._raw, self._spans[idx])
+            self._cache[idx] = item
+        return item
+
 
 class Transaction:
-    def __init__(self, data: Union[str, Dict]):
+    def __init__(self, data: Union[str, Dict, BytesLike]):
+        self._txid = None
+        self._wtxid = None
         if isinstance(data, str):
             self._parse_from_hex(data)
+        elif isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._parse_from_bytes(data)
         elif isinstance(data, Dict):
             self._parse_from_json(data)
         else:
@@ -24,83 +176,105 @@ class Transaction:
         """
         hex_tx: raw hex of the transaction
         """
-        raw_bytes = bytes.fromhex(hex_tx)
+        self._parse_from_bytes(bytes.fromhex(hex_tx))
+
+    def _parse_from_bytes(self, data: BytesLike):
+        """
+        data: serialized transaction, may be followed by unrelated bytes
 
-        # this is optimization for the _get_compact_size function
-        self._cache_raw_bytes = raw_bytes
+        Only the offsets of the inputs, outputs and witness stacks are kept,
+        fields are decoded on first access. The buffer is only viewed, the
+        decoded fields are bytes copies of their own slice.
+        """
+        raw = memoryview(data).cast('B')
 
         cur_pos = 0
         self.version = int.from_bytes(
-            raw_bytes[cur_pos:cur_pos + 4], byteorder='little')
+            raw[cur_pos:cur_pos + 4], byteorder='little')
         cur_pos += 4
 
-        if raw_bytes[cur_pos] == 0:
+        if raw[cur_pos] == 0:
             self.marker = 0
             cur_pos += 1
-            self.flag = raw_bytes[cur_pos]
+            self.flag = raw[cur_pos]
             cur_pos += 1
         else:
             self.marker = None
             self.flag = None
 
-        self.input_count, cur_pos = self._get_compact_size(cur_pos)
+        input_section_start = cur_pos
+        self.input_count, cur_pos = _read_compact_size(raw, cur_pos)
+        input_count_size = cur_pos - input_section_start
 
-        self.inputs = []
+        inputs = []
         for _ in range(self.input_count):
-            txid = raw_bytes[cur_pos:cur_pos + 32]
-            cur_pos += 32
-            vout = int.from_bytes(
-                raw_bytes[cur_pos:cur_pos + 4], byteorder='little')
-            cur_pos += 4
-            script_sig_size, cur_pos = self._get_compact_size(cur_pos)
-            script_sig = raw_bytes[cur_pos:cur_pos + script_sig_size]
-            cur_pos += script_sig_size
-            sequence = int.from_bytes(
-                raw_bytes[cur_pos:cur_pos + 4], byteorder='little')
-            cur_pos += 4
-            self.inputs.append(
-                Input(
-                    txid,
-                    vout,
-                    script_sig_size,
-                    script_sig,
-                    sequence))
+            start = cur_pos
+            script_sig_size, cur_pos = _read_compact_size(raw, cur_pos + 36)
+            cur_pos += script_sig_size + 4
+            inputs.append(Span(start, cur_pos - start))
 
-        self.output_count, cur_pos = self._get_compact_size(cur_pos)
+        output_section_start = cur_pos
+        self.output_count, cur_pos = _read_compact_size(raw, cur_pos)
+        output_count_size = cur_pos - output_section_start
 
-        self.outputs = []
+        outputs = []
         for _ in range(self.output_count):
-            value = int.from_bytes(
-                raw_bytes[cur_pos:cur_pos + 8], byteorder='little')
-            cur_pos += 8
-            script_pub_key_size, cur_pos = self._get_compact_size(cur_pos)
-            script_pub_key = raw_bytes[cur_pos:cur_pos + script_pub_key_size]
+            start = cur_pos
+            script_pub_key_size, cur_pos = _read_compact_size(
+                raw, cur_pos + 8)
             cur_pos += script_pub_key_size
-            self.outputs.append(
-                Output(
-                    value,
-                    script_pub_key_size,
-                    script_pub_key))
+            outputs.append(Span(start, cur_pos - start))
 
+        witness_section_start = cur_pos
+        witnesses = []
+        witness_items = []
+        max_witness_stack_size = 0
         if isinstance(self.flag, int):
-            self.witness = []
             for _ in range(self.input_count):
-                witness_stack = []
-                stack_items, cur_pos = self._get_compact_size(cur_pos)
-                for i in range(stack_items):
-                    item_size, cur_pos = self._get_compact_size(cur_pos)
-                    item = raw_bytes[cur_pos:cur_pos + item_size]
+                stack_start = cur_pos
+                stack_items, cur_pos = _read_compact_size(raw, cur_pos)
+                items = []
+                for _ in range(stack_items):
+                    item_start = cur_pos
+                    item_size, cur_pos = _read_compact_size(raw, cur_pos)
                     cur_pos += item_size
-                    witness_stack.append(WitnessStackItem(item_size, item))
-                self.witness.append(Witness(witness_stack))
-        else:
-            self.witness = None
+                    items.append(Span(item_start, cur_pos - item_start))
+                witnesses.append(Span(stack_start, cur_pos - stack_start))
+                witness_items.append(tuple(items))
+                max_witness_stack_size = max(
+                    max_witness_stack_size, stack_items)
 
         self.lock_time = int.from_bytes(
-            raw_bytes[cur_pos:cur_pos + 4], byteorder='little')
+            raw[cur_pos:cur_pos + 4], byteorder='little')
+        cur_pos += 4
 
-        # clear the cache
-        self._cache_raw_bytes = None
+        if cur_pos > len(raw):
+            raise ValueError("Transaction data is truncated")
+
+        self.layout = TxLayout(
+            size=cur_pos,
+            input_count_size=input_count_size,
+            input_size=output_section_start - input_section_start,
+            inputs=tuple(inputs),
+            output_count_size=output_count_size,
+            output_size=witness_section_start - output_section_start,
+            outputs=tuple(outputs),
+            witness_size=cur_pos - 4 - witness_section_start,
+            witnesses=tuple(witnesses),
+            witness_items=tuple(witness_items),
+            max_witness_stack_size=max_witness_stack_size,
+        )
+        self._raw_layout = self.layout
+        self._raw = raw = raw[:cur_pos]
+        self._script_sigs_cut = False
+
+        self.inputs = _LazySequence(raw, self.layout.inputs, _read_input)
+        self.outputs = _LazySequence(raw, self.layout.outputs, _read_output)
+        if isinstance(self.flag, int):
+            self.witness = _LazySequence(
+                raw, self.layout.witness_items, _read_witness)
+        else:
+            self.witness = None
 
     def _parse_from_json(self, data: Dict):
         """
@@ -162,7 +336,111 @@ class Transaction:
 
         self.lock_time = data['locktime']
 
+        self.layout = self._build_layout()
+
+    def _build_layout(self) -> TxLayout:
+        """
+        Computes the layout from the decoded fields
+        """
+        cur_pos = 4
+        if isinstance(self.marker, int):
+            cur_pos += 1
+        if isinstance(self.flag, int):
+            cur_pos += 1
+
+        input_section_start = cur_pos
+        input_count_size = _compact_size_size(self.input_count)
+        cur_pos += input_count_size
+        inputs = []
+        for _input in self.inputs:
+            size = self._get_input_size(_input)
+            inputs.append(Span(cur_pos, size))
+            cur_pos += size
+
+        output_section_start = cur_pos
+        output_count_size = _compact_size_size(self.output_count)
+        cur_pos += output_count_size
+        outputs = []
+        for output in self.outputs:
+            size = self._get_output_size(output)
+            outputs.append(Span(cur_pos, size))
+            cur_pos += size
+
+        witness_section_start = cur_pos
+        witnesses = []
+        witness_items = []
+        max_witness_stack_size = 0
+        if isinstance(self.flag, int):
+            for witness in self.witness:
+                stack_start = cur_pos
+                cur_pos += _compact_size_size(len(witness.stack_items))
+                items = []
+                for stack_item in witness.stack_items:
+                    size = _compact_size_size(
+                        stack_item.item_size) + len(stack_item.item)
+                    items.append(Span(cur_pos, size))
+                    cur_pos += size
+                witnesses.append(Span(stack_start, cur_pos - stack_start))
+                witness_items.append(tuple(items))
+                max_witness_stack_size = max(
+                    max_witness_stack_size, len(witness.stack_items))
+
+        return TxLayout(
+            size=cur_pos + 4,
+            input_count_size=input_count_size,
+            input_size=output_section_start - input_section_start,
+            inputs=tuple(inputs),
+            output_count_size=output_count_size,
+            output_size=witness_section_start - output_section_start,
+            outputs=tuple(outputs),
+            witness_size=cur_pos - witness_section_start,
+            witnesses=tuple(witnesses),
+            witness_items=tuple(witness_items),
+            max_witness_stack_size=max_witness_stack_size,
+        )
+
+    def _stripped_layout(self) -> TxLayout:
+        """
+        Derives the layout without script sigs from the raw layout, every
+        stripped input takes txid + vout + empty script sig + sequence bytes
+        """
+        layout = self._raw_layout
+        stripped_input_size = 32 + 4 + 1 + 4
+        first_input = 4 + layout.input_count_size
+        if isinstance(self.flag, int):
+            first_input += 2
+        input_size = layout.input_count_size + \
+            stripped_input_size * self.input_count
+        delta = input_size - layout.input_size
+
+        def shift(spans):
+            return tuple(Span(span.offset + delta, span.size)
+                         for span in spans)
+
+        return layout._replace(
+            size=layout.size + delta,
+            input_size=input_size,
+            inputs=tuple(
+                Span(first_input + stripped_input_size * i,
+                     stripped_input_size)
+                for i in range(self.input_count)),
+            outputs=shift(layout.outputs),
+            witnesses=shift(layout.witnesses),
+            witness_items=tuple(shift(items)
+                                for items in layout.witness_items),
+        )
+
     def cut_script_sigs(self):
+        self._txid = None
+        self._wtxid = None
+        if isinstance(self.inputs, _LazySequence):
+            # raw-backed transaction: switch to a stripped view of the inputs
+            self._script_sigs_cut = True
+            self.inputs = _LazySequence(
+                self._raw, self._raw_layout.inputs, _read_stripped_input)
+            self.layout = self._stripped_layout()
+            return
+
         for i in range(self.input_count):
             old_input = self.inputs[i]
             new_input = Input(
@@ -174,96 +452,120 @@ class Transaction:
             )
             self.inputs[i] = new_input
 
+        self.layout = self._build_layout()
+
+    @property
+    def txid(self) -> str:
+        """
+        Hash of the non-witness serialization in the usual (reversed) hex
+        form, computed once from the raw bytes
+        """
+        if self._txid is None:
+            buffer, layout = self._hashing_buffer()
+            h = hashlib.sha256()
+            if isinstance(self.flag, int):
+                witness_start = layout.size - 4 - layout.witness_size
+                h.update(buffer[:4])
+                h.update(buffer[6:witness_start])
+                h.update(buffer[layout.size - 4:layout.size])
+            else:
+                h.update(buffer[:layout.size])
+            self._txid = hashlib.sha256(h.digest()).digest()[::-1].hex()
+        return self._txid
+
+    @property
+    def wtxid(self) -> str:
+        """
+        Hash of the full serialization, equals txid for legacy transactions
+        """
+        if self._wtxid is None:
+            if isinstance(self.flag, int):
+                buffer, layout = self._hashing_buffer()
+                self._wtxid = hashlib.sha256(hashlib.sha256(
+                    buffer[:layout.size]).digest()).digest()[::-1].hex()
+            else:
+                self._wtxid = self.txid
+        return self._wtxid
+
+    def _hashing_buffer(self) -> Tuple[memoryview, TxLayout]:
+        if isinstance(self.inputs, _LazySequence) and \
+                not self._script_sigs_cut:
+            return self._raw, self._raw_layout
+        return memoryview(self._serialize()), self.layout
+
     def to_hex(self) -> str:
-        version_hex = self.version.to_bytes(4, byteorder='little').hex()
+        return self._serialize().hex()
 
-        if isinstance(self.marker, int):
-            marker_hex = self.marker.to_bytes(1, byteorder='little').hex()
-        else:
-            marker_hex = ""
+    def to_bytes(self) -> bytes:
+        return bytes(self._serialize())
 
-        if isinstance(self.flag, int):
-            flag_hex = self.flag.to_bytes(1, byteorder='little').hex()
-        else:
-            flag_hex = ""
+    def _serialize(self) -> bytearray:
+        buffer = bytearray(self._get_transaction_size())
+        self.write_into(buffer)
+        return buffer
 
-        input_count_hex = self._get_hex_from_compact_size(self.input_count)
+    def write_into(self, buffer, offset: int = 0) -> int:
+        """
+        buffer: writable buffer with at least _get_transaction_size() bytes
+            available after the offset
+        return: the position right after the serialized transaction
+        """
+        if isinstance(self.inputs, _LazySequence) and \
+                not self._script_sigs_cut:
+            end = offset + len(self._raw)
+            buffer[offset:end] = self._raw
+            return end
+
+        cur_pos = offset
+        struct.pack_into('<I', buffer, cur_pos, self.version)
+        cur_pos += 4
 
-        input_hex = "".join([self._get_input_hex(input)
-                            for input in self.inputs])
+        if isinstance(self.marker, int):
+            buffer[cur_pos] = self.marker
+            cur_pos += 1
 
-        output_count_hex = self._get_hex_from_compact_size(self.output_count)
+        if isinstance(self.flag, int):
+            buffer[cur_pos] = self.flag
+            cur_pos += 1
 
-        output_hex = "".join([self._get_output_hex(output)
-                             for output in self.outputs])
+        cur_pos = _write_compact_size(buffer, cur_pos, self.input_count)
+        for _input in self.inputs:
+            buffer[cur_pos:cur_pos + 32] = _input.txid
+            struct.pack_into('<I', buffer, cur_pos + 32, _input.vout)
+            cur_pos = _write_compact_size(
+                buffer, cur_pos + 36, _input.script_sig_size)
+            end = cur_pos + len(_input.script_sig)
+            buffer[cur_pos:end] = _input.script_sig
+            struct.pack_into('<I', buffer, end, _input.sequence)
+            cur_pos = end + 4
+
+        cur_pos = _write_compact_size(buffer, cur_pos, self.output_count)
+        for output in self.outputs:
+            struct.pack_into('<Q', buffer, cur_pos, output.value)
+            cur_pos = _write_compact_size(
+                buffer, cur_pos + 8, output.script_pub_key_size)
+            end = cur_pos + len(output.script_pub_key)
+            buffer[cur_pos:end] = output.script_pub_key
+            cur_pos = end
 
         if isinstance(self.flag, int):
-            witness_hex = "".join([self._get_witness_hex(witness)
-                                  for witness in self.witness])
-        else:
-            witness_hex = ""
-
-        lock_time_hex = self.lock_time.to_bytes(4, byteorder='little').hex()
-
-        return version_hex + marker_hex + flag_hex + input_count_hex + \
-            input_hex + output_count_hex + output_hex + witness_hex + lock_time_hex
-
-    def _get_input_hex(self, _input: Input) -> str:
-        txid_hex = _input.txid.hex()
-        vout_hex = _input.vout.to_bytes(4, byteorder='little').hex()
-        script_sig_size_hex = self._get_hex_from_compact_size(
-            _input.script_sig_size)
-        script_sig_hex = _input.script_sig.hex()
-        sequence_hex = _input.sequence.to_bytes(4, byteorder='little').hex()
-        return txid_hex + vout_hex + script_sig_size_hex + script_sig_hex + sequence_hex
-
-    def _get_output_hex(self, output: Output) -> str:
-        value_hex = output.value.to_bytes(8, byteorder='little').hex()
-        script_pub_key_size_hex = self._get_hex_from_compact_size(
-            output.script_pub_key_size)
-        script_pub_key_hex = output.script_pub_key.hex()
-        return value_hex + script_pub_key_size_hex + script_pub_key_hex
-
-    def _get_witness_hex(self, witness: Witness) -> str:
-        stack_size_hex = self._get_hex_from_compact_size(
-            len(witness.stack_items))
-        stack_items_hex = "".join([
-            self._get_hex_from_compact_size(
-                stack_item.item_size) + stack_item.item.hex()
-            for stack_item in witness.stack_items
-        ])
-        return stack_size_hex + stack_items_hex
+            for witness in self.witness:
+                cur_pos = _write_compact_size(
+                    buffer, cur_pos, len(witness.stack_items))
+                for stack_item in witness.stack_items:
+                    cur_pos = _write_compact_size(
+                        buffer, cur_pos, stack_item.item_size)
+                    end = cur_pos + len(stack_item.item)
+                    buffer[cur_pos:end] = stack_item.item
+                    cur_pos = end
+
+        struct.pack_into('<I', buffer, cur_pos, self.lock_time)
+        return cur_pos + 4
 
     def _get_hex_from_compact_size(self, int_val: int) -> str:
-        if int_val <= 0xfc:
-            return int_val.to_bytes(1, byteorder='little').hex()
-        elif int_val <= 0xffff:
-            return "fd" + int_val.to_bytes(2, byteorder='little').hex()
-        elif int_val <= 0xffffffff:
-            return "fe" + int_val.to_bytes(4, byteorder='little').hex()
-        elif int_val <= 0xffffffffffffffff:
-            return "ff" + int_val.to_bytes(8, byteorder='little').hex()
-        else:
-            raise ValueError("Invalid compact size value")
-
-    def _get_compact_size(self, cur_pos: int) -> Tuple[int, int]:
-        """
-        cur_pos: the position of the first byte of the compact size
-        return: (compact size, updated cur_pos)
-        """
-        if self._cache_raw_bytes[cur_pos] <= 0xfc:
-            return self._cache_raw_bytes[cur_pos], cur_pos + 1
-        elif self._cache_raw_bytes[cur_pos] == 0xfd:
-            return int.from_bytes(
-                self._cache_raw_bytes[cur_pos + 1:cur_pos + 3], byteorder='little'), cur_pos + 3
-        elif self._cache_raw_bytes[cur_pos] == 0xfe:
-            return int.from_bytes(
-                self._cache_raw_bytes[cur_pos + 1:cur_pos + 5], byteorder='little'), cur_pos + 5
-        elif self._cache_raw_bytes[cur_pos] == 0xff:
-            return int.from_bytes(
-                self._cache_raw_bytes[cur_pos + 1:cur_pos + 9], byteorder='little'), cur_pos + 9
-        else:
-            raise ValueError("Invalid compact size first byte")
+        buffer = bytearray(_compact_size_size(int_val))
+        _write_compact_size(buffer, 0, int_val)
+        return buffer.hex()
 
     def _get_input_size(self, _input: Input) -> int:
         return 32 + 4 + \
@@ -276,33 +578,25 @@ class Transaction:
                 output.script_pub_key_size) + len(output.script_pub_key)
 
     def _get_witness_size(self, witness: Witness) -> int:
-        return self._get_compact_size_size(len(witness.stack_items)) + sum([
+        return self._get_compact_size_size(len(witness.stack_items)) + sum(
             self._get_compact_size_size(
                 stack_item.item_size) + len(stack_item.item)
             for stack_item in witness.stack_items
-        ])
+        )
 
     def _get_compact_size_size(self, int_val: int) -> int:
-        return len(self._get_hex_from_compact_size(int_val)) // 2
+        return _compact_size_size(int_val)
 
     def _get_transaction_size(self) -> int:
-        input_count_len = self._get_compact_size_size(self.input_count)
-        input_size = sum(self._get_input_size(inp) for inp in self.inputs)
-        output_count_len = self._get_compact_size_size(self.output_count)
-        output_size = sum(self._get_output_size(out) for out in self.outputs)
-        if isinstance(self.flag, int):
-            witness_size = sum(self._get_witness_size(witness)
-                               for witness in self.witness)
-            marker_size = 1
-            flag_size = 1
-        else:
-            witness_size = 0
-            marker_size = 0
-            flag_size = 0
-        return 4 + marker_size + flag_size + input_count_len + \
-            input_size + output_count_len + output_size + witness_size + 4
+        return self.layout.size
 
     def witness_to_hex_script(self, input_to_sign, end_ignore=0) -> str:
+        return self.witness_to_script(input_to_sign, end_ignore).hex()
+
+    def witness_to_script(self, input_to_sign, end_ignore=0) -> bytearray:
+        """
+        Witness stack items of the input as a script of pushes
+        """
         res = bytearray()
 
         for i in range(
@@ -322,35 +616,18 @@ class Transaction:
 
             res.extend(item.item)
 
-        return res.hex()
+        return res
 
     def print_noir_template(self) -> str:
-        transaction_size = self._get_transaction_size()
-        input_count = self.input_count
-        input_count_len = self._get_compact_size_size(self.input_count)
-        input_size = sum(self._get_input_size(inp)
-                         for inp in self.inputs) + input_count_len
-        output_count = self.output_count
-        output_count_len = self._get_compact_size_size(self.output_count)
-        output_size = sum(self._get_output_size(out)
-                          for out in self.outputs) + output_count_len
-        if isinstance(self.flag, int):
-            max_witness_stack_size = max(
-                len(witness.stack_items) for witness in self.witness)
-            witness_size = sum(self._get_witness_size(witness)
-                               for witness in self.witness)
-        else:
-            max_witness_stack_size = 0
-            witness_size = 0
-
+        layout = self.layout
         return "Transaction::<{}, {}, {}, {}, {}, {}, {}, {}, {}>".format(
-            transaction_size,
-            input_count,
-            input_count_len,
-            input_size,
-            output_count,
-            output_count_len,
-            output_size,
-            max_witness_stack_size,
-            witness_size,
+            layout.size,
+            self.input_count,
+            layout.input_count_size,
+            layout.input_size,
+            self.output_count,
+            layout.output_count_size,
+            layout.output_size,
+            layout.max_witness_stack_size,
+            layout.witness_size,
         )
@@ -0,0 +1,181 @@
+from array import array
+from typing import Iterable, Iterator
+import struct
+
+from generators.utils.tx import Transaction, _compact_size_size, _write_compact_size
+
+
+class TxBatch:
+    """
+    Columnar store for many parsed transactions.
+
+    Scripts and witness items are appended to flat byte buffers, the
+    boundaries of every transaction, input, output and witness item are
+    kept in offset arrays (n + 1 entries each) and the fixed-width fields
+    in typed arrays, so a stored transaction costs a few machine words
+    instead of a tree of Python objects.
+    """
+
+    def __init__(self):
+        # per transaction
+        self.version = array('I')
+        self.lock_time = array('I')
+        # segwit flag byte, 0 for transactions without witness
+        self.flag = array('B')
+        self.input_offsets = array('Q', [0])
+        self.output_offsets = array('Q', [0])
+
+        # per input
+        self.txids = bytearray()
+        self.vout = array('I')
+        self.sequence = array('I')
+        self.script_sig_offsets = array('Q', [0])
+        self.witness_offsets = array('Q', [0])
+
+        # per output
+        self.value = array('Q')
+        self.script_pub_key_offsets = array('Q', [0])
+
+        # per witness item
+        self.witness_item_offsets = array('Q', [0])
+
+        self.script_sigs = bytearray()
+        self.script_pub_keys = bytearray()
+        self.witness_items = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.version)
+
+    def append(self, tx: Transaction):
+        self.version.append(tx.version)
+        self.lock_time.append(tx.lock_time)
+        self.flag.append(tx.flag if isinstance(tx.flag, int) else 0)
+
+        for idx, _input in enumerate(tx.inputs):
+            self.txids += _input.txid
+            self.vout.append(_input.vout)
+            self.sequence.append(_input.sequence)
+            self.script_sigs += _input.script_sig
+            self.script_sig_offsets.append(len(self.script_sigs))
+            if tx.witness is not None:
+                for stack_item in tx.witness[idx].stack_items:
+                    self.witness_items += stack_item.item
+                    self.witness_item_offsets.append(len(self.witness_items))
+            self.witness_offsets.append(len(self.witness_item_offsets) - 1)
+        self.input_offsets.append(len(self.vout))
+
+        for output in tx.outputs:
+            self.value.append(output.value)
+            self.script_pub_keys += output.script_pub_key
+            self.script_pub_key_offsets.append(len(self.script_pub_keys))
+        self.output_offsets.append(len(self.value))
+
+    def extend(self, txs: Iterable[Transaction]):
+        for tx in txs:
+            self.append(tx)
+
+    def input_count(self, idx: int) -> int:
+        return self.input_offsets[idx + 1] - self.input_offsets[idx]
+
+    def output_count(self, idx: int) -> int:
+        return self.output_offsets[idx + 1] - self.output_offsets[idx]
+
+    def __getitem__(self, idx: int) -> Transaction:
+        """
+        Rehydrates a single transaction from the columns
+        """
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("batch index out of range")
+        return Transaction(self.to_bytes(idx))
+
+    def __iter__(self) -> Iterator[Transaction]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def to_bytes(self, idx: int) -> bytearray:
+        """
+        Serializes the stored transaction without creating field objects
+        """
+        first_input = self.input_offsets[idx]
+        last_input = self.input_offsets[idx + 1]
+        first_output = self.output_offsets[idx]
+        last_output = self.output_offsets[idx + 1]
+        flag = self.flag[idx]
+
+        size = 4 + 4 + _compact_size_size(last_input - first_input) + \
+            _compact_size_size(last_output - first_output)
+        if flag:
+            size += 2
+        for i in range(first_input, last_input):
+            script_sig_size = self._span_size(self.script_sig_offsets, i)
+            size += 32 + 4 + \
+                _compact_size_size(script_sig_size) + script_sig_size + 4
+            if flag:
+                size += _compact_size_size(
+                    self._span_size(self.witness_offsets, i))
+                for j in range(
+                        self.witness_offsets[i], self.witness_offsets[i + 1]):
+                    item_size = self._span_size(self.witness_item_offsets, j)
+                    size += _compact_size_size(item_size) + item_size
+        for i in range(first_output, last_output):
+            script_pub_key_size = self._span_size(
+                self.script_pub_key_offsets, i)
+            size += 8 + _compact_size_size(script_pub_key_size) + \
+                script_pub_key_size
+
+        buffer = bytearray(size)
+        struct.pack_into('<I', buffer, 0, self.version[idx])
+        cur_pos = 4
+        if flag:
+            buffer[cur_pos + 1] = flag
+            cur_pos += 2
+
+        cur_pos = _write_compact_size(
+            buffer, cur_pos, last_input - first_input)
+        for i in range(first_input, last_input):
+            buffer[cur_pos:cur_pos + 32] = self.txids[i * 32:(i + 1) * 32]
+            struct.pack_into('<I', buffer, cur_pos + 32, self.vout[i])
+            cur_pos = self._write_span(
+                buffer, cur_pos + 36, self.script_sigs,
+                self.script_sig_offsets, i)
+            struct.pack_into('<I', buffer, cur_pos, self.sequence[i])
+            cur_pos += 4
+
+        cur_pos = _write_compact_size(
+            buffer, cur_pos, last_output - first_output)
+        for i in range(first_output, last_output):
+            struct.pack_into('<Q', buffer, cur_pos, self.value[i])
+            cur_pos = self._write_span(
+                buffer, cur_pos + 8, self.script_pub_keys,
+                self.script_pub_key_offsets, i)
+
+        if flag:
+            for i in range(first_input, last_input):
+                cur_pos = _write_compact_size(
+                    buffer, cur_pos, self._span_size(self.witness_offsets, i))
+                for j in range(
+                        self.witness_offsets[i], self.witness_offsets[i + 1]):
+                    cur_pos = self._write_span(
+                        buffer, cur_pos, self.witness_items,
+                        self.witness_item_offsets, j)
+
+        struct.pack_into('<I', buffer, cur_pos, self.lock_time[idx])
+        return buffer
+
+    @staticmethod
+    def _span_size(offsets: array, idx: int) -> int:
+        return offsets[idx + 1] - offsets[idx]
+
+    @staticmethod
+    def _write_span(buffer: bytearray, cur_pos: int, data: bytearray,
+                    offsets: array, idx: int) -> int:
+        """
+        Writes the compact size prefixed idx-th element of the flat buffer
+        """
+        start = offsets[idx]
+        end = offsets[idx + 1]
+        cur_pos = _write_compact_size(buffer, cur_pos, end - start)
+        buffer[cur_pos:cur_pos + end - start] = memoryview(data)[start:end]
+        return cur_pos + end - start
@@ -0,0 +1,185 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+import json
+import re
+import struct
+
+from generators.utils.tx import Transaction, _append_compact_size
+from generators.utils.tx_batch import TxBatch
+
+DEFAULT_CHUNK_LINES = 4096
+# a JSON string, brackets inside it do not nest
+JSON_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+def iter_json_records(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Decodes JSON-lines or concatenated JSON objects line by line.
+
+    A record spanning several lines is decoded once a line ending with a
+    closing bracket completes it, so only the record being decoded is kept
+    in memory. Closing brackets of nested arrays and objects cost one
+    failed decode each.
+    """
+    decoder = json.JSONDecoder()
+    pending = []
+    for line in lines:
+        if pending:
+            pending.append(line)
+            if line.rstrip()[-1:] not in ('}', ']'):
+                continue
+            text = "".join(pending)
+        else:
+            text = line
+
+        try:
+            records = _decode_all(decoder, text)
+        except json.JSONDecodeError:
+            if not pending:
+                pending = [line]
+            continue
+
+        pending = []
+        yield from records
+
+    if "".join(pending).strip():
+        raise ValueError("Truncated JSON record at the end of the stream")
+
+
+def _decode_all(decoder: json.JSONDecoder, text: str) -> List[Dict]:
+    records = []
+    cur_pos = 0
+    while True:
+        while cur_pos < len(text) and text[cur_pos].isspace():
+            cur_pos += 1
+        if cur_pos == len(text):
+            return records
+        record, cur_pos = decoder.raw_decode(text, cur_pos)
+        records.append(record)
+
+
+def record_to_bytes(record: Dict) -> bytearray:
+    """
+    Serializes a blockchain.com or Esplora JSON transaction, hex fields are
+    decoded straight into one buffer
+    """
+    if "vin" in record:
+        inputs = [(inp["txid"], inp["vout"], inp.get("scriptsig", ""),
+                   inp["sequence"], inp.get("witness") or [])
+                  for inp in record["vin"]]
+        outputs = [(out["value"], out["scriptpubkey"])
+                   for out in record["vout"]]
+    else:
+        inputs = [(inp["txid"], inp["output"], inp["sigscript"],
+                   inp["sequence"], inp.get("witness") or [])
+                  for inp in record["inputs"]]
+        outputs = [(out["value"], out["pkscript"])
+                   for out in record["outputs"]]
+
+    has_witness = any(inp[4] for inp in inputs)
+
+    buffer = bytearray(struct.pack('<I', record["version"]))
+    if has_witness:
+        buffer += b"\x00\x01"
+
+    _append_compact_size(buffer, len(inputs))
+    for txid, vout, script_sig, sequence, _ in inputs:
+        buffer += bytes.fromhex(txid)[::-1]
+        buffer += struct.pack('<I', vout)
+        _append_hex(buffer, script_sig)
+        buffer += struct.pack('<I', sequence)
+
+    _append_compact_size(buffer, len(outputs))
+    for value, script_pub_key in outputs:
+        buffer += struct.pack('<Q', value)
+        _append_hex(buffer, script_pub_key)
+
+    if has_witness:
+        for inp in inputs:
+            _append_compact_size(buffer, len(inp[4]))
+            for item in inp[4]:
+                _append_hex(buffer, item)
+
+    buffer += struct.pack('<I', record["locktime"])
+    return buffer
+
+
+def _append_hex(buffer: bytearray, hex_data: str):
+    _append_compact_size(buffer, len(hex_data) // 2)
+    buffer += bytes.fromhex(hex_data)
+
+
+def iter_transactions(path: str, workers: int = 0,
+                      chunk_lines: int = DEFAULT_CHUNK_LINES
+                      ) -> Iterator[Transaction]:
+    """
+    path: JSON-lines or concatenated JSON dump of transactions
+    workers: number of processes decoding the records, 0 decodes in the
+        current process
+    """
+    for raw in _iter_raw_transactions(path, workers, chunk_lines):
+        yield Transaction(raw)
+
+
+def load_batch(path: str, workers: int = 0,
+               chunk_lines: int = DEFAULT_CHUNK_LINES,
+               batch: Optional[TxBatch] = None) -> TxBatch:
+    """
+    Reads the whole dump into a columnar batch
+    """
+    batch = TxBatch() if batch is None else batch
+    batch.extend(iter_transactions(path, workers, chunk_lines))
+    return batch
+
+
+def _iter_raw_transactions(path: str, workers: int,
+                           chunk_lines: int) -> Iterator[bytearray]:
+    with open(path, "r") as file:
+        if workers <= 0:
+            for record in iter_json_records(file):
+                yield record_to_bytes(record)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # keep a bounded number of chunks in flight to hold the memory
+            # usage constant
+            in_flight = deque()
+            for chunk in _iter_line_chunks(file, chunk_lines):
+                in_flight.append(executor.submit(_decode_chunk, chunk))
+                if len(in_flight) >= 2 * workers:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+
+def _iter_line_chunks(file: TextIO, chunk_lines: int) -> Iterator[List[str]]:
+    """
+    Splits the dump into chunks of lines that end on a record boundary,
+    where the bracket depth is back to zero, whatever the indentation
+    """
+    chunk = []
+    depth = 0
+    for line in file:
+        chunk.append(line)
+        depth += _nesting(line)
+        if depth == 0 and len(chunk) >= chunk_lines:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _nesting(line: str) -> int:
+    """
+    Change of the bracket depth over a line, a JSON string never spans
+    lines
+    """
+    if '"' in line:
+        line = JSON_STRING.sub("", line)
+    return line.count("{") + line.count("[") - \
+        line.count("}") - line.count("]")
+
+
+def _decode_chunk(lines: List[str]) -> List[bytearray]:
+    return [record_to_bytes(record) for record in iter_json_records(lines)]
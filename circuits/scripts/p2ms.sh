@@ -11,19 +11,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2ms.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2ms
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2ms
-bb prove -b ./target/p2ms.json -w ./target/p2ms.gz -o ./target/p2ms
+python3 -m generators.cost.main record --package p2ms -- \
+    bb prove -b ./target/p2ms.json -w ./target/p2ms.gz -o ./target/p2ms
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2ms; then
+    bb write_vk -b ./target/p2ms.json -o ./target/p2ms
+    python3 -m generators.utils.sources stamp --package p2ms
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2ms.json -o ./target/p2ms
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2ms
 
 # Verify the proof
 bb verify -k ./target/p2ms/vk -p ./target/p2ms/proof -i ./target/p2ms/public_inputs
\ No newline at end of file
@@ -11,19 +11,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2pk.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2pk
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2pk
-bb prove -b ./target/p2pk.json -w ./target/p2pk.gz -o ./target/p2pk
+python3 -m generators.cost.main record --package p2pk -- \
+    bb prove -b ./target/p2pk.json -w ./target/p2pk.gz -o ./target/p2pk
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2pk; then
+    bb write_vk -b ./target/p2pk.json -o ./target/p2pk
+    python3 -m generators.utils.sources stamp --package p2pk
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2pk.json -o ./target/p2pk
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2pk
 
 # Verify the proof
 bb verify -k ./target/p2pk/vk -p ./target/p2pk/proof -i ./target/p2pk/public_inputs
\ No newline at end of file
@@ -11,19 +11,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2pkh.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2pkh
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2pkh
-bb prove -b ./target/p2pkh.json -w ./target/p2pkh.gz -o ./target/p2pkh
+python3 -m generators.cost.main record --package p2pkh -- \
+    bb prove -b ./target/p2pkh.json -w ./target/p2pkh.gz -o ./target/p2pkh
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2pkh; then
+    bb write_vk -b ./target/p2pkh.json -o ./target/p2pkh
+    python3 -m generators.utils.sources stamp --package p2pkh
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2pkh.json -o ./target/p2pkh
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2pkh
 
 # Verify the proof
 bb verify -k ./target/p2pkh/vk -p ./target/p2pkh/proof -i ./target/p2pkh/public_inputs
\ No newline at end of file
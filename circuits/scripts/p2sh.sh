@@ -11,19 +11,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2sh.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2sh
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2sh
-bb prove -b ./target/p2sh.json -w ./target/p2sh.gz -o ./target/p2sh
+python3 -m generators.cost.main record --package p2sh -- \
+    bb prove -b ./target/p2sh.json -w ./target/p2sh.gz -o ./target/p2sh
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2sh; then
+    bb write_vk -b ./target/p2sh.json -o ./target/p2sh
+    python3 -m generators.utils.sources stamp --package p2sh
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2sh.json -o ./target/p2sh
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2sh
 
 # Verify the proof
 bb verify -k ./target/p2sh/vk -p ./target/p2sh/proof -i ./target/p2sh/public_inputs
\ No newline at end of file
@@ -11,19 +11,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2sh_p2wpkh.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2sh_p2wpkh
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2sh_p2wpkh
-bb prove -b ./target/p2sh_p2wpkh.json -w ./target/p2sh_p2wpkh.gz -o ./target/p2sh_p2wpkh
+python3 -m generators.cost.main record --package p2sh_p2wpkh -- \
+    bb prove -b ./target/p2sh_p2wpkh.json -w ./target/p2sh_p2wpkh.gz -o ./target/p2sh_p2wpkh
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2sh_p2wpkh; then
+    bb write_vk -b ./target/p2sh_p2wpkh.json -o ./target/p2sh_p2wpkh
+    python3 -m generators.utils.sources stamp --package p2sh_p2wpkh
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2sh_p2wpkh.json -o ./target/p2sh_p2wpkh
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2sh_p2wpkh
 
 # Verify the proof
 bb verify -k ./target/p2sh_p2wpkh/vk -p ./target/p2sh_p2wpkh/proof -i ./target/p2sh_p2wpkh/public_inputs
\ No newline at end of file
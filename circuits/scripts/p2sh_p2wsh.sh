@@ -11,19 +11,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2sh_p2wsh.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2sh_p2wsh
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2sh_p2wsh
-bb prove -b ./target/p2sh_p2wsh.json -w ./target/p2sh_p2wsh.gz -o ./target/p2sh_p2wsh
+python3 -m generators.cost.main record --package p2sh_p2wsh -- \
+    bb prove -b ./target/p2sh_p2wsh.json -w ./target/p2sh_p2wsh.gz -o ./target/p2sh_p2wsh
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2sh_p2wsh; then
+    bb write_vk -b ./target/p2sh_p2wsh.json -o ./target/p2sh_p2wsh
+    python3 -m generators.utils.sources stamp --package p2sh_p2wsh
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2sh_p2wsh.json -o ./target/p2sh_p2wsh
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2sh_p2wsh
 
 # Verify the proof
 bb verify -k ./target/p2sh_p2wsh/vk -p ./target/p2sh_p2wsh/proof -i ./target/p2sh_p2wsh/public_inputs
\ No newline at end of file
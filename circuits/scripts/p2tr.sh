@@ -16,19 +16,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2tr.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2tr
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2tr
-bb prove -b ./target/p2tr.json -w ./target/p2tr.gz -o ./target/p2tr
+python3 -m generators.cost.main record --package p2tr -- \
+    bb prove -b ./target/p2tr.json -w ./target/p2tr.gz -o ./target/p2tr
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2tr; then
+    bb write_vk -b ./target/p2tr.json -o ./target/p2tr
+    python3 -m generators.utils.sources stamp --package p2tr
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2tr.json -o ./target/p2tr
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2tr
 
 # Verify the proof
 bb verify -k ./target/p2tr/vk -p ./target/p2tr/proof -i ./target/p2tr/public_inputs
\ No newline at end of file
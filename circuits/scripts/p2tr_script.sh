@@ -16,19 +16,23 @@ fi
 # Generate Prover.toml
 python3 -m generators.p2tr_script.main
 
-# Format noir code
-nargo fmt
-
-# Execute the binary
+# Execute the binary, nargo reuses a restored circuit of the same sources
 nargo execute --package p2tr_script
 
-# Prove the proof
+# Prove the proof, recording its time, memory and gate count
 mkdir -p target
 mkdir -p target/p2tr_script
-bb prove -b ./target/p2tr_script.json -w ./target/p2tr_script.gz -o ./target/p2tr_script
+python3 -m generators.cost.main record --package p2tr_script -- \
+    bb prove -b ./target/p2tr_script.json -w ./target/p2tr_script.gz -o ./target/p2tr_script
+
+# Write the VK, unless the circuit sources are the ones of the last VK
+if ! python3 -m generators.utils.sources check --package p2tr_script; then
+    bb write_vk -b ./target/p2tr_script.json -o ./target/p2tr_script
+    python3 -m generators.utils.sources stamp --package p2tr_script
+fi
 
-# Write the VK
-bb write_vk -b ./target/p2tr_script.json -o ./target/p2tr_script
+# Store the compiled circuit and VK for later jobs with the same sources
+python3 -m generators.utils.artifacts save --package p2tr_script
 
 # Verify the proof
 bb verify -k ./target/p2tr_script/vk -p ./target/p2tr_script/proof -i ./target/p2tr_script/public_inputs
\ No newline at end of file